@@ -122,6 +122,7 @@ def init(site, sites_path=None, new_site=False):
 		"new_site": new_site
 	})
 	local.rollback_observers = []
+	local.after_commit = []
 	local.test_objects = {}
 
 	local.site = site
@@ -149,6 +150,8 @@ def init(site, sites_path=None, new_site=False):
 	local.link_count = {}
 
 	local.jenv = None
+	local.query_profiler = None
+	local.sampler = None
 	local.jloader =None
 	local.cache = {}
 	local.meta_cache = {}
@@ -194,6 +197,16 @@ def get_site_config(sites_path=None, site_path=None):
 
 	return _dict(config)
 
+def get_common_site_config(sites_path=None):
+	"""Returns `sites/common_site_config.json`, settings shared by all sites of the bench,
+	for settings of the process that must not depend on the site served first."""
+	sites_path = sites_path or getattr(local, "sites_path", None) or "."
+	common_site_config = os.path.join(sites_path, "common_site_config.json")
+	if os.path.exists(common_site_config):
+		return _dict(get_file_json(common_site_config))
+
+	return _dict()
+
 def get_conf(site=None):
 	if hasattr(local, 'conf'):
 		return local.conf
@@ -481,6 +494,7 @@ def clear_cache(user=None, doctype=None):
 	:param user: If user is given, only user cache is cleared.
 	:param doctype: If doctype is given, only DocType cache is cleared."""
 	import frappe.sessions
+	import frappe.share
 	from frappe.core.doctype.domain_settings.domain_settings import clear_domain_cache
 	if doctype:
 		import frappe.model.meta
@@ -488,13 +502,16 @@ def clear_cache(user=None, doctype=None):
 		reset_metadata_version()
 	elif user:
 		frappe.sessions.clear_cache(user)
+		frappe.share.clear_share_cache(user=user)
 	else: # everything
 		from frappe import translate
 		frappe.sessions.clear_cache()
+		frappe.share.clear_share_cache()
 		translate.clear_cache()
 		reset_metadata_version()
 		clear_domain_cache()
 		local.cache = {}
+		cache().clear_process_cache()
 		local.new_doc_templates = {}
 
 		for fn in get_hooks("clear_cache"):
@@ -621,6 +638,21 @@ def get_doc(*args, **kwargs):
 	import frappe.model.document
 	return frappe.model.document.get_doc(*args, **kwargs)
 
+def get_docs(doctype, names):
+	"""Return a list of `frappe.model.document.Document` objects of the given type and names.
+	Parents are loaded with one query and child tables with one query per child DocType.
+
+	:param doctype: DocType name as string.
+	:param names: List of document names.
+
+	Example:
+
+		todos = frappe.get_docs("ToDo", ["TD0001", "TD0002"])
+
+	"""
+	import frappe.model.document
+	return frappe.model.document.get_docs(doctype, names)
+
 def get_last_doc(doctype):
 	"""Get last created document of this type."""
 	d = get_all(doctype, ["name"], order_by="creation desc", limit_page_length=1)
@@ -24,6 +24,7 @@ def handle():
 		- `?filters=[["Task", "name", "like", "%005"]]`
 		- `?limit_start=0`
 		- `?limit_page_length=20`
+		- `?after=` (page by cursor, the next page is at `?after={next_cursor}`)
 
 	`/api/resource/{doctype}/{name}` will point to a resource
 		`GET` will return doclist
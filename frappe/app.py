@@ -20,6 +20,8 @@ import frappe.auth
 import frappe.api
 import frappe.async
 import frappe.utils.response
+import frappe.utils.query_profiler
+import frappe.utils.sampling_profiler
 import frappe.website.render
 from frappe.utils import get_site_name
 from frappe.middlewares import StaticDataMiddleware
@@ -41,6 +43,7 @@ class RequestContext(object):
 		init_request(self.request)
 
 	def __exit__(self, type, value, traceback):
+		frappe.utils.sampling_profiler.stop()
 		frappe.destroy()
 
 
@@ -93,6 +96,9 @@ def application(request):
 		if response and hasattr(frappe.local, 'cookie_manager'):
 			frappe.local.cookie_manager.flush_cookies(response=response)
 
+		frappe.utils.sampling_profiler.stop()
+		frappe.utils.query_profiler.stop(response)
+
 		frappe.destroy()
 
 	return response
@@ -113,8 +119,12 @@ def init_request(request):
 
 	make_form_dict(request)
 
+	frappe.utils.query_profiler.start()
+
 	frappe.local.http_request = frappe.auth.HTTPRequest()
 
+	frappe.utils.sampling_profiler.start()
+
 def make_form_dict(request):
 	frappe.local.form_dict = frappe._dict({ k:v[0] if isinstance(v, (list, tuple)) else v \
 		for k, v in iteritems(request.form or request.args) })
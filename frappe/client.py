@@ -18,7 +18,7 @@ Requests via FrappeClient are also handled here.
 
 @frappe.whitelist()
 def get_list(doctype, fields=None, filters=None, order_by=None,
-	limit_start=None, limit_page_length=20):
+	limit_start=None, limit_page_length=20, after=None):
 	'''Returns a list of records by filters, fields, ordering and limit
 
 	:param doctype: DocType of the data to be queried
@@ -26,9 +26,20 @@ def get_list(doctype, fields=None, filters=None, order_by=None,
 	:param filters: filter list by this dict
 	:param order_by: Order by this fieldname
 	:param limit_start: Start at this index
-	:param limit_page_length: Number of records to be returned (default 20)'''
-	return frappe.get_list(doctype, fields=fields, filters=filters, order_by=order_by,
-		limit_start=limit_start, limit_page_length=limit_page_length, ignore_permissions=False)
+	:param limit_page_length: Number of records to be returned (default 20)
+	:param after: Cursor to page by instead of `limit_start` (`""` for the first page).
+		The cursor for the next page is returned as `next_cursor` in the response.'''
+	if after is None:
+		return frappe.get_list(doctype, fields=fields, filters=filters, order_by=order_by,
+			limit_start=limit_start, limit_page_length=limit_page_length, ignore_permissions=False)
+
+	from frappe.model.db_query import DatabaseQuery
+	query = DatabaseQuery(doctype)
+	data = query.execute(fields=fields, filters=filters, order_by=order_by,
+		limit_page_length=limit_page_length, ignore_permissions=False, after=after)
+
+	frappe.local.response["next_cursor"] = query.next_cursor
+	return data
 
 @frappe.whitelist()
 def get(doctype, name=None, filters=None):
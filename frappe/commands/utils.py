@@ -504,8 +504,244 @@ def rebuild_global_search(context):
 		finally:
 			frappe.destroy()
 
+@click.command('benchmark-meta-cache')
+@click.option('--limit', default=50, help='Number of DocTypes with the most fields to benchmark')
+@click.option('--repeat', default=20, help='Number of loads per DocType')
+@pass_context
+def benchmark_meta_cache(context, limit=50, repeat=20):
+	"Compare payload size and load time of cached DocType meta for each serialization format"
+	import timeit
+	from six.moves import cPickle as pickle
+	from frappe.model.meta import Meta
+
+	formats = (
+		("object", {"meta_cache_format": "object"}),
+		("snapshot", {"meta_cache_format": None, "meta_cache_compress_threshold": None}),
+		("snapshot+zlib", {"meta_cache_format": None, "meta_cache_compress_threshold": 1}),
+	)
+
+	for site in context.sites:
+		try:
+			frappe.init(site=site)
+			frappe.connect()
+			conf = dict(frappe.local.conf)
+
+			doctypes = frappe.db.sql_list("""select parent from tabDocField
+				group by parent order by count(*) desc limit %s""", limit)
+			metas = [Meta(doctype) for doctype in doctypes]
+
+			print("{0}: {1} DocTypes, {2} loads each".format(site, len(metas), repeat))
+			for name, settings in formats:
+				frappe.local.conf.update(settings)
+				payloads = [pickle.dumps(meta, pickle.HIGHEST_PROTOCOL) for meta in metas]
+				load_time = min(timeit.repeat(lambda: [pickle.loads(p) for p in payloads],
+					number=repeat, repeat=3)) / repeat
+
+				print("{0:<15} total size: {1:>10} bytes, load all: {2:>8.2f} ms".format(name,
+					sum(len(p) for p in payloads), load_time * 1000))
+
+			frappe.local.conf = frappe._dict(conf)
+
+		finally:
+			frappe.destroy()
+
+@click.command('benchmark-permission-query')
+@click.argument('doctype')
+@click.option('--user', help='User whose shares and user permissions are applied')
+@click.option('--repeat', default=20, help='Number of list queries per run')
+@pass_context
+def benchmark_permission_query(context, doctype, user=None, repeat=20):
+	"Compare list view query time with inline and subquery share / user permission conditions"
+	import timeit
+	import frappe.share, frappe.permissions
+
+	for site in context.sites:
+		try:
+			frappe.init(site=site)
+			frappe.connect()
+			frappe.set_user(user or "Administrator")
+
+			user_permissions = frappe.permissions.get_user_permissions(frappe.session.user)
+			print("{0}: {1} shared {2}, {3} user permissions".format(site,
+				len(frappe.share.get_shared(doctype)), doctype,
+				sum(len(values) for values in user_permissions.values())))
+
+			for name, threshold in (("inline", 10 ** 9), ("subquery", 0)):
+				frappe.local.conf.permission_subquery_threshold = threshold
+				query_time = min(timeit.repeat(lambda: frappe.get_list(doctype, limit_page_length=20),
+					number=repeat, repeat=3)) / repeat
+
+				print("{0:<10} list query: {1:>8.2f} ms".format(name, query_time * 1000))
+
+		finally:
+			frappe.destroy()
+
+@click.command('benchmark-row-conversion')
+@click.option('--rows', default='10000,100000', help='Comma separated result sizes')
+@click.option('--columns', default=20, help='Columns per row')
+def benchmark_row_conversion(rows='10000,100000', columns=20):
+	"Time conversion of query results to dicts, lists and named tuples"
+	import datetime, timeit
+	from frappe.database import rows_to_dicts, rows_to_namedtuples, encode_rows
+
+	fieldnames = ['field_{0}'.format(i) for i in range(columns)]
+	values = ['value', 100, 2.5, datetime.date.today(), None]
+
+	def per_cell(result):
+		# conversion as done before `rows_to_dicts`, as the baseline
+		ret = []
+		for r in result:
+			row_dict = frappe._dict({})
+			for i in range(len(r)):
+				row_dict[fieldnames[i]] = r[i]
+			ret.append(row_dict)
+		return ret
+
+	for count in [int(c) for c in rows.split(',')]:
+		result = [tuple(values[(i + j) % len(values)] for j in range(columns)) for i in range(count)]
+
+		print("{0} rows x {1} columns".format(count, columns))
+		for name, convert in (("per cell dict (baseline)", per_cell),
+			("dict", lambda r: rows_to_dicts(r, fieldnames)),
+			("namedtuple", lambda r: rows_to_namedtuples(r, fieldnames)),
+			("list, utf-8", encode_rows)):
+			elapsed = min(timeit.repeat(lambda: convert(result), number=1, repeat=3))
+			print("  {0:<26} {1:>8.1f} ms".format(name, elapsed * 1000))
+
+@click.command('query-report')
+@click.option('--hours', default=1, help='Report queries of the last n hours (max 24)')
+@click.option('--sort-by', default='time', type=click.Choice(['time', 'count', 'duplicates']))
+@click.option('--limit', default=20, help='Number of queries to show')
+@pass_context
+def query_report(context, hours=1, sort_by='time', limit=20):
+	"Show the queries with the most time, executions or duplicates recorded by the query profiler"
+	from frappe.utils.query_profiler import get_report
+
+	for site in context.sites:
+		try:
+			frappe.init(site=site)
+			report = get_report(hours, sort_by, limit)
+
+			print("{0}: {1:.0f} requests, {2:.0f} queries, {3:.2f} s in queries".format(site,
+				report.requests, report.queries, report.time))
+
+			for d in report.top:
+				print("\n{0:>8.0f} times {1:>10.2f} ms {2:>8.2f} ms avg {3:>6.0f} duplicates  {4}".format(
+					d.count, d.time * 1000, d.time * 1000 / (d.count or 1), d.duplicates, d.call_site or ""))
+				print("  " + (d.query or "")[:500])
+		finally:
+			frappe.destroy()
+
+@click.command('sampling-profile')
+@click.option('--route', help='cmd or path of the requests, all if not set')
+@click.option('--output', help='Write collapsed stacks to this file')
+@click.option('--clear', is_flag=True, default=False, help='Delete collected samples')
+@pass_context
+def sampling_profile(context, route=None, output=None, clear=False):
+	"List routes sampled by the sampling profiler or write their collapsed stacks (for flame graphs)"
+	import frappe.utils.sampling_profiler
+
+	for site in context.sites:
+		try:
+			frappe.init(site=site)
+			if clear:
+				frappe.utils.sampling_profiler.clear()
+				continue
+
+			if not (route or output):
+				routes = frappe.utils.sampling_profiler.get_routes()
+				for r in sorted(routes, key=routes.get, reverse=True):
+					print("{0:>10.0f}  {1}".format(routes[r], r))
+				continue
+
+			lines = frappe.utils.sampling_profiler.get_collapsed_stacks(route)
+			if output:
+				with open(output, "w") as f:
+					f.write("\n".join(lines) + "\n")
+			else:
+				print("\n".join(lines))
+		finally:
+			frappe.destroy()
+
+@click.command('warmup-templates')
+@click.option('--verbose', is_flag=True, default=False, help='Show compile time of each template')
+@pass_context
+def warmup_templates(context, verbose=False):
+	"Compile Jinja templates of installed apps and Print Formats into the bytecode cache"
+	import frappe.utils.jinja
+
+	for site in context.sites:
+		try:
+			frappe.init(site=site)
+			frappe.connect()
+			frappe.utils.jinja.clear_template_metrics()
+
+			count, errors = frappe.utils.jinja.warmup_templates()
+			metrics = frappe.utils.jinja.get_template_metrics()
+
+			if verbose:
+				for name in sorted(metrics.templates, key=lambda n: metrics.templates[n].compile_time, reverse=True):
+					print("{0:>10.2f} ms  {1}".format(metrics.templates[name].compile_time, name))
+
+			print("{0}: loaded {1} templates, compiled {2} not found in the bytecode cache in {3} ms".format(
+				site, count, metrics.compile, metrics.compile_time))
+			for name, error in errors:
+				print("Could not compile {0}: {1}".format(name, error))
+		finally:
+			frappe.destroy()
+
+@click.command('benchmark-pdf')
+@click.option('--doctype', default='Sales Invoice', help='DocType of the documents to print')
+@click.option('--print-format', help='Print Format, default if not set')
+@click.option('--counts', default='1,50,500', help='Comma separated number of documents per batch')
+@click.option('--workers', default=4, help='Number of concurrent renderers of the pool')
+@pass_context
+def benchmark_pdf(context, doctype='Sales Invoice', print_format=None, counts='1,50,500', workers=4):
+	"Compare rendering documents one by one with the pdf pool, for batches of documents"
+	import time
+	from PyPDF2 import PdfFileWriter
+	from frappe.utils.pdf import get_pdf, get_pdfs, read_pdf
+
+	for site in context.sites:
+		try:
+			frappe.init(site=site)
+			frappe.connect()
+			frappe.set_user("Administrator")
+			frappe.local.conf.pdf_render_workers = workers
+
+			counts = [int(c) for c in counts.split(",")]
+			names = [d.name for d in frappe.get_all(doctype, limit_page_length=max(counts),
+				order_by="modified desc")]
+			if not names:
+				print("No {0} found in {1}".format(doctype, site))
+				continue
+
+			for count in counts:
+				# repeat documents if there are fewer than count
+				htmls = [frappe.get_print(doctype, names[i % len(names)], print_format) for i in range(count)]
+
+				start = time.time()
+				output = PdfFileWriter()
+				for html in htmls:
+					get_pdf(html, output=output)
+				serial_size = len(read_pdf(output))
+				serial = time.time() - start
+
+				start = time.time()
+				pool_size = len(get_pdfs(htmls))
+				pooled = time.time() - start
+
+				print("{0:>5} documents: one by one {1:>8.2f}s ({2} bytes), pool {3:>8.2f}s ({4} bytes)".format(
+					count, serial, serial_size, pooled, pool_size))
+		finally:
+			frappe.destroy()
+
 
 commands = [
+	benchmark_meta_cache,
+	benchmark_pdf,
+	benchmark_permission_query,
+	benchmark_row_conversion,
 	build,
 	clear_cache,
 	clear_website_cache,
@@ -521,13 +757,16 @@ commands = [
 	import_doc,
 	make_app,
 	mysql,
+	query_report,
 	request,
 	reset_perms,
 	run_tests,
 	run_ui_tests,
 	run_setup_wizard_ui_test,
+	sampling_profile,
 	serve,
 	set_config,
+	warmup_templates,
 	watch,
 	_bulk_rename,
 	add_to_email_queue,
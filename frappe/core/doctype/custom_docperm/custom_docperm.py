@@ -5,6 +5,11 @@
 from __future__ import unicode_literals
 import frappe
 from frappe.model.document import Document
+from frappe.permissions import clear_role_permissions_cache
 
 class CustomDocPerm(Document):
-	pass
+	def on_update(self):
+		clear_role_permissions_cache(self.parent)
+
+	def on_trash(self):
+		clear_role_permissions_cache(self.parent)
@@ -6,6 +6,7 @@ import frappe
 from frappe.model.document import Document
 from frappe import _
 from frappe.utils import get_fullname
+from frappe.share import update_share_sets
 
 exclude_from_linked_with = True
 
@@ -39,6 +40,9 @@ class DocShare(Document):
 
 			frappe.throw(_('You need to have "Share" permission'), frappe.PermissionError)
 
+	def on_update(self):
+		frappe.db.after_commit(update_share_sets, self)
+
 	def after_insert(self):
 		doc = self.get_doc()
 		owner = get_fullname(self.owner)
@@ -55,6 +59,8 @@ class DocShare(Document):
 		self.get_doc().add_comment("Unshared",
 			_("{0} un-shared this document with {1}").format(get_fullname(self.owner), get_fullname(self.user)))
 
+		frappe.db.after_commit(update_share_sets, self, True)
+
 def on_doctype_update():
 	"""Add index in `tabDocShare` for `(user, share_doctype)`"""
 	frappe.db.add_index("DocShare", ["user", "share_doctype"])
@@ -90,3 +90,75 @@ class TestDocShare(unittest.TestCase):
 		self.assertTrue(self.event.name not in frappe.share.get_shared("Event", self.user))
 		self.assertTrue(self.event.name not in frappe.share.get_shared("Event", "test1@example.com"))
 		self.assertTrue(self.event.name not in frappe.share.get_shared("Event", "Guest"))
+
+	def test_share_condition_subquery(self):
+		from frappe.model.db_query import DatabaseQuery
+		frappe.share.add("Event", self.event.name, self.user)
+		frappe.set_user(self.user)
+
+		names = [d.name for d in frappe.get_list("Event", limit_page_length=None)]
+		self.assertTrue(self.event.name in names)
+
+		frappe.local.conf.permission_subquery_threshold = 0
+		try:
+			query = DatabaseQuery("Event")
+			query.build_match_conditions()
+			self.assertTrue("tabDocShare" in query.get_share_condition())
+
+			names = [d.name for d in frappe.get_list("Event", limit_page_length=None)]
+			self.assertTrue(self.event.name in names)
+		finally:
+			del frappe.local.conf["permission_subquery_threshold"]
+
+	def test_shared_set_cache(self):
+		frappe.share.clear_share_cache(user=self.user)
+		self.assertFalse(frappe.share.is_shared("Event", self.event.name, self.user))
+		count = frappe.share.get_shared_count("Event", self.user)
+
+		# read from the database until commit
+		frappe.share.add("Event", self.event.name, self.user, write=1)
+		self.assertTrue(frappe.share.has_pending_changes())
+		self.assertTrue(frappe.share.is_shared("Event", self.event.name, self.user))
+
+		# cached sets are updated after commit of share and unshare
+		frappe.db.run_after_commit()
+		self.assertFalse(frappe.share.has_pending_changes())
+		self.assertTrue(frappe.share.is_shared("Event", self.event.name, self.user))
+		self.assertTrue(frappe.share.is_shared("Event", self.event.name, self.user, "write"))
+		self.assertFalse(frappe.share.is_shared("Event", self.event.name, self.user, "share"))
+		self.assertEquals(frappe.share.get_shared_count("Event", self.user), count + 1)
+
+		frappe.share.remove("Event", self.event.name, self.user)
+		frappe.db.run_after_commit()
+		self.assertFalse(frappe.share.is_shared("Event", self.event.name, self.user))
+		self.assertTrue(self.event.name not in frappe.share.get_shared("Event", self.user, ["write"]))
+		self.assertEquals(frappe.share.get_shared_count("Event", self.user), count)
+
+	def test_shared_with_all_rights(self):
+		# share for the user and write for everyone are not one share with both rights
+		frappe.share.add("Event", self.event.name, self.user, share=1)
+		frappe.share.set_permission("Event", self.event.name, None, "write", everyone=1)
+		frappe.db.run_after_commit()
+
+		self.assertTrue(self.event.name in frappe.share.get_shared("Event", self.user, ["write"]))
+		self.assertTrue(self.event.name in frappe.share.get_shared("Event", self.user, ["share"]))
+		self.assertTrue(self.event.name not in frappe.share.get_shared("Event", self.user,
+			["write", "share"]))
+
+		frappe.share.set_permission("Event", self.event.name, None, "share", everyone=1)
+		self.assertTrue(self.event.name in frappe.share.get_shared("Event", self.user,
+			["write", "share"]))
+
+	def test_share_after_clear_cache(self):
+		frappe.share.clear_share_cache()
+		count = frappe.share.get_shared_count("Event", self.user)
+
+		frappe.share.clear_share_cache()
+		frappe.share.add("Event", self.event.name, self.user)
+		frappe.db.run_after_commit()
+		self.assertEquals(frappe.share.get_shared_count("Event", self.user), count + 1)
+		self.assertTrue(frappe.share.is_shared("Event", self.event.name, self.user))
+
+		frappe.set_user(self.user)
+		names = [d.name for d in frappe.get_list("Event", limit_page_length=None)]
+		self.assertTrue(self.event.name in names)
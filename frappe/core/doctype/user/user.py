@@ -313,6 +313,7 @@ class User(Document):
 
 		# delete shares
 		frappe.db.sql("""delete from `tabDocShare` where user=%s""", self.name)
+		frappe.share.clear_share_cache(user=self.name)
 
 		# delete messages
 		frappe.db.sql("""delete from `tabCommunication`
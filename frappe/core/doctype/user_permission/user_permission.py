@@ -77,4 +77,8 @@ def get_user_permissions(user=None):
 				# called from patch
 				pass
 
-	return out
\ No newline at end of file
+	return out
+
+def on_doctype_update():
+	"""Add index in `tabUser Permission` for `(user, allow)`"""
+	frappe.db.add_index("User Permission", ["user", "allow"])
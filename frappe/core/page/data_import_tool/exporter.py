@@ -214,8 +214,10 @@ def get_template(doctype=None, parent_doctype=None, all_doctypes="No", with_data
 			if 'lft' in table_columns and 'rgt' in table_columns:
 				order_by = '`tab{doctype}`.`lft` asc'.format(doctype=parent_doctype)
 
-			# get permitted data only
-			data = frappe.get_list(doctype, fields=["*"], limit_page_length=None, order_by=order_by)
+			# get permitted data only, read with an unbuffered cursor unless
+			# child rows have to be queried for each record
+			data = frappe.get_list(doctype, fields=["*"], limit_page_length=None, order_by=order_by,
+				iterate=not all_doctypes)
 
 			for doc in data:
 				op = docs_to_export.get("op")
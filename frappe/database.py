@@ -6,23 +6,187 @@
 
 from __future__ import unicode_literals
 import MySQLdb
+import MySQLdb.cursors
 from MySQLdb.times import DateTimeDeltaType
 from markdown2 import UnicodeWithAttrs
 import warnings
 import datetime
+from collections import namedtuple
 import frappe
 import frappe.defaults
 import frappe.async
 import re
+import time
+import threading
 import redis
 import frappe.model.meta
-from frappe.utils import now, get_datetime, cstr
+from frappe.utils import now, get_datetime, cstr, cint
 from frappe import _
 from six import text_type, binary_type, string_types, integer_types
 from frappe.utils.global_search import sync_global_search
 from frappe.model.utils.link_count import flush_local_link_count
+from frappe.utils.query_cache import get_query_cache
 from six import iteritems, text_type
 
+# mysql error codes for lost connections
+# 2006 = MySQL server has gone away, 2013 = Lost connection to MySQL server during query
+CONNECTION_LOST_ERRORS = (2006, 2013)
+
+_connection_pools = {}
+_connection_pools_lock = threading.Lock()
+
+class ConnectionPool(object):
+	"""Per-process pool of open MySQLdb connections for one site database.
+
+	Enabled by setting `db_pool_size` in `site_config.json`. Idle connections
+	older than `db_pool_idle_timeout` seconds (default 300) are discarded
+	on checkout and every connection is pinged before it is handed out."""
+	def __init__(self, max_size, idle_timeout):
+		self.max_size = max_size
+		self.idle_timeout = idle_timeout
+		self.idle = []
+		self.lock = threading.Lock()
+
+	def checkout(self):
+		"""Return a live idle connection or `None` if a new one must be opened."""
+		while True:
+			with self.lock:
+				if not self.idle:
+					return None
+				conn, last_used = self.idle.pop()
+
+			if self.idle_timeout and time.time() - last_used > self.idle_timeout:
+				close_quietly(conn)
+				continue
+
+			try:
+				conn.ping()
+			except MySQLdb.OperationalError as e:
+				if e.args[0] not in CONNECTION_LOST_ERRORS:
+					raise
+				close_quietly(conn)
+				continue
+
+			return conn
+
+	def checkin(self, conn):
+		"""Return connection to the pool, closing it if the pool is full."""
+		with self.lock:
+			if len(self.idle) < self.max_size:
+				self.idle.append((conn, time.time()))
+				return
+
+		close_quietly(conn)
+
+	def clear(self):
+		with self.lock:
+			idle, self.idle = self.idle, []
+
+		for conn, last_used in idle:
+			close_quietly(conn)
+
+def get_connection_pool(host, user):
+	"""Returns the connection pool for this site's database, `None` if pooling is disabled."""
+	max_size = cint(frappe.conf.get("db_pool_size"))
+	if max_size <= 0:
+		return None
+
+	key = (host, user)
+	pool = _connection_pools.get(key)
+	if not pool:
+		with _connection_pools_lock:
+			pool = _connection_pools.get(key)
+			if not pool:
+				idle_timeout = frappe.conf.get("db_pool_idle_timeout")
+				pool = _connection_pools[key] = ConnectionPool(max_size,
+					300 if idle_timeout is None else cint(idle_timeout))
+
+	return pool
+
+def clear_connection_pools():
+	"""Close all idle pooled connections of this process."""
+	for pool in list(_connection_pools.values()):
+		pool.clear()
+
+def close_quietly(conn):
+	try:
+		conn.close()
+	except Exception:
+		pass
+
+def rows_to_dicts(rows, columns, as_utf8=0, update=None):
+	"""Returns `rows` (tuples) as a list of `frappe._dict` with `columns` as keys."""
+	if as_utf8:
+		rows = encode_rows(rows)
+
+	_dict = frappe._dict
+	if not update:
+		return [_dict(zip(columns, row)) for row in rows]
+
+	ret = []
+	for row in rows:
+		row = _dict(zip(columns, row))
+		row.update(update)
+		ret.append(row)
+	return ret
+
+def rows_to_namedtuples(rows, columns, as_utf8=0):
+	"""Returns `rows` as tuples whose values can also be read as attributes, e.g. `row.name`.
+
+	Columns that are not valid identifiers (e.g. `count(*)`) are named by position (`_0`)."""
+	if as_utf8:
+		rows = encode_rows(rows)
+
+	row_type = get_row_type(columns)
+	return [row_type._make(row) for row in rows]
+
+def encode_rows(rows):
+	"""Returns `rows` as lists with unicode values encoded as UTF-8."""
+	return [[v.encode('utf-8') if type(v) is text_type else v for v in row] for row in rows]
+
+_row_types = {}
+
+def get_row_type(columns):
+	"""Returns a (cached) namedtuple class for the given column names."""
+	columns = tuple(columns)
+	row_type = _row_types.get(columns)
+	if not row_type:
+		if len(_row_types) > 1000:
+			_row_types.clear()
+
+		row_type = _row_types[columns] = namedtuple(str("Row"),
+			[str(c) for c in columns], rename=True)
+
+	return row_type
+
+class UnbufferedResult(object):
+	"""Rows of an unbuffered (server side) cursor, fetched `chunk_size` rows at a time."""
+	def __init__(self, cursor, chunk_size=1000):
+		self.cursor = cursor
+		self.description = cursor.description
+		self.chunk_size = chunk_size
+		self.buffered = None
+
+	def fetch(self):
+		if self.buffered is not None:
+			rows, self.buffered = self.buffered, []
+			return rows
+
+		rows = self.cursor.fetchmany(self.chunk_size)
+		if not rows:
+			self.close()
+		return rows
+
+	def buffer(self):
+		"""Read the remaining rows into memory, so that other queries can run on the connection."""
+		if self.cursor:
+			self.buffered = list(self.buffered or []) + list(self.cursor.fetchall())
+			self.close()
+
+	def close(self):
+		if self.cursor:
+			self.cursor.close()
+			self.cursor = None
 
 class Database:
 	"""
@@ -46,12 +210,32 @@ class Database:
 
 		self.password = password or frappe.conf.db_password
 		self.value_cache = {}
+		self._pool = None
+		self._unbuffered = None
 
 	def get_db_login(self, ac_name):
 		return ac_name
 
 	def connect(self):
-		"""Connects to a database as set in `site_config.json`."""
+		"""Connects to a database as set in `site_config.json`.
+
+		If `db_pool_size` is set, an idle connection is borrowed from the
+		process-wide pool instead of opening a new one."""
+		if self.user != 'root':
+			self._pool = get_connection_pool(self.host, self.user)
+
+		if self._pool:
+			self._conn = self._pool.checkout()
+			if self._conn:
+				self._cursor = self._conn.cursor()
+				self.cur_db_name = self.user
+				frappe.local.rollback_observers = []
+				return
+
+		self.open_connection()
+
+	def open_connection(self):
+		"""Opens a new MySQLdb connection."""
 		warnings.filterwarnings('ignore', category=MySQLdb.Warning)
 		usessl = 0
 		if frappe.conf.db_ssl_ca and frappe.conf.db_ssl_cert and frappe.conf.db_ssl_key:
@@ -92,7 +276,8 @@ class Database:
 			frappe.throw(_("Not permitted"), frappe.PermissionError)
 
 	def sql(self, query, values=(), as_dict = 0, as_list = 0, formatted = 0,
-		debug=0, ignore_ddl=0, as_utf8=0, auto_commit=0, update=None):
+		debug=0, ignore_ddl=0, as_utf8=0, auto_commit=0, update=None, iterate=False,
+		as_namedtuple=0):
 		"""Execute a SQL query and fetch all rows.
 
 		:param query: SQL query.
@@ -105,6 +290,11 @@ class Database:
 		:param as_utf8: Encode values as UTF 8.
 		:param auto_commit: Commit after executing the query.
 		:param update: Update this dict to all rows (if returned `as_dict`).
+		:param iterate: Return a generator that reads rows from an unbuffered (server side)
+			cursor in chunks, for queries on large tables. Running another query before the
+			generator is exhausted reads the remaining rows into memory.
+		:param as_namedtuple: Return rows as tuples with values also readable as attributes
+			(`row.name`). Lighter than `as_dict` for large results.
 
 		Examples:
 
@@ -122,12 +312,23 @@ class Database:
 		if not self._conn:
 			self.connect()
 
+		if self._unbuffered:
+			# the connection can only run a query once the unbuffered rows are read
+			self._unbuffered.buffer()
+			self._unbuffered = None
+
 		# in transaction validations
 		self.check_transaction_status(query)
 
 		# autocommit
 		if auto_commit: self.commit()
 
+		cursor = self._conn.cursor(MySQLdb.cursors.SSCursor) if iterate else self._cursor
+
+		profiler = getattr(frappe.local, "query_profiler", None)
+		if profiler:
+			start_time = time.time()
+
 		# execute
 		try:
 			if values!=():
@@ -151,7 +352,7 @@ class Database:
 					frappe.log("with values:")
 					frappe.log(values)
 					frappe.log(">>>>")
-				self._cursor.execute(query, values)
+				cursor.execute(query, values)
 
 			else:
 				if debug:
@@ -162,7 +363,7 @@ class Database:
 					frappe.log(query)
 					frappe.log(">>>>")
 
-				self._cursor.execute(query)
+				cursor.execute(query)
 
 		except Exception as e:
 			# ignore data definition errors
@@ -179,17 +380,25 @@ class Database:
 			# 		auto_commit=auto_commit, update=update)
 
 			else:
+				if iterate: cursor.close()
 				raise
 
+		if profiler:
+			# the query as sent to the database, with values
+			profiler.record(getattr(cursor, "_executed", None) or query, time.time() - start_time)
+
+		if iterate:
+			self._unbuffered = UnbufferedResult(cursor)
+			return self.iterate_rows(self._unbuffered, as_dict, as_list or as_utf8, formatted,
+				as_utf8, update, as_namedtuple)
+
 		if auto_commit: self.commit()
 
 		# scrub output if required
 		if as_dict:
-			ret = self.fetch_as_dict(formatted, as_utf8)
-			if update:
-				for r in ret:
-					r.update(update)
-			return ret
+			return self.fetch_as_dict(formatted, as_utf8, update)
+		elif as_namedtuple:
+			return rows_to_namedtuples(self._cursor.fetchall(), self.get_column_names(), as_utf8)
 		elif as_list:
 			return self.convert_to_lists(self._cursor.fetchall(), formatted, as_utf8)
 		elif as_utf8:
@@ -197,6 +406,36 @@ class Database:
 		else:
 			return self._cursor.fetchall()
 
+	def iterate_rows(self, result, as_dict=0, as_list=0, formatted=0, as_utf8=0, update=None,
+		as_namedtuple=0):
+		"""Internal. Yields rows of an `UnbufferedResult` as tuples, lists or dicts."""
+		try:
+			columns = self.get_column_names(result.description)
+			while True:
+				rows = result.fetch()
+				if not rows:
+					break
+
+				if as_dict:
+					for row in rows_to_dicts(rows, columns, as_utf8, update):
+						yield row
+
+				elif as_namedtuple:
+					for row in rows_to_namedtuples(rows, columns, as_utf8):
+						yield row
+
+				elif as_list:
+					for row in self.convert_to_lists(rows, formatted, as_utf8):
+						yield row
+
+				else:
+					for row in rows:
+						yield row
+		finally:
+			result.close()
+			if self._unbuffered is result:
+				self._unbuffered = None
+
 	def explain_query(self, query, values=None):
 		"""Print `EXPLAIN` in error log."""
 		try:
@@ -246,25 +485,14 @@ class Database:
 				else:
 					frappe.throw(_("Too many writes in one request. Please send smaller requests"), frappe.ValidationError)
 
-	def fetch_as_dict(self, formatted=0, as_utf8=0):
+	def fetch_as_dict(self, formatted=0, as_utf8=0, update=None):
 		"""Internal. Converts results to dict."""
-		result = self._cursor.fetchall()
-		ret = []
-		needs_formatting = self.needs_formatting(result, formatted)
-
-		for r in result:
-			row_dict = frappe._dict({})
-			for i in range(len(r)):
-				if needs_formatting:
-					val = self.convert_to_simple_type(r[i], formatted)
-				else:
-					val = r[i]
+		# `convert_to_simple_type` returns values as they are, so `formatted` is not applied
+		return rows_to_dicts(self._cursor.fetchall(), self.get_column_names(), as_utf8, update)
 
-				if as_utf8 and type(val) is text_type:
-					val = val.encode('utf-8')
-				row_dict[self._cursor.description[i][0]] = val
-			ret.append(row_dict)
-		return ret
+	def get_column_names(self, description=None):
+		"""Returns column names of the last query (or of the given cursor description)."""
+		return [d[0] for d in (description or self._cursor.description or ())]
 
 	def needs_formatting(self, result, formatted):
 		"""Returns true if the first row in the result has a Date, Datetime, Long Int."""
@@ -312,20 +540,10 @@ class Database:
 
 	def convert_to_lists(self, res, formatted=0, as_utf8=0):
 		"""Convert tuple output to lists (internal)."""
-		nres = []
-		needs_formatting = self.needs_formatting(res, formatted)
-		for r in res:
-			nr = []
-			for c in r:
-				if needs_formatting:
-					val = self.convert_to_simple_type(c, formatted)
-				else:
-					val = c
-				if as_utf8 and type(val) is text_type:
-					val = val.encode('utf-8')
-				nr.append(val)
-			nres.append(nr)
-		return nres
+		if as_utf8:
+			return encode_rows(res)
+
+		return [list(r) for r in res]
 
 	def convert_to_utf8(self, res, formatted=0):
 		"""Encode result as UTF-8."""
@@ -346,33 +564,49 @@ class Database:
 		* ifnull(`fieldname`, default_value) = %(fieldname)s
 		* `fieldname` [=, !=, >, >=, <, <=] %(fieldname)s
 		"""
-		conditions = []
+		if isinstance(filters, string_types):
+			filters = { "name": filters }
+
+		# values are read on every call, the SQL is built once per shape of the filters
 		values = {}
-		def _build_condition(key):
-			"""
-				filter's key is passed by map function
-				build conditions like:
-					* ifnull(`fieldname`, default_value) = %(fieldname)s
-					* `fieldname` [=, !=, >, >=, <, <=] %(fieldname)s
-			"""
-			_operator = "="
-			_rhs = " %(" + key + ")s"
+		shape = []
+		for key in filters:
 			value = filters.get(key)
-			values[key] = value
+			operator, count = None, None
 			if isinstance(value, (list, tuple)):
 				# value is a tuble like ("!=", 0)
-				_operator = value[0]
-				values[key] = value[1]
-				if isinstance(value[1], (tuple, list)):
+				operator, value = value[0], value[1]
+				if isinstance(value, (list, tuple)):
 					# value is a list in tuple ("in", ("A", "B"))
-					inner_list = []
-					for i, v in enumerate(value[1]):
-						inner_key = "{0}_{1}".format(key, i)
-						values[inner_key] = v
-						inner_list.append("%({0})s".format(inner_key))
+					count = len(value)
+					for i, v in enumerate(value):
+						values["{0}_{1}".format(key, i)] = v
+
+			if count is None:
+				values[key] = value
+
+			shape.append((key, operator, count))
+
+		shape = tuple(shape)
+		conditions = get_query_cache().get(("conditions", shape),
+			lambda: self.compile_conditions(shape))
+
+		return conditions, values
 
-					_rhs = " ({0})".format(", ".join(inner_list))
-					del values[key]
+	def compile_conditions(self, shape):
+		"""Returns SQL conditions for `build_conditions` from a tuple of
+		`(key, operator, number of values in list or None)`, like:
+
+		* ifnull(`fieldname`, default_value) = %(fieldname)s
+		* `fieldname` [=, !=, >, >=, <, <=] %(fieldname)s
+		* `fieldname` in (%(fieldname_0)s, %(fieldname_1)s)
+		"""
+		conditions = []
+		for key, _operator, count in shape:
+			if count is None:
+				_rhs = " %(" + key + ")s"
+			else:
+				_rhs = " ({0})".format(", ".join("%({0}_{1})s".format(key, i) for i in range(count)))
 
 			if _operator not in ["=", "!=", ">", ">=", "<", "<=", "like", "in", "not in", "not like"]:
 				_operator = "="
@@ -386,13 +620,7 @@ class Database:
 
 			conditions.append(condition)
 
-		if isinstance(filters, string_types):
-			filters = { "name": filters }
-
-		for f in filters:
-			_build_condition(f)
-
-		return " and ".join(conditions), values
+		return " and ".join(conditions)
 
 	def get(self, doctype, filters=None, as_dict=True, cache=False):
 		"""Returns `get_value` with fieldname='*'"""
@@ -583,6 +811,21 @@ class Database:
 		return self.get_single_value(*args, **kwargs)
 
 	def _get_values_from_table(self, fields, filters, doctype, as_dict, debug, order_by=None, update=None):
+		if fields=="*":
+			as_dict = True
+
+		conditions, values = self.build_conditions(filters)
+
+		if isinstance(fields, (list, tuple)):
+			fields = tuple(fields)
+
+		query = get_query_cache().get(("get_values", doctype, fields, conditions, order_by),
+			lambda: self.compile_select(doctype, fields, conditions, order_by))
+
+		return self.sql(query, values, as_dict=as_dict, debug=debug, update=update)
+
+	def compile_select(self, doctype, fields, conditions, order_by=None):
+		"""Returns the select query for `_get_values_from_table`."""
 		fl = []
 		if isinstance(fields, (list, tuple)):
 			for f in fields:
@@ -593,18 +836,11 @@ class Database:
 			fl = ", ".join(fl)
 		else:
 			fl = fields
-			if fields=="*":
-				as_dict = True
-
-		conditions, values = self.build_conditions(filters)
 
 		order_by = ("order by " + order_by) if order_by else ""
 
-		r = self.sql("select {0} from `tab{1}` {2} {3} {4}"
-			.format(fl, doctype, "where" if conditions else "", conditions, order_by), values, 
-			as_dict=as_dict, debug=debug, update=update)
-
-		return r
+		return "select {0} from `tab{1}` {2} {3} {4}".format(fl, doctype,
+			"where" if conditions else "", conditions, order_by)
 
 	def _get_value_for_many_names(self, doctype, names, field, debug=False):
 		names = list(filter(None, names))
@@ -615,6 +851,34 @@ class Database:
 		else:
 			return {}
 
+	def bulk_insert(self, doctype, fields, values, chunk_size=1000):
+		"""Insert rows in `tab{doctype}` with multi-row `INSERT` statements. Does not
+		call the ORM triggers.
+
+		:param doctype: DocType name.
+		:param fields: List of column names.
+		:param values: List of rows, each a list / tuple of values in the order of `fields`.
+		:param chunk_size: Number of rows inserted per statement.
+
+		Example:
+
+			frappe.db.bulk_insert("ToDo", ["name", "description"],
+				[["todo-1", "First"], ["todo-2", "Second"]])
+		"""
+		values = list(values)
+		columns = ", ".join(["`" + f + "`" for f in fields])
+		row_placeholder = "(" + ", ".join(["%s"] * len(fields)) + ")"
+
+		for start in range(0, len(values), chunk_size):
+			chunk = values[start:start + chunk_size]
+			params = []
+			for row in chunk:
+				params.extend(row)
+
+			self.sql("""insert into `tab{doctype}` ({columns}) values {values}""".format(
+				doctype=doctype, columns=columns,
+				values=", ".join([row_placeholder] * len(chunk))), params)
+
 	def update(self, *args, **kwargs):
 		"""Update multiple values. Alias for `set_value`."""
 		return self.set_value(*args, **kwargs)
@@ -739,6 +1003,7 @@ class Database:
 		"""Commit current transaction. Calls SQL `COMMIT`."""
 		self.sql("commit")
 		frappe.local.rollback_observers = []
+		self.run_after_commit()
 		self.flush_realtime_log()
 		self.enqueue_global_search()
 		flush_local_link_count()
@@ -754,6 +1019,15 @@ class Database:
 
 			frappe.flags.update_global_search = []
 
+	def after_commit(self, method, *args):
+		"""Call `method(*args)` after the current transaction is committed, not on rollback."""
+		frappe.local.after_commit.append((method, args))
+
+	def run_after_commit(self):
+		methods, frappe.local.after_commit = getattr(frappe.local, "after_commit", []), []
+		for method, args in methods:
+			method(*args)
+
 	def flush_realtime_log(self):
 		for args in frappe.local.realtime_log:
 			frappe.async.emit_via_redis(*args)
@@ -764,6 +1038,7 @@ class Database:
 		"""`ROLLBACK` current transaction."""
 		self.sql("rollback")
 		self.begin()
+		frappe.local.after_commit = []
 		for obj in frappe.local.rollback_observers:
 			if hasattr(obj, "on_rollback"):
 				obj.on_rollback()
@@ -872,12 +1147,30 @@ class Database:
 		return frappe.cache().get_value("system_settings", _load_system_settings).get(key)
 
 	def close(self):
-		"""Close database connection."""
+		"""Close database connection. Pooled connections are rolled back
+		and returned to the pool instead."""
 		if self._conn:
+			if self._unbuffered:
+				self._unbuffered.close()
+				self._unbuffered = None
+
 			self._cursor.close()
-			self._conn.close()
+			if self._pool and self.cur_db_name == self.user:
+				self.release_to_pool()
+			else:
+				self._conn.close()
 			self._cursor = None
 			self._conn = None
+			self.transaction_writes = 0
+
+	def release_to_pool(self):
+		"""Reset open transaction and return connection to the pool (internal)."""
+		try:
+			self._conn.rollback()
+		except MySQLdb.Error:
+			close_quietly(self._conn)
+		else:
+			self._pool.checkin(self._conn)
 
 	def escape(self, s, percent=True):
 		"""Excape quotes and percent in given string."""
@@ -19,7 +19,11 @@ from six import iteritems, text_type
 
 def get_meta(doctype, cached=True):
 	if cached and not frappe.conf.developer_mode:
-		meta = frappe.cache().hget("form_meta", doctype, lambda: FormMeta(doctype))
+		meta = frappe.cache().hget("form_meta", doctype)
+		if not meta:
+			# not cached, or cached as a snapshot of an older version
+			meta = FormMeta(doctype)
+			frappe.cache().hset("form_meta", doctype, meta)
 	else:
 		meta = FormMeta(doctype)
 
@@ -20,10 +20,13 @@ def get_notifications():
 	notification_count = {}
 	notification_percent = {}
 
-	for name in groups:
-		count = cache.hget("notification_count:" + name, frappe.session.user)
-		if count is not None:
-			notification_count[name] = count
+	with cache.pipeline(transaction=False) as pipe:
+		for name in groups:
+			pipe.hget("notification_count:" + name, frappe.session.user)
+
+		for name, count in zip(groups, pipe.execute()):
+			if count is not None:
+				notification_count[name] = count
 
 	return {
 		"open_count_doctype": get_notifications_for_doctypes(config, notification_count),
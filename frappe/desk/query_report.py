@@ -143,36 +143,39 @@ def export_query():
 
 		data = run(report_name, filters)
 		data = frappe._dict(data)
-		columns = get_columns_dict(data.columns)
-
-		result = [[]]
-
-		# add column headings
-		for idx in range(len(data.columns)):
-			result[0].append(columns[idx]["label"])
-
-		# build table from dict
-		if isinstance(data.result[0], dict):
-			for i,row in enumerate(data.result):
-				# only rows which are visible in the report
-				if row and (i+1 in visible_idx):
-					row_list = []
-					for idx in range(len(data.columns)):
-						row_list.append(row.get(columns[idx]["fieldname"],""))
-					result.append(row_list)
-				elif not row:
-					result.append([])
-		else:
-			result = result + [d for i,d in enumerate(data.result) if (i+1 in visible_idx)]
 
 		from frappe.utils.xlsxutils import make_xlsx
-		xlsx_file = make_xlsx(result, "Query Report")
+		xlsx_file = make_xlsx(get_export_rows(data, visible_idx), "Query Report")
 
 		frappe.response['filename'] = report_name + '.xlsx'
 		frappe.response['filecontent'] = xlsx_file.getvalue()
 		frappe.response['type'] = 'binary'
 
 
+def get_export_rows(data, visible_idx):
+	"""Yields column headings and the visible rows of the report, without copying the result"""
+	columns = get_columns_dict(data.columns)
+	visible_idx = set(visible_idx or [])
+
+	# add column headings
+	yield [columns[idx]["label"] for idx in range(len(data.columns))]
+
+	if not data.result:
+		return
+
+	# build table from dict
+	if isinstance(data.result[0], dict):
+		for i,row in enumerate(data.result):
+			# only rows which are visible in the report
+			if row and (i+1 in visible_idx):
+				yield [row.get(columns[idx]["fieldname"],"") for idx in range(len(data.columns))]
+			elif not row:
+				yield []
+	else:
+		for i,d in enumerate(data.result):
+			if i+1 in visible_idx:
+				yield d
+
 def get_report_module_dotted_path(module, report_name):
 	return frappe.local.module_app[scrub(module)] + "." + scrub(module) \
 		+ ".report." + scrub(report_name) + "." + scrub(report_name)
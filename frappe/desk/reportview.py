@@ -4,14 +4,22 @@
 from __future__ import unicode_literals
 """build query for doclistview and return results"""
 
-import frappe, json
+import frappe, json, os
 from six.moves import range
 import frappe.permissions
 import MySQLdb
-from frappe.model.db_query import DatabaseQuery
+from frappe.model.db_query import DatabaseQuery, can_page_by_cursor
 from frappe import _
+from frappe.utils import cint
 from six import text_type, string_types, StringIO
 
+# rows read per query while exporting
+EXPORT_CHUNK_SIZE = 1000
+
+# exports with more records are written to a File by a background job, smaller exports
+# are built in memory and sent in the response
+EXPORT_IN_BACKGROUND_THRESHOLD = 5000
+
 @frappe.whitelist()
 def get():
 	args = get_form_params()
@@ -112,8 +120,6 @@ def save_report():
 def export_query():
 	"""export from report builder"""
 	form_params = get_form_params()
-	form_params["limit_page_length"] = None
-	form_params["as_list"] = True
 	doctype = form_params.doctype
 	add_totals_row = None
 	file_format_type = form_params["file_format_type"]
@@ -132,55 +138,159 @@ def export_query():
 		form_params["filters"] = {"name": ("in", si)}
 		del form_params["selected_items"]
 
-	db_query = DatabaseQuery(doctype)
-	ret = db_query.execute(**form_params)
+	# all rows are exported, in chunks
+	for key in ("start", "page_length", "limit", "limit_start", "limit_page_length"):
+		form_params.pop(key, None)
 
-	if add_totals_row:
-		ret = append_totals_row(ret)
+	threshold = cint(frappe.conf.get("export_in_background_threshold")) or EXPORT_IN_BACKGROUND_THRESHOLD
+	if get_export_row_count(doctype, form_params) > threshold:
+		frappe.enqueue("frappe.desk.reportview.export_query_to_file", queue="long", timeout=3600,
+			doctype=doctype, form_params=form_params, file_format_type=file_format_type,
+			add_totals_row=add_totals_row)
 
-	data = [['Sr'] + get_labels(db_query.fields, doctype)]
-	for i, row in enumerate(ret):
-		data.append([i+1] + list(row))
-
-	if file_format_type == "CSV":
+		frappe.respond_as_web_page(_("Export Queued"),
+			_("The export is being prepared. You will be notified with a link to the file once it is ready."),
+			indicator_color="blue")
+		return
 
-		# convert to csv
-		import csv
-		from frappe.utils.xlsxutils import handle_html
+	rows = get_export_rows(doctype, form_params, add_totals_row)
 
+	if file_format_type == "CSV":
 		f = StringIO()
-		writer = csv.writer(f)
-		for r in data:
-			# encode only unicode type strings and not int, floats etc.
-			writer.writerow([handle_html(frappe.as_unicode(v)).encode('utf-8') \
-				if isinstance(v, string_types) else v for v in r])
-
-		f.seek(0)
-		frappe.response['result'] = text_type(f.read(), 'utf-8')
+		write_csv(rows, f)
+
+		frappe.response['result'] = text_type(f.getvalue(), 'utf-8')
 		frappe.response['type'] = 'csv'
 		frappe.response['doctype'] = doctype
 
 	elif file_format_type == "Excel":
 
 		from frappe.utils.xlsxutils import make_xlsx
-		xlsx_file = make_xlsx(data, doctype)
+		xlsx_file = make_xlsx(rows, doctype)
 
 		frappe.response['filename'] = doctype + '.xlsx'
 		frappe.response['filecontent'] = xlsx_file.getvalue()
 		frappe.response['type'] = 'binary'
 
+def export_query_to_file(doctype, form_params, file_format_type, add_totals_row=None):
+	"""Write a large export to a private File and send the user a link to it. Runs as a background job."""
+	total = get_export_row_count(doctype, form_params) or 1
+	title = _("Exporting {0}").format(_(doctype))
+
+	def show_progress(count):
+		frappe.publish_progress(min(count * 100.0 / total, 100), title=title)
+
+	rows = get_export_rows(doctype, form_params, add_totals_row, progress=show_progress)
+
+	file_name = "{0}-{1}.{2}".format(doctype.replace(" ", "_"), frappe.generate_hash(length=10),
+		"csv" if file_format_type=="CSV" else "xlsx")
+	path = frappe.get_site_path("private", "files", file_name)
+
+	if file_format_type == "CSV":
+		with open(path, "w") as f:
+			write_csv(rows, f)
+	else:
+		from frappe.utils.xlsxutils import make_xlsx
+		make_xlsx(rows, doctype, output=path)
+
+	file_doc = frappe.get_doc({
+		"doctype": "File",
+		"file_name": file_name,
+		"file_url": "/private/files/" + file_name,
+		"file_size": os.path.getsize(path),
+		"is_private": 1
+	})
+	file_doc.insert(ignore_permissions=True)
+	frappe.db.commit()
+
+	frappe.publish_realtime("msgprint", _("Export of {0} is ready: {1}").format(_(doctype),
+		'<a href="{0}" target="_blank">{1}</a>'.format(file_doc.file_url, file_name)),
+		user=frappe.session.user)
+
+def get_export_row_count(doctype, form_params):
+	"""Returns the number of records to be exported, child rows are not counted"""
+	return DatabaseQuery(doctype).execute(fields=["count(*)"], filters=form_params.get("filters"),
+		or_filters=form_params.get("or_filters"), docstatus=form_params.get("docstatus"),
+		as_list=True)[0][0]
+
+def get_export_rows(doctype, form_params, add_totals_row=None, progress=None):
+	"""Yields the header and numbered rows of the export, reading `EXPORT_CHUNK_SIZE` rows
+	at a time so that the export is never held in memory"""
+	form_params = dict(form_params, as_list=True, limit_page_length=EXPORT_CHUNK_SIZE)
+	use_cursor = can_page_by_cursor(form_params.get("order_by"), form_params.get("group_by"),
+		form_params.get("distinct"), doctype, form_params.get("fields"), form_params.get("filters"),
+		form_params.get("or_filters"))
+
+	if not use_cursor:
+		# rows have no unique position to page by (e.g. rows of joined child tables),
+		# read them in one query with an unbuffered cursor
+		form_params.update(limit_page_length=None, iterate=True)
+
+	totals = None
+	after, count = "", 0
+
+	while True:
+		db_query = DatabaseQuery(doctype)
+		if use_cursor:
+			rows = db_query.execute(after=after, **form_params)
+		else:
+			rows = db_query.execute(**form_params)
+
+		if not count:
+			yield ['Sr'] + get_labels(db_query.fields, doctype)
+
+			# save user settings only once
+			form_params["save_user_settings"] = False
+
+		chunk = 0
+		for row in rows:
+			chunk += 1
+			count += 1
+			if add_totals_row:
+				totals = add_to_totals(totals, row)
+			yield [count] + list(row)
+
+			if progress and not use_cursor and not count % EXPORT_CHUNK_SIZE:
+				progress(count)
+
+		if progress:
+			progress(count)
+
+		after = db_query.next_cursor
+		if not use_cursor or chunk < EXPORT_CHUNK_SIZE or not after:
+			break
+
+	if totals:
+		yield [count + 1] + totals
+
+def write_csv(rows, f):
+	import csv
+	from frappe.utils.xlsxutils import handle_html
+
+	writer = csv.writer(f)
+	for r in rows:
+		# encode only unicode type strings and not int, floats etc.
+		writer.writerow([handle_html(frappe.as_unicode(v)).encode('utf-8') \
+			if isinstance(v, string_types) else v for v in r])
+
+def add_to_totals(totals, row):
+	if totals is None:
+		totals = [""] * len(row)
+
+	for i in range(len(row)):
+		if isinstance(row[i], (float, int)):
+			totals[i] = (totals[i] or 0) + row[i]
+
+	return totals
 
 def append_totals_row(data):
 	if not data:
 		return data
 	data = list(data)
-	totals = []
-	totals.extend([""]*len(data[0]))
+	totals = None
 
 	for row in data:
-		for i in range(len(row)):
-			if isinstance(row[i], (float, int)):
-				totals[i] = (totals[i] or 0) + row[i]
+		totals = add_to_totals(totals, row)
 	data.append(totals)
 
 	return data
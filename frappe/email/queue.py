@@ -5,13 +5,13 @@ from __future__ import unicode_literals
 from six.moves import range
 import frappe
 from six.moves import html_parser as HTMLParser
-import smtplib, quopri, json
+import smtplib, quopri, json, time
 from frappe import msgprint, throw, _
-from frappe.email.smtp import SMTPServer, get_outgoing_email_account
+from frappe.email.smtp import SMTPServer, SMTPServerPool, get_outgoing_email_account
 from frappe.email.email_body import get_email, get_formatted_html, add_attachment
 from frappe.utils.verified_command import get_signed_params, verify_request
 from html2text import html2text
-from frappe.utils import get_url, nowdate, encode, now_datetime, add_days, split_emails, cstr, cint
+from frappe.utils import get_url, nowdate, encode, now_datetime, add_days, split_emails, cstr, cint, flt
 from frappe.utils.file_manager import get_file
 from rq.timeouts import JobTimeoutException
 from frappe.utils.scheduler import log
@@ -320,7 +320,6 @@ def return_unsubscribed_page(email, doctype, name):
 def flush(from_test=False):
 	"""flush email queue, every time: called from scheduler"""
 	# additional check
-	cache = frappe.cache()
 	check_email_limit([])
 
 	auto_commit = not from_test
@@ -328,22 +327,65 @@ def flush(from_test=False):
 		msgprint(_("Emails are muted"))
 		from_test = True
 
-	smtpserver = SMTPServer()
-
 	make_cache_queue()
 
-	for i in range(cache.llen('cache_email_queue')):
-		email = cache.lpop('cache_email_queue')
+	workers = cint(frappe.conf.get("email_queue_workers"))
+	if workers > 1 and not from_test:
+		# every job pops emails from the same cached queue,
+		# so the queue is shared between the workers
+		for i in range(workers):
+			frappe.enqueue("frappe.email.queue.send_cached_queue", queue="short")
+		return
+
+	send_cached_queue(auto_commit=auto_commit, from_test=from_test)
+
+def send_cached_queue(auto_commit=True, from_test=False):
+	"""Send emails from the cached queue, reusing one SMTP session per Email Account"""
+	cache = frappe.cache()
+	smtp_server_pool = SMTPServerPool()
+	start = time.time()
+	sent = 0
+
+	try:
+		while True:
+			if cint(frappe.defaults.get_defaults().get("hold_queue"))==1:
+				break
 
-		if cint(frappe.defaults.get_defaults().get("hold_queue"))==1:
-			break
+			email = cache.lpop('cache_email_queue')
+			if not email:
+				break
 
-		if email:
-			send_one(email, smtpserver, auto_commit, from_test=from_test)
+			sent += send_one(email, auto_commit=auto_commit, from_test=from_test,
+				smtp_server_pool=smtp_server_pool) or 0
 
 		# NOTE: removing commit here because we pass auto_commit
-		# finally:
-		# 	frappe.db.commit()
+	finally:
+		smtp_server_pool.quit()
+
+	update_throughput(sent, time.time() - start)
+
+def update_throughput(sent, elapsed):
+	"""Add emails sent and seconds spent by a sending job to the throughput counters"""
+	if not sent:
+		return
+
+	cache = frappe.cache()
+	cache.hincrby("email_queue_throughput", "sent", sent)
+	cache.hincrby("email_queue_throughput", "jobs", 1)
+	cache.hincrbyfloat("email_queue_throughput", "elapsed", elapsed)
+
+def get_throughput():
+	"""Returns total emails sent, sending jobs and emails sent per second per job"""
+	counters = frappe.cache().get_counters("email_queue_throughput")
+	sent, jobs, elapsed = cint(counters.get("sent")), cint(counters.get("jobs")), flt(counters.get("elapsed"))
+
+	return frappe._dict({
+		"sent": sent,
+		"jobs": jobs,
+		"elapsed": elapsed,
+		"emails_per_second": (sent / elapsed) if elapsed else 0.0
+	})
+
 def make_cache_queue():
 	'''cache values in queue before sendign'''
 	cache = frappe.cache()
@@ -364,8 +406,9 @@ def make_cache_queue():
 	for e in emails:
 		cache.rpush('cache_email_queue', e[0])
 
-def send_one(email, smtpserver=None, auto_commit=True, now=False, from_test=False):
-	'''Send Email Queue with given smtpserver'''
+def send_one(email, smtpserver=None, auto_commit=True, now=False, from_test=False, smtp_server_pool=None):
+	'''Send Email Queue with given smtpserver (or a session from `smtp_server_pool`),
+	returns the number of recipients sent to'''
 
 	email = frappe.db.sql('''select
 			name, status, communication, message, sender, reference_doctype,
@@ -398,10 +441,14 @@ def send_one(email, smtpserver=None, auto_commit=True, now=False, from_test=Fals
 	if email.communication:
 		frappe.get_doc('Communication', email.communication).set_delivery_status(commit=auto_commit)
 
+	sent_to = []
 	try:
 		if not frappe.flags.in_test:
-			if not smtpserver: smtpserver = SMTPServer()
-			smtpserver.setup_email_account(email.reference_doctype, sender=email.sender)
+			if smtp_server_pool:
+				smtpserver = smtp_server_pool.get(email.reference_doctype, sender=email.sender)
+			else:
+				if not smtpserver: smtpserver = SMTPServer()
+				smtpserver.setup_email_account(email.reference_doctype, sender=email.sender)
 
 		for recipient in recipients_list:
 			if recipient.status != "Not Sent":
@@ -412,8 +459,9 @@ def send_one(email, smtpserver=None, auto_commit=True, now=False, from_test=Fals
 				smtpserver.sess.sendmail(email.sender, recipient.recipient, encode(message))
 
 			recipient.status = "Sent"
-			frappe.db.sql("""update `tabEmail Queue Recipient` set status='Sent', modified=%s where name=%s""",
-				(now_datetime(), recipient.name), auto_commit=auto_commit)
+			sent_to.append(recipient.name)
+
+		set_recipients_sent(sent_to, auto_commit)
 
 		#if all are sent set status
 		if any("Sent" == s.status for s in recipients_list):
@@ -424,10 +472,12 @@ def send_one(email, smtpserver=None, auto_commit=True, now=False, from_test=Fals
 				where name=%s""", ("No recipients to send to", email.name), auto_commit=auto_commit)
 		if frappe.flags.in_test:
 			frappe.flags.sent_mail = message
-			return
+			return len(sent_to)
 		if email.communication:
 			frappe.get_doc('Communication', email.communication).set_delivery_status(commit=auto_commit)
 
+		return len(sent_to)
+
 	except (smtplib.SMTPServerDisconnected,
 			smtplib.SMTPConnectError,
 			smtplib.SMTPHeloError,
@@ -435,6 +485,9 @@ def send_one(email, smtpserver=None, auto_commit=True, now=False, from_test=Fals
 			JobTimeoutException):
 
 		# bad connection/timeout, retry later
+		set_recipients_sent(sent_to, auto_commit)
+		if smtp_server_pool and smtpserver:
+			smtp_server_pool.discard(smtpserver)
 
 		if any("Sent" == s.status for s in recipients_list):
 			frappe.db.sql("""update `tabEmail Queue` set status='Partially Sent', modified=%s where name=%s""",
@@ -447,10 +500,11 @@ def send_one(email, smtpserver=None, auto_commit=True, now=False, from_test=Fals
 			frappe.get_doc('Communication', email.communication).set_delivery_status(commit=auto_commit)
 
 		# no need to attempt further
-		return
+		return len(sent_to)
 
 	except Exception as e:
 		frappe.db.rollback()
+		set_recipients_sent(sent_to, auto_commit)
 
 		if any("Sent" == s.status for s in recipients_list):
 			frappe.db.sql("""update `tabEmail Queue` set status='Partially Errored', error=%s where name=%s""",
@@ -470,42 +524,64 @@ where name=%s""", (text_type(e), email.name), auto_commit=auto_commit)
 			# log to Error Log
 			log('frappe.email.queue.flush', text_type(e))
 
+		return len(sent_to)
+
+def set_recipients_sent(recipients, auto_commit=True):
+	'''Mark the given Email Queue Recipients as sent in one statement'''
+	if not recipients:
+		return
+
+	frappe.db.sql("""update `tabEmail Queue Recipient` set status='Sent', modified=%s
+		where name in ({0})""".format(", ".join(["%s"] * len(recipients))),
+		[now_datetime()] + list(recipients), auto_commit=auto_commit)
+
 def prepare_message(email, recipient, recipients_list):
 	message = email.message
 	if not message:
 		return ""
 
+	# parts common to all recipients are prepared once per Email Queue
+	if email.get("prepared_message") is None:
+		email.prepared_message = get_prepared_message(email, recipients_list)
+
+	message = email.prepared_message
+
 	if email.add_unsubscribe_link and email.reference_doctype: # is missing the check for unsubscribe message but will not add as there will be no unsubscribe url
 		unsubscribe_url = get_unsubcribed_url(email.reference_doctype, email.reference_name, recipient,
 		email.unsubscribe_method, email.unsubscribe_params)
 		message = message.replace("<!--unsubscribe url-->", quopri.encodestring(unsubscribe_url.encode()).decode())
 
-	if email.expose_recipients == "header":
-		pass
-	else:
-		if email.expose_recipients == "footer":
-			if isinstance(email.show_as_cc, string_types):
-				email.show_as_cc = email.show_as_cc.split(",")
-			email_sent_to = [r.recipient for r in recipients_list]
-			email_sent_cc = ", ".join([e for e in email_sent_to if e in email.show_as_cc])
-			email_sent_to = ", ".join([e for e in email_sent_to if e not in email.show_as_cc])
-
-			if email_sent_cc:
-				email_sent_message = _("This email was sent to {0} and copied to {1}").format(email_sent_to,email_sent_cc)
-			else:
-				email_sent_message = _("This email was sent to {0}").format(email_sent_to)
-			message = message.replace("<!--cc message-->", quopri.encodestring(email_sent_message.encode()).decode())
-
+	if email.expose_recipients != "header":
 		message = message.replace("<!--recipient-->", recipient)
 
-	message = (message and message.encode('utf8')) or ''
+	return message.encode('utf8')
+
+def get_prepared_message(email, recipients_list):
+	"""Returns the message with the cc footer and on-demand attachments added, leaving
+	the per recipient placeholders in place. Attachments are base64 encoded, so the
+	placeholders can only be found in the message body."""
+	message = email.message
+
+	if email.expose_recipients == "footer":
+		if isinstance(email.show_as_cc, string_types):
+			email.show_as_cc = email.show_as_cc.split(",")
+		email_sent_to = [r.recipient for r in recipients_list]
+		email_sent_cc = ", ".join([e for e in email_sent_to if e in email.show_as_cc])
+		email_sent_to = ", ".join([e for e in email_sent_to if e not in email.show_as_cc])
+
+		if email_sent_cc:
+			email_sent_message = _("This email was sent to {0} and copied to {1}").format(email_sent_to,email_sent_cc)
+		else:
+			email_sent_message = _("This email was sent to {0}").format(email_sent_to)
+		message = message.replace("<!--cc message-->", quopri.encodestring(email_sent_message.encode()).decode())
+
 	if not email.attachments:
 		return message
 
 	# On-demand attachments
 	from email.parser import Parser
 
-	msg_obj = Parser().parsestr(message)
+	msg_obj = Parser().parsestr(message.encode('utf8'))
 	attachments = json.loads(email.attachments)
 
 	for attachment in attachments:
@@ -523,7 +599,7 @@ def prepare_message(email, recipient, recipients_list):
 		attachment.pop("fid", None)
 		add_attachment(**attachment)
 
-	return msg_obj.as_string()
+	return cstr(msg_obj.as_string())
 
 def clear_outbox():
 	"""Remove low priority older than 31 days in Outbox and expire mails not sent for 7 days.
@@ -161,6 +161,15 @@ class SMTPServer:
 			self.sender = self.email_account.email_id
 			self.always_use_account_email_id_as_sender = cint(self.email_account.get("always_use_account_email_id_as_sender"))
 
+	def quit(self):
+		"""close the session, if open"""
+		if self._sess:
+			try:
+				self._sess.quit()
+			except (smtplib.SMTPException, _socket.error):
+				pass
+			self._sess = None
+
 	@property
 	def sess(self):
 		"""get session"""
@@ -215,3 +224,33 @@ class SMTPServer:
 		except smtplib.SMTPException:
 			frappe.msgprint(_('Unable to send emails at this time'))
 			raise
+
+class SMTPServerPool(object):
+	"""Keeps one logged in `SMTPServer` per outgoing Email Account, so that sending a batch
+	of emails does not connect and authenticate again every time the account changes."""
+	def __init__(self):
+		self.servers = {}
+
+	def get(self, append_to=None, sender=None):
+		email_account = get_outgoing_email_account(raise_exception_not_set=False,
+			append_to=append_to, sender=sender)
+		key = email_account.name if email_account else None
+
+		if key not in self.servers:
+			server = SMTPServer(append_to=append_to)
+			server.setup_email_account(append_to, sender=sender)
+			self.servers[key] = server
+
+		return self.servers[key]
+
+	def discard(self, server):
+		"""close a broken session, a new one is opened on the next `get`"""
+		for key, s in list(self.servers.items()):
+			if s is server:
+				del self.servers[key]
+		server.quit()
+
+	def quit(self):
+		for server in self.servers.values():
+			server.quit()
+		self.servers = {}
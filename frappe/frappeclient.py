@@ -63,6 +63,38 @@ class FrappeClient(object):
 		res = self.session.get(self.url + "/api/resource/" + doctype, params=params, verify=self.verify, headers=self.headers)
 		return self.post_process(res)
 
+	def iterate_list(self, doctype, fields='"*"', filters=None, page_length=500):
+		"""Yields all records of a particular type, fetched page by page using a cursor"""
+		if not isinstance(fields, string_types):
+			fields = json.dumps(fields)
+		params = {
+			"fields": fields,
+			"limit_page_length": page_length,
+			"after": ""
+		}
+		if filters:
+			params["filters"] = json.dumps(filters)
+
+		start = 0
+		while True:
+			res = self.session.get(self.url + "/api/resource/" + doctype, params=params, verify=self.verify, headers=self.headers)
+			data = self.post_process(res) or []
+			for d in data:
+				yield d
+
+			rjson = res.json()
+			if "next_cursor" in rjson:
+				if not rjson["next_cursor"]:
+					break
+				params["after"] = rjson["next_cursor"]
+
+			else:
+				# server does not support cursors, page by offset
+				if len(data) < page_length:
+					break
+				start += page_length
+				params["limit_start"] = start
+
 	def insert(self, doc):
 		'''Insert a document to the remote server
 
@@ -194,11 +226,11 @@ class FrappeClient(object):
 		tables = {}
 		for df in meta.get_table_fields():
 			if verbose: print("getting " + df.options)
-			tables[df.fieldname] = self.get_list(df.options, limit_page_length=999999)
+			tables[df.fieldname] = list(self.iterate_list(df.options))
 
 		# get links
 		if verbose: print("getting " + doctype)
-		docs = self.get_list(doctype, limit_page_length=999999, filters=filters)
+		docs = list(self.iterate_list(doctype, filters=filters))
 
 		# build - attach children to parents
 		if tables:
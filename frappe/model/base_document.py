@@ -4,6 +4,7 @@
 from __future__ import unicode_literals
 from six import iteritems, string_types
 import frappe, sys
+from collections import OrderedDict
 from frappe import _
 from frappe.utils import (cint, flt, now, cstr, strip_html, getdate, get_datetime, to_timedelta,
 	sanitize_html, sanitize_email)
@@ -14,6 +15,7 @@ from frappe.modules import load_doctype_module
 from frappe.model import display_fieldtypes
 from frappe.model.db_schema import type_map, varchar_len
 from frappe.utils.password import get_decrypted_password, set_encrypted_password
+from frappe.utils.query_cache import get_query_cache
 
 _classes = {}
 
@@ -279,24 +281,21 @@ class BaseDocument(object):
 
 	def db_insert(self):
 		"""INSERT the document (with valid columns) in the database."""
-		if not self.name:
-			# name will be set by document class in most cases
-			set_new_name(self)
-
-		if not self.creation:
-			self.creation = self.modified = now()
-			self.created_by = self.modifield_by = frappe.session.user
+		self.set_name_and_creation()
 
 		d = self.get_valid_dict()
 
-		columns = d.keys()
-		try:
-			frappe.db.sql("""insert into `tab{doctype}`
+		columns = tuple(d.keys())
+		query = get_query_cache().get(("insert", self.doctype, columns),
+			lambda: """insert into `tab{doctype}`
 				({columns}) values ({values})""".format(
 					doctype = self.doctype,
 					columns = ", ".join(["`"+c+"`" for c in columns]),
 					values = ", ".join(["%s"] * len(columns))
-				), list(d.values()))
+				))
+
+		try:
+			frappe.db.sql(query, list(d.values()))
 		except Exception as e:
 			if e.args[0]==1062:
 				if "PRIMARY" in cstr(e.args[1]):
@@ -319,6 +318,16 @@ class BaseDocument(object):
 
 		self.set("__islocal", False)
 
+	def set_name_and_creation(self):
+		"""Set name and creation timestamp before the document is inserted."""
+		if not self.name:
+			# name will be set by document class in most cases
+			set_new_name(self)
+
+		if not self.creation:
+			self.creation = self.modified = now()
+			self.created_by = self.modifield_by = frappe.session.user
+
 	def db_update(self):
 		if self.get("__islocal") or not self.name:
 			self.db_insert()
@@ -330,14 +339,16 @@ class BaseDocument(object):
 		name = d['name']
 		del d['name']
 
-		columns = d.keys()
-
-		try:
-			frappe.db.sql("""update `tab{doctype}`
+		columns = tuple(d.keys())
+		query = get_query_cache().get(("update", self.doctype, columns),
+			lambda: """update `tab{doctype}`
 				set {values} where name=%s""".format(
 					doctype = self.doctype,
 					values = ", ".join(["`"+c+"`=%s" for c in columns])
-				), list(d.values()) + [name])
+				))
+
+		try:
+			frappe.db.sql(query, list(d.values()) + [name])
 		except Exception as e:
 			if e.args[0]==1062 and "Duplicate" in cstr(e.args[1]):
 				self.show_unique_validation_message(e)
@@ -397,7 +408,7 @@ class BaseDocument(object):
 
 		missing = []
 
-		for df in self.meta.get("fields", {"reqd": ('=', 1)}):
+		for df in self.meta.get_mandatory_fields():
 			if self.get(df.fieldname) in (None, []) or not strip_html(cstr(self.get(df.fieldname))).strip():
 				missing.append((df.fieldname, get_msg(df)))
 
@@ -409,8 +420,11 @@ class BaseDocument(object):
 
 		return missing
 
-	def get_invalid_links(self, is_submittable=False):
-		'''Returns list of invalid links and also updates fetch values if not set'''
+	def get_invalid_links(self, is_submittable=False, link_values=None):
+		'''Returns list of invalid links and also updates fetch values if not set
+
+		:param is_submittable: Check for cancelled links (if parent is submittable).
+		:param link_values: Prefetched linked values from `get_link_values`.'''
 		def get_msg(df, docname):
 			if self.parentfield:
 				return "{} #{}: {}: {}".format(_("Row"), self.idx, _(df.label), docname)
@@ -420,8 +434,7 @@ class BaseDocument(object):
 		invalid_links = []
 		cancelled_links = []
 
-		for df in (self.meta.get_link_fields()
-				 + self.meta.get("fields", {"fieldtype": ('=', "Dynamic Link")})):
+		for df in self.meta.get_link_fields() + self.meta.get_dynamic_link_fields():
 			docname = self.get(df.fieldname)
 
 			if docname:
@@ -444,11 +457,15 @@ class BaseDocument(object):
 						 if not self.get(_df.fieldname)
 				]
 
-				if not fields_to_fetch:
+				# values prefetched for the parent and all rows (only found documents are prefetched)
+				values = (link_values or {}).get((doctype, cstr(docname).lower()))
+
+				if not values and not fields_to_fetch:
 					# cache a single value type
 					values = frappe._dict(name=frappe.db.get_value(doctype, docname,
 						'name', cache=True))
-				else:
+
+				elif not values:
 					values_to_fetch = ['name'] + [_df.options.split('.')[-1]
 						for _df in fields_to_fetch]
 
@@ -471,7 +488,8 @@ class BaseDocument(object):
 
 				elif (df.fieldname != "amended_from"
 					and (is_submittable or self.meta.is_submittable) and frappe.get_meta(doctype).is_submittable
-					and cint(frappe.db.get_value(doctype, docname, "docstatus"))==2):
+					and cint(values.docstatus if "docstatus" in values
+						else frappe.db.get_value(doctype, docname, "docstatus"))==2):
 
 					cancelled_links.append((df.fieldname, docname, get_msg(df, docname)))
 
@@ -779,6 +797,92 @@ class BaseDocument(object):
 			for df in self.meta.get("fields", {"fieldtype": ('=', "Text Editor")}):
 				extract_images_from_doc(self, df.fieldname)
 
+def get_link_values(docs):
+	"""Returns values of documents linked from `docs` (a parent and its children) as
+	`{(doctype, lowercase name): values}`, using one query per linked doctype.
+
+	Values have `name`, `docstatus` for submittable doctypes and all fields to fetch.
+	Names of documents with nothing else to fetch are also read from and stored in the
+	request level `frappe.db.value_cache`."""
+	to_fetch = OrderedDict()
+	for d in docs:
+		for df in d.meta.get_link_fields() + d.meta.get_dynamic_link_fields():
+			docname = d.get(df.fieldname)
+			doctype = df.options if df.fieldtype=="Link" else d.get(df.options)
+			if not (docname and doctype) or not isinstance(docname, string_types):
+				continue
+
+			names, fields = to_fetch.setdefault(doctype, (set(), ["name"]))
+			names.add(docname)
+			for _df in d.meta.get_fields_to_fetch(df.fieldname):
+				fieldname = _df.options.split('.')[-1]
+				if fieldname not in fields:
+					fields.append(fieldname)
+
+	out = {}
+	for doctype, (names, fields) in iteritems(to_fetch):
+		meta = frappe.get_meta(doctype)
+		if meta.issingle:
+			continue
+
+		if meta.is_submittable:
+			fields.append("docstatus")
+
+		only_name = fields==["name"]
+		if only_name:
+			for name in list(names):
+				cached = frappe.db.value_cache.get((doctype, name, "name"))
+				if cached:
+					out[(doctype, name.lower())] = frappe._dict(name=cached[0][0])
+					names.remove(name)
+
+		if not names:
+			continue
+
+		names = list(names)
+		for row in frappe.db.sql("""select {fields} from `tab{doctype}` where name in ({names})""".format(
+				fields=", ".join(["`" + f + "`" for f in fields]), doctype=doctype,
+				names=", ".join(["%s"] * len(names))), names, as_dict=True):
+			out[(doctype, cstr(row.name).lower())] = row
+
+			if only_name:
+				frappe.db.value_cache[(doctype, row.name, "name")] = ((row.name,),)
+
+	return out
+
+def db_insert_multiple(docs, chunk_size=1000):
+	"""INSERT documents in the database, one multi-row `INSERT` per doctype and chunk.
+
+	If a chunk fails because of a duplicate entry, its documents are inserted one by one
+	using `db_insert` so that hash collisions and unique constraints are handled as usual."""
+	docs_by_doctype = OrderedDict()
+	for d in docs:
+		docs_by_doctype.setdefault(d.doctype, []).append(d)
+
+	for doctype, doctype_docs in iteritems(docs_by_doctype):
+		for start in range(0, len(doctype_docs), chunk_size):
+			chunk = doctype_docs[start:start + chunk_size]
+
+			rows = []
+			for d in chunk:
+				d.set_name_and_creation()
+				rows.append(d.get_valid_dict())
+
+			columns = list(rows[0].keys())
+			try:
+				frappe.db.bulk_insert(doctype, columns,
+					[[row[c] for c in columns] for row in rows], chunk_size=chunk_size)
+			except Exception as e:
+				if e.args and e.args[0]==1062:
+					for d in chunk:
+						d.db_insert()
+					continue
+				else:
+					raise
+
+			for d in chunk:
+				d.set("__islocal", False)
+
 def _filter(data, filters, limit=None):
 	"""pass filters as:
 		{"key": "val", "key": ["!=", "val"],
@@ -3,19 +3,25 @@
 
 from __future__ import unicode_literals
 
-from six import iteritems, string_types
+from six import iteritems, string_types, integer_types
 
 """build query for doclistview and return results"""
 
-import frappe, json, copy
+import frappe, json, copy, re, base64
 import frappe.defaults
 import frappe.share
 import frappe.permissions
-from frappe.utils import flt, cint, getdate, get_datetime, get_time, make_filter_tuple, get_filter, add_to_date
+from frappe.utils import flt, cint, cstr, getdate, get_datetime, get_time, make_filter_tuple, get_filter, add_to_date
 from frappe import _
 from frappe.model import optional_fields
 from frappe.model.utils.user_settings import get_user_settings, update_user_settings
-from datetime import datetime
+from frappe.utils.query_cache import get_query_cache
+from datetime import datetime, date, timedelta
+from decimal import Decimal, InvalidOperation
+
+# shared names / user permission values above which the condition is
+# built as a subquery instead of an inline list of values
+PERMISSION_SUBQUERY_THRESHOLD = 100
 
 class DatabaseQuery(object):
 	def __init__(self, doctype):
@@ -26,6 +32,7 @@ class DatabaseQuery(object):
 		self.fields = None
 		self.user = None
 		self.ignore_ifnull = False
+		self.next_cursor = None
 		self.flags = frappe._dict()
 
 	def execute(self, query=None, fields=None, filters=None, or_filters=None,
@@ -34,7 +41,13 @@ class DatabaseQuery(object):
 		ignore_permissions=False, user=None, with_comment_count=False,
 		join='left join', distinct=False, start=None, page_length=None, limit=None,
 		ignore_ifnull=False, save_user_settings=False, save_user_settings_fields=False,
-		update=None, add_total_row=None, user_settings=None):
+		update=None, add_total_row=None, user_settings=None, after=None, iterate=False):
+		"""Run the list query.
+
+		Pass `after` (`""` for the first page) to page by cursor instead of `limit_start`.
+		The cursor to fetch the following page is set as `next_cursor`.
+
+		Pass `iterate` to get a generator of rows read with an unbuffered cursor (see `Database.sql`)."""
 		if not ignore_permissions and not frappe.has_permission(self.doctype, "read", user=user):
 			frappe.flags.error_message = _('Insufficient Permission for {0}').format(frappe.bold(self.doctype))
 			raise frappe.PermissionError(self.doctype)
@@ -76,6 +89,8 @@ class DatabaseQuery(object):
 		self.flags.ignore_permissions = ignore_permissions
 		self.user = user or frappe.session.user
 		self.update = update
+		self.after = after
+		self.iterate = iterate and after is None
 		self.user_settings_fields = copy.deepcopy(self.fields)
 		#self.debug = True
 
@@ -87,7 +102,7 @@ class DatabaseQuery(object):
 		else:
 			result = self.build_and_run()
 
-		if with_comment_count and not as_list and self.doctype:
+		if with_comment_count and not as_list and self.doctype and not self.iterate:
 			self.add_comment_count(result)
 
 		if save_user_settings:
@@ -109,7 +124,13 @@ class DatabaseQuery(object):
 		query = """select %(fields)s from %(tables)s %(conditions)s
 			%(group_by)s %(order_by)s %(limit)s""" % args
 
-		return frappe.db.sql(query, as_dict=not self.as_list, debug=self.debug, update=self.update)
+		result = frappe.db.sql(query, as_dict=not self.as_list, debug=self.debug, update=self.update,
+			iterate=self.iterate)
+
+		if self.after is not None:
+			result = self.set_next_cursor(result)
+
+		return result
 
 	def prepare_args(self):
 		self.parse_args()
@@ -148,6 +169,10 @@ class DatabaseQuery(object):
 		self.set_order_by(args)
 
 		self.validate_order_by_and_group_by(args.order_by)
+
+		if self.after is not None:
+			self.add_cursor_conditions(args)
+
 		args.order_by = args.order_by and (" order by " + args.order_by) or ""
 
 		self.validate_order_by_and_group_by(self.group_by)
@@ -182,21 +207,31 @@ class DatabaseQuery(object):
 		"""extract tables from fields"""
 		self.tables = ['`tab' + self.doctype + '`']
 
-		# add tables from fields
+		# add tables from fields, permissions are checked on every call
 		if self.fields:
-			for f in self.fields:
-				if ( not ("tab" in f and "." in f) ) or ("locate(" in f): continue
-
-
-				table_name = f.split('.')[0]
-				if table_name.lower().startswith('group_concat('):
-					table_name = table_name[13:]
-				if table_name.lower().startswith('ifnull('):
-					table_name = table_name[7:]
-				if not table_name[0]=='`':
-					table_name = '`' + table_name + '`'
-				if not table_name in self.tables:
-					self.append_table(table_name)
+			fields = tuple(self.fields)
+			for table_name in get_query_cache().get(("list_tables", self.doctype, fields),
+				lambda: self.get_tables_from_fields(fields)):
+				self.append_table(table_name)
+
+	def get_tables_from_fields(self, fields):
+		"""Returns names of the tables referred in `fields`, other than the main table."""
+		tables = ['`tab' + self.doctype + '`']
+		for f in fields:
+			if ( not ("tab" in f and "." in f) ) or ("locate(" in f): continue
+
+
+			table_name = f.split('.')[0]
+			if table_name.lower().startswith('group_concat('):
+				table_name = table_name[13:]
+			if table_name.lower().startswith('ifnull('):
+				table_name = table_name[7:]
+			if not table_name[0]=='`':
+				table_name = '`' + table_name + '`'
+			if not table_name in tables:
+				tables.append(table_name)
+
+		return tables[1:]
 
 	def append_table(self, table_name):
 		self.tables.append(table_name)
@@ -375,11 +410,14 @@ class DatabaseQuery(object):
 		meta = frappe.get_meta(self.doctype)
 		role_permissions = frappe.permissions.get_role_permissions(meta, user=self.user)
 
-		self.shared = frappe.share.get_shared(self.doctype, self.user)
+		# names are only needed if shared documents are few enough to be listed in the query
+		self.shared_count = frappe.share.get_shared_count(self.doctype, self.user)
+		self.shared = frappe.share.get_shared(self.doctype, self.user) \
+			if 0 < self.shared_count <= get_permission_subquery_threshold() else []
 
 		if not meta.istable and not role_permissions.get("read") and not self.flags.ignore_permissions:
 			only_if_shared = True
-			if not self.shared:
+			if not self.shared_count:
 				frappe.throw(_("No permission to read {0}").format(self.doctype), frappe.PermissionError)
 			else:
 				self.conditions.append(self.get_share_condition())
@@ -407,7 +445,7 @@ class DatabaseQuery(object):
 				conditions += (' and ' + doctype_conditions) if conditions else doctype_conditions
 
 			# share is an OR condition, if there is a role permission
-			if not only_if_shared and self.shared and conditions:
+			if not only_if_shared and self.shared_count and conditions:
 				conditions =  "({conditions}) or ({shared_condition})".format(
 					conditions=conditions, shared_condition=self.get_share_condition())
 
@@ -417,9 +455,37 @@ class DatabaseQuery(object):
 			return self.match_filters
 
 	def get_share_condition(self):
+		if self.shared_count > get_permission_subquery_threshold():
+			# semi-join on tabDocShare, same conditions as `frappe.share.get_shared`
+			return """`tab{doctype}`.name in (select share_name from `tabDocShare`
+				where share_doctype='{doctype}' and `read`=1 and (user='{user}' {everyone}))""".format(
+					doctype=frappe.db.escape(self.doctype, percent=False),
+					user=frappe.db.escape(self.user, percent=False),
+					everyone="or everyone=1" if self.user!="Guest" else "")
+
 		return """`tab{0}`.name in ({1})""".format(self.doctype, ", ".join(["'%s'"] * len(self.shared))) % \
 			tuple([frappe.db.escape(s, percent=False) for s in self.shared])
 
+	def get_user_permission_values_condition(self, fieldname, doctype, values):
+		"""Returns condition matching link `fieldname` against the user's permitted `values` of `doctype`"""
+		if len(values) > get_permission_subquery_threshold():
+			# semi-join on tabUser Permission, same values as `get_user_permissions`
+			condition = """`tab{doctype}`.`{fieldname}` in (select for_value from `tabUser Permission`
+				where user='{user}' and allow='{allow}')""".format(doctype=self.doctype, fieldname=fieldname,
+					user=frappe.db.escape(self.user, percent=False), allow=frappe.db.escape(doctype, percent=False))
+
+			if doctype=="User":
+				# users always match their own profile
+				condition = """({condition} or `tab{doctype}`.`{fieldname}`='{user}')""".format(
+					condition=condition, doctype=self.doctype, fieldname=fieldname,
+					user=frappe.db.escape(self.user, percent=False))
+
+			return condition
+
+		return """`tab{doctype}`.`{fieldname}` in ({values})""".format(
+			doctype=self.doctype, fieldname=fieldname,
+			values=", ".join([('"'+frappe.db.escape(v, percent=False)+'"') for v in values]))
+
 	def add_user_permissions(self, user_permissions, user_permission_doctypes=None):
 		user_permission_doctypes = frappe.permissions.get_user_permission_doctypes(user_permission_doctypes, user_permissions)
 		meta = frappe.get_meta(self.doctype)
@@ -436,9 +502,8 @@ class DatabaseQuery(object):
 						condition = cond + " or "
 					else:
 						condition = ""
-					condition += """`tab{doctype}`.`{fieldname}` in ({values})""".format(
-						doctype=self.doctype, fieldname=df.fieldname,
-						values=", ".join([('"'+frappe.db.escape(v, percent=False)+'"') for v in user_permission_values]))
+					condition += self.get_user_permission_values_condition(df.fieldname, df.options,
+						user_permission_values)
 				else:
 					condition = cond
 
@@ -523,10 +588,87 @@ class DatabaseQuery(object):
 
 	def add_limit(self):
 		if self.limit_page_length:
+			if self.after is not None:
+				# the cursor conditions replace the offset
+				return 'limit %s' % self.limit_page_length
+
 			return 'limit %s, %s' % (self.limit_start, self.limit_page_length)
 		else:
 			return ''
 
+	def get_cursor_columns(self, order_by):
+		"""Returns list of `(column, descending)` for the order by columns, ending with `name`"""
+		columns = []
+		for part in [p.strip() for p in order_by.split(",") if p.strip()]:
+			match = cursor_column_pattern.match(part)
+			if not match:
+				frappe.throw(_("Cannot page by cursor when ordered by {0}").format(part))
+
+			column, fieldname, order = match.group(1), match.group(2), match.group(3)
+			columns.append((column, (order or "asc").lower()=="desc"))
+
+			if fieldname=="name" and column.strip("`").split("`.`")[0] in ("name", "tab" + self.doctype):
+				# name is unique, no need to order further
+				return columns
+
+		# name as tie breaker, so that every row has a unique position
+		columns.append(("`tab{0}`.`name`".format(self.doctype), columns[-1][1] if columns else False))
+		return columns
+
+	def add_cursor_conditions(self, args):
+		"""Order by unique columns, fetch their values as hidden fields and
+		add conditions to only select rows after the cursor"""
+		if self.group_by or self.distinct:
+			frappe.throw(_("Cannot page by cursor with group by or distinct"))
+
+		if len(self.tables) > 1:
+			# rows of joined child tables share the parent's position
+			frappe.throw(_("Cannot page by cursor with fields or filters of child tables"))
+
+		self.cursor_columns = self.get_cursor_columns(args.order_by or "")
+
+		args.order_by = ", ".join(["{0} {1}".format(column, "desc" if descending else "asc")
+			for column, descending in self.cursor_columns])
+
+		args.fields += "".join([", {0} as `_cursor_{1}`".format(column, i)
+			for i, (column, descending) in enumerate(self.cursor_columns)])
+
+		if not self.after:
+			return
+
+		values = decode_cursor(self.after)
+		if len(values) != len(self.cursor_columns):
+			frappe.throw(_("Invalid cursor"))
+
+		# (a > x) or (a = x and b > y) or (a = x and b = y and name > z)
+		conditions = []
+		for i, (column, descending) in enumerate(self.cursor_columns):
+			parts = [get_cursor_equal_condition(c, values[j]) for j, (c, d) in enumerate(self.cursor_columns[:i])]
+			parts.append(get_cursor_after_condition(column, descending, values[i]))
+			conditions.append("({0})".format(" and ".join(parts)))
+
+		cursor_condition = "({0})".format(" or ".join(conditions))
+		args.conditions = "({0}) and {1}".format(args.conditions, cursor_condition) \
+			if args.conditions else cursor_condition
+
+	def set_next_cursor(self, result):
+		"""Remove the hidden cursor fields and set `next_cursor` if there may be more rows"""
+		count = len(self.cursor_columns)
+		if not result:
+			return result
+
+		if self.as_list:
+			last_values = result[-1][-count:]
+			result = [row[:-count] for row in result]
+		else:
+			for row in result:
+				last_values = [row.pop("_cursor_{0}".format(i)) for i in range(count)]
+
+		if self.limit_page_length and len(result) >= self.limit_page_length:
+			self.next_cursor = encode_cursor(last_values)
+
+		return result
+
 	def add_comment_count(self, result):
 		for r in result:
 			if not r.name:
@@ -571,3 +713,134 @@ def get_order_by(doctype, meta):
 		order_by = "`tab{0}`.docstatus asc, {1}".format(doctype, order_by)
 
 	return order_by
+
+# `tabDocType`.`field` [asc|desc] or field [asc|desc]
+cursor_time_pattern = re.compile(r"^-?\d+:\d{2}:\d{2}\.\d{6}$")
+
+cursor_column_pattern = re.compile(r"^((?:`?tab[^`.]+`?\.)?`?(\w+)`?)(?:\s+(asc|desc))?$", re.I)
+
+# `tabDocType` in fields
+table_pattern = re.compile(r"`tab[^`]+`")
+
+def can_page_by_cursor(order_by=None, group_by=None, distinct=False, doctype=None, fields=None,
+	filters=None, or_filters=None):
+	"""Returns True if a query with these arguments can be paged with `after`"""
+	if group_by or distinct:
+		return False
+
+	if doctype and uses_child_tables(doctype, fields, filters, or_filters):
+		return False
+
+	return all(cursor_column_pattern.match(part.strip())
+		for part in (order_by or "").split(",") if part.strip())
+
+def uses_child_tables(doctype, fields=None, filters=None, or_filters=None):
+	"""Returns True if fields or filters refer to tables other than the one of `doctype`"""
+	if isinstance(fields, string_types):
+		fields = fields.split(",")
+
+	main_table = "`tab{0}`".format(doctype)
+	for field in fields or []:
+		if any(table != main_table for table in table_pattern.findall(field)):
+			return True
+
+	for _filters in (filters, or_filters):
+		if isinstance(_filters, (list, tuple)):
+			for f in _filters:
+				# [doctype, fieldname, operator, value]
+				if isinstance(f, (list, tuple)) and len(f) > 3 and f[0] != doctype:
+					return True
+
+	return False
+
+def encode_cursor(values):
+	"""Returns cursor of the values of the last row, each as `[type, text]` so that it is
+	compared with the column as the same type"""
+	return base64.urlsafe_b64encode(json.dumps([get_typed_cursor_value(v) for v in values])
+		.encode("utf-8")).decode("utf-8")
+
+def decode_cursor(cursor):
+	try:
+		values = json.loads(base64.urlsafe_b64decode(cstr(cursor).encode("utf-8")).decode("utf-8"))
+	except (TypeError, ValueError):
+		values = None
+
+	if not isinstance(values, list):
+		frappe.throw(_("Invalid cursor"))
+
+	return values
+
+def get_typed_cursor_value(value):
+	if value is None:
+		return None
+	elif isinstance(value, bool) or isinstance(value, integer_types):
+		return ["int", str(int(value))]
+	elif isinstance(value, float):
+		return ["float", repr(value)]
+	elif isinstance(value, Decimal):
+		return ["decimal", str(value)]
+	elif isinstance(value, datetime):
+		return ["datetime", value.strftime("%Y-%m-%d %H:%M:%S.%f")]
+	elif isinstance(value, date):
+		return ["date", value.strftime("%Y-%m-%d")]
+	elif isinstance(value, timedelta):
+		return ["time", format_timedelta(value)]
+
+	return ["text", cstr(value)]
+
+def format_timedelta(value):
+	seconds = value.days * 86400 + value.seconds
+	sign = "-" if seconds < 0 else ""
+	seconds = abs(seconds)
+	return "{0}{1:02d}:{2:02d}:{3:02d}.{4:06d}".format(sign, seconds // 3600, seconds // 60 % 60,
+		seconds % 60, value.microseconds)
+
+def get_cursor_literal(value):
+	"""Returns SQL literal of a typed cursor value. Only text is quoted, dates and times are
+	cast explicitly instead of relying on implicit conversion of strings."""
+	if not (isinstance(value, list) and len(value)==2):
+		frappe.throw(_("Invalid cursor"))
+
+	value_type, text = value[0], cstr(value[1])
+	try:
+		if value_type=="int":
+			return str(int(text))
+		elif value_type=="float":
+			return repr(float(text))
+		elif value_type=="decimal":
+			return str(Decimal(text))
+		elif value_type=="datetime":
+			datetime.strptime(text, "%Y-%m-%d %H:%M:%S.%f")
+			return "cast('{0}' as datetime(6))".format(text)
+		elif value_type=="date":
+			datetime.strptime(text, "%Y-%m-%d")
+			return "cast('{0}' as date)".format(text)
+		elif value_type=="time" and cursor_time_pattern.match(text):
+			return "cast('{0}' as time(6))".format(text)
+		elif value_type=="text":
+			return "'{0}'".format(frappe.db.escape(text, percent=False))
+	except (ValueError, InvalidOperation):
+		pass
+
+	frappe.throw(_("Invalid cursor"))
+
+def get_cursor_equal_condition(column, value):
+	if value is None:
+		return "{0} is null".format(column)
+
+	return "{0} = {1}".format(column, get_cursor_literal(value))
+
+def get_cursor_after_condition(column, descending, value):
+	"""Condition for rows sorted after `value` (nulls sort first in ascending order)"""
+	if value is None:
+		return "0" if descending else "{0} is not null".format(column)
+
+	value = get_cursor_literal(value)
+	if descending:
+		return "({0} < {1} or {0} is null)".format(column, value)
+
+	return "{0} > {1}".format(column, value)
+
+def get_permission_subquery_threshold():
+	threshold = frappe.conf.get("permission_subquery_threshold")
+	return PERMISSION_SUBQUERY_THRESHOLD if threshold is None else cint(threshold)
@@ -7,11 +7,13 @@ import time
 from frappe import _, msgprint
 from frappe.utils import flt, cstr, now, get_datetime_str, file_lock
 from frappe.utils.background_jobs import enqueue
-from frappe.model.base_document import BaseDocument, get_controller
+from frappe.model.base_document import (BaseDocument, get_controller, db_insert_multiple,
+	get_link_values)
 from frappe.model.naming import set_new_name
 from six import iteritems, string_types
 from werkzeug.exceptions import NotFound, Forbidden
 import hashlib, json
+from collections import OrderedDict
 from frappe.model import optional_fields
 from frappe.utils.file_manager import save_url
 from frappe.utils.global_search import update_global_search
@@ -69,6 +71,70 @@ def get_doc(*args, **kwargs):
 
 	raise ImportError(doctype)
 
+def get_docs(doctype, names):
+	"""Returns a list of `frappe.model.Document` objects for the given names, loading
+	parents with one query and child rows with one query per child doctype.
+
+	:param doctype: DocType name.
+	:param names: List of document names.
+
+		# load users with their roles
+		users = get_docs("User", ["test@example.com", "test1@example.com"])
+	"""
+	meta = frappe.get_meta(doctype)
+	if meta.issingle:
+		return [get_doc(doctype)]
+
+	names = list(OrderedDict.fromkeys(names))
+	if not names:
+		return []
+
+	parents = frappe.db.sql("""select * from `tab{0}` where name in ({1})""".format(doctype,
+		", ".join(["%s"] * len(names))), names, as_dict=True)
+	# names are case insensitive in the database
+	parents = dict((cstr(d.name).lower(), d) for d in parents)
+
+	table_fields = meta.get_table_fields()
+	children = get_children_from_db(doctype, [d.name for d in parents.values()], table_fields)
+
+	docs = []
+	for name in names:
+		d = parents.get(cstr(name).lower())
+		if not d:
+			frappe.throw(_("{0} {1} not found").format(_(doctype), name), frappe.DoesNotExistError)
+
+		d = d.copy()
+		d.doctype = doctype
+		for df in table_fields:
+			d[df.fieldname] = children.get(d.name, {}).get(df.fieldname, [])
+
+		docs.append(get_doc(d))
+
+	return docs
+
+def get_children_from_db(parenttype, parents, table_fields):
+	"""Returns child rows of the given parents as `{parent: {parentfield: [rows]}}`.
+	Runs one query per child doctype, even if it is used in multiple table fields."""
+	fields_by_doctype = OrderedDict()
+	for df in table_fields:
+		fields_by_doctype.setdefault(df.options, []).append(df.fieldname)
+
+	out = {}
+	if not parents:
+		return out
+
+	for child_doctype, fieldnames in iteritems(fields_by_doctype):
+		rows = frappe.db.sql("""select * from `tab{0}`
+			where parenttype=%s and parent in ({1}) and parentfield in ({2})
+			order by idx asc""".format(child_doctype, ", ".join(["%s"] * len(parents)),
+				", ".join(["%s"] * len(fieldnames))),
+			[parenttype] + list(parents) + fieldnames, as_dict=True)
+
+		for row in rows:
+			out.setdefault(row.parent, {}).setdefault(row.parentfield, []).append(row)
+
+	return out
+
 class Document(BaseDocument):
 	"""All controllers inherit from `Document`."""
 	def __init__(self, *args, **kwargs):
@@ -147,14 +213,9 @@ class Document(BaseDocument):
 		else:
 			table_fields = self.meta.get_table_fields()
 
+		children = get_children_from_db(self.doctype, [self.name], table_fields).get(self.name, {})
 		for df in table_fields:
-			children = frappe.db.get_values(df.options,
-				{"parent": self.name, "parenttype": self.doctype, "parentfield": df.fieldname},
-				"*", as_dict=True, order_by="idx asc")
-			if children:
-				self.set(df.fieldname, children)
-			else:
-				self.set(df.fieldname, [])
+			self.set(df.fieldname, children.get(df.fieldname, []))
 
 		# sometimes __setup__ can depend on child values, hence calling again at the end
 		if hasattr(self, "__setup__"):
@@ -233,8 +294,7 @@ class Document(BaseDocument):
 					raise e
 
 		# children
-		for d in self.get_all_children():
-			d.db_insert()
+		db_insert_multiple(self.get_all_children())
 
 		self.run_method("after_insert")
 		self.flags.in_insert = True
@@ -325,13 +385,20 @@ class Document(BaseDocument):
 
 	def update_child_table(self, fieldname, df=None):
 		'''sync child table for given fieldname'''
-		rows = []
+		new_rows = []
 		if not df:
 			df = self.meta.get_field(fieldname)
 
 		for d in self.get(df.fieldname):
-			d.db_update()
-			rows.append(d.name)
+			if d.get("__islocal") or not d.name:
+				new_rows.append(d)
+			else:
+				d.db_update()
+
+		# insert new rows in batches
+		db_insert_multiple(new_rows)
+
+		rows = [d.name for d in self.get(df.fieldname)]
 
 		if df.options in (self.flags.ignore_children_type or []):
 			# do not delete rows for this because of flags
@@ -339,15 +406,11 @@ class Document(BaseDocument):
 			return
 
 		if rows:
-			# select rows that do not match the ones in the document
-			deleted_rows = frappe.db.sql("""select name from `tab{0}` where parent=%s
+			# delete rows that do not match the ones in the document
+			frappe.db.sql("""delete from `tab{0}` where parent=%s
 				and parenttype=%s and parentfield=%s
 				and name not in ({1})""".format(df.options, ','.join(['%s'] * len(rows))),
 					[self.name, self.doctype, fieldname] + rows)
-			if len(deleted_rows) > 0:
-				# delete rows that do not match the ones in the document
-				frappe.db.sql("""delete from `tab{0}` where name in ({1})""".format(df.options,
-					','.join(['%s'] * len(deleted_rows))), tuple(row[0] for row in deleted_rows))
 
 		else:
 			# no rows found, delete all rows
@@ -468,13 +531,13 @@ class Document(BaseDocument):
 
 		has_access_to = self.get_permlevel_access('read')
 
-		for df in self.meta.fields:
-			if df.permlevel and not df.permlevel in has_access_to:
+		for df in self.meta.get_high_permlevel_fields():
+			if not df.permlevel in has_access_to:
 				self.set(df.fieldname, None)
 
 		for table_field in self.meta.get_table_fields():
-			for df in frappe.get_meta(table_field.options).fields or []:
-				if df.permlevel and not df.permlevel in has_access_to:
+			for df in frappe.get_meta(table_field.options).get_high_permlevel_fields():
+				if not df.permlevel in has_access_to:
 					for child in self.get(table_field.fieldname) or []:
 						child.set(df.fieldname, None)
 
@@ -658,10 +721,14 @@ class Document(BaseDocument):
 		if self.flags.ignore_links or self._action == "cancel":
 			return
 
-		invalid_links, cancelled_links = self.get_invalid_links()
+		children = self.get_all_children()
+		link_values = get_link_values([self] + children)
 
-		for d in self.get_all_children():
-			result = d.get_invalid_links(is_submittable=self.meta.is_submittable)
+		invalid_links, cancelled_links = self.get_invalid_links(link_values=link_values)
+
+		for d in children:
+			result = d.get_invalid_links(is_submittable=self.meta.is_submittable,
+				link_values=link_values)
 			invalid_links.extend(result[0])
 			cancelled_links.extend(result[1])
 
@@ -17,11 +17,13 @@ Example:
 
 from __future__ import unicode_literals, print_function
 from six.moves import range
-import frappe, json, os
+from six.moves import cPickle as pickle
+from six import iteritems, string_types
+import frappe, json, os, zlib
 from frappe.utils import cstr, cint
 from frappe.model import default_fields, no_value_fields, optional_fields
 from frappe.model.document import Document
-from frappe.model.base_document import BaseDocument
+from frappe.model.base_document import BaseDocument, get_controller
 from frappe.model.db_schema import type_map
 from frappe.modules import load_doctype_module
 from frappe import _
@@ -29,8 +31,12 @@ from frappe import _
 def get_meta(doctype, cached=True):
 	if cached:
 		if not frappe.local.meta_cache.get(doctype):
-			frappe.local.meta_cache[doctype] = frappe.cache().hget("meta", doctype,
-				lambda: Meta(doctype))
+			meta = frappe.cache().hget("meta", doctype)
+			if not meta:
+				# not cached, or cached as a snapshot of an older version
+				meta = Meta(doctype)
+				frappe.cache().hset("meta", doctype, meta)
+			frappe.local.meta_cache[doctype] = meta
 		return frappe.local.meta_cache[doctype]
 	else:
 		return load_meta(doctype)
@@ -59,13 +65,26 @@ def load_doctype_from_file(doctype):
 
 	return txt
 
+# bump when the snapshot structure changes, older snapshots are rebuilt from the database
+META_SNAPSHOT_VERSION = 1
+
+# lazily built attributes that are not stored in the snapshot
+META_SNAPSHOT_EXCLUDE = ("_meta", "_field_index", "_table_fields")
+
 class Meta(Document):
 	_metaclass = True
 	default_fields = list(default_fields)[1:]
 	special_doctypes = ("DocField", "DocPerm", "Role", "DocType", "Module Def")
 
+	def __reduce_ex__(self, protocol):
+		"""Pickle as a compact snapshot of plain dicts instead of the full object graph,
+		unless `meta_cache_format` is set to `object` in site config."""
+		if get_meta_cache_conf("meta_cache_format")=="object":
+			return super(Meta, self).__reduce_ex__(protocol)
+
+		return (load_meta_snapshot, (self.__class__, get_meta_snapshot(self)))
+
 	def __init__(self, doctype):
-		self._fields = {}
 		if isinstance(doctype, Document):
 			super(Meta, self).__init__(doctype.as_dict())
 		else:
@@ -81,17 +100,75 @@ class Meta(Document):
 			else:
 				raise
 
+	def get(self, key=None, filters=None, limit=None, default=None):
+		# filtering fields on fieldtype alone is served from the field index
+		if key=="fields" and isinstance(filters, dict) and len(filters)==1 \
+			and "fieldtype" in filters and not limit:
+			fieldtype = filters["fieldtype"]
+			if isinstance(fieldtype, (list, tuple)) and len(fieldtype)==2 and fieldtype[0]=="=":
+				fieldtype = fieldtype[1]
+
+			if isinstance(fieldtype, string_types):
+				return list(self.get_field_index().by_fieldtype.get(fieldtype, ()))
+
+		return super(Meta, self).get(key, filters, limit=limit, default=default)
+
+	def get_field_index(self):
+		if not self.__dict__.get("_field_index"):
+			self.build_field_index()
+
+		return self._field_index
+
+	def build_field_index(self):
+		"""Build lookups on `fields` (by fieldname, fieldtype, fetch source etc.), so that
+		accessors do not need to scan all fields on every call. Rebuilt at the end of `process`."""
+		fields = self.__dict__.get("fields") or []
+
+		by_fieldname = {}
+		by_fieldtype = {}
+		fields_to_fetch = {}
+		fetch_fields = []
+		for df in fields:
+			by_fieldname[df.fieldname] = df
+			by_fieldtype.setdefault(df.fieldtype, []).append(df)
+
+			if df.fieldtype in ('Data', 'Read Only', 'Text', 'Small Text',
+				'Text Editor', 'Code') and df.options and '.' in df.options:
+				fields_to_fetch.setdefault(df.options.split('.', 1)[0], []).append(df)
+				fetch_fields.append(df)
+
+		link_fields = tuple(df for df in by_fieldtype.get("Link", ())
+			if df.options != "[Select]")
+		link_fieldnames = frozenset(df.fieldname for df in link_fields)
+
+		self._field_index = frappe._dict({
+			"by_fieldname": by_fieldname,
+			"by_fieldtype": dict((fieldtype, tuple(dfs)) for fieldtype, dfs in iteritems(by_fieldtype)),
+			"link_fields": link_fields,
+			"select_fields": tuple(df for df in by_fieldtype.get("Select", ())
+				if df.options not in ("[Select]", "Loading...")),
+			"fields_to_fetch": dict((fieldname, tuple(dfs)) for fieldname, dfs in iteritems(fields_to_fetch)),
+			"linked_fields_to_fetch": tuple(df for df in fetch_fields
+				if df.options.split('.', 1)[0] in link_fieldnames),
+			"mandatory_fields": tuple(df for df in fields if df.reqd==1),
+			"high_permlevel_fields": tuple(df for df in fields if cint(df.permlevel) > 0),
+			"fieldnames_with_value": tuple(df.fieldname for df in fields
+				if df.fieldtype not in no_value_fields)
+		})
+
+		self.__dict__.pop("_table_fields", None)
+
 	def get_link_fields(self):
-		return self.get("fields", {"fieldtype": "Link", "options":["!=", "[Select]"]})
+		return list(self.get_field_index().link_fields)
 
 	def get_dynamic_link_fields(self):
-		if not hasattr(self, '_dynamic_link_fields'):
-			self._dynamic_link_fields = self.get("fields", {"fieldtype": "Dynamic Link"})
-		return self._dynamic_link_fields
+		return list(self.get_field_index().by_fieldtype.get("Dynamic Link", ()))
 
 	def get_select_fields(self):
-		return self.get("fields", {"fieldtype": "Select", "options":["not in",
-			["[Select]", "Loading..."]]})
+		return list(self.get_field_index().select_fields)
+
+	def get_mandatory_fields(self):
+		return list(self.get_field_index().mandatory_fields)
 
 	def get_image_fields(self):
 		return self.get("fields", {"fieldtype": "Attach Image"})
@@ -128,11 +205,7 @@ class Meta(Document):
 
 	def get_field(self, fieldname):
 		'''Return docfield from meta'''
-		if not self._fields:
-			for f in self.get("fields"):
-				self._fields[f.fieldname] = f
-
-		return self._fields.get(fieldname)
+		return self.get_field_index().by_fieldname.get(fieldname)
 
 	def has_field(self, fieldname):
 		'''Returns True if fieldname exists'''
@@ -183,24 +256,12 @@ class Meta(Document):
 		These fields are of type Data, Link, Text, Readonly and their
 		options property is set as `link_fieldname`.`source_fieldname`'''
 
-		out = []
+		field_index = self.get_field_index()
 
-		if not link_fieldname:
-			link_fields = [df.fieldname for df in self.get_link_fields()]
-
-		for df in self.fields:
-			if df.fieldtype in ('Data', 'Read Only', 'Text', 'Small Text',
-				'Text Editor', 'Code') and df.options:
-				if link_fieldname:
-					if df.options.startswith(link_fieldname + '.'):
-						out.append(df)
-				else:
-					if '.' in df.options:
-						fieldname = df.options.split('.', 1)[0]
-						if fieldname in link_fields:
-							out.append(df)
+		if link_fieldname:
+			return list(field_index.fields_to_fetch.get(link_fieldname, ()))
 
-		return out
+		return list(field_index.linked_fields_to_fetch)
 
 	def get_list_fields(self):
 		list_fields = ["name"] + [d.fieldname \
@@ -232,6 +293,7 @@ class Meta(Document):
 		self.add_custom_fields()
 		self.apply_property_setters()
 		self.sort_fields()
+		self.build_field_index()
 		self.get_valid_columns()
 		self.set_custom_permissions()
 
@@ -325,7 +387,7 @@ class Meta(Document):
 				self.permissions = [Document(d) for d in custom_perms]
 
 	def get_fieldnames_with_value(self):
-		return [df.fieldname for df in self.fields if df.fieldtype not in no_value_fields]
+		return list(self.get_field_index().fieldnames_with_value)
 
 
 	def get_fields_to_check_permissions(self, user_permission_doctypes):
@@ -347,13 +409,7 @@ class Meta(Document):
 
 	def get_high_permlevel_fields(self):
 		"""Build list of fields with high perm level and all the higher perm levels defined."""
-		if not hasattr(self, "high_permlevel_fields"):
-			self.high_permlevel_fields = []
-			for df in self.fields:
-				if df.permlevel > 0:
-					self.high_permlevel_fields.append(df)
-
-		return self.high_permlevel_fields
+		return list(self.get_field_index().high_permlevel_fields)
 
 	def get_dashboard_data(self):
 		'''Returns dashboard setup related to this doctype.
@@ -384,6 +440,67 @@ class Meta(Document):
 				module_name = module_name, doctype_name = doctype, suffix=suffix)
 		return None
 
+def get_meta_snapshot(meta):
+	"""Returns a versioned, serialized snapshot of the meta object.
+
+	Child documents are stored as plain dicts and the snapshot is pickled with the
+	highest protocol and zlib compressed if it is larger than
+	`meta_cache_compress_threshold` bytes (site config, disabled by default)."""
+	data = {}
+	for key, value in iteritems(meta.__dict__):
+		if key in META_SNAPSHOT_EXCLUDE:
+			continue
+
+		if isinstance(value, list) and value and isinstance(value[0], BaseDocument):
+			value = SnapshotRows([(d.doctype, d.__dict__.get("parent_doc") is meta,
+				dict((k, v) for k, v in iteritems(d.__dict__) if k not in ("parent_doc", "_meta")))
+				for d in value])
+
+		data[key] = value
+
+	payload = pickle.dumps(data, pickle.HIGHEST_PROTOCOL)
+
+	compressed = False
+	threshold = cint(get_meta_cache_conf("meta_cache_compress_threshold"))
+	if threshold and len(payload) > threshold:
+		payload = zlib.compress(payload)
+		compressed = True
+
+	return (META_SNAPSHOT_VERSION, compressed, payload)
+
+def load_meta_snapshot(meta_class, snapshot):
+	"""Rebuild meta object from a snapshot created by `get_meta_snapshot`."""
+	version, compressed, payload = snapshot
+	if version != META_SNAPSHOT_VERSION:
+		return None
+
+	if compressed:
+		payload = zlib.decompress(payload)
+
+	meta = meta_class.__new__(meta_class)
+	for key, value in iteritems(pickle.loads(payload)):
+		if isinstance(value, SnapshotRows):
+			value = [load_snapshot_row(meta, *row) for row in value]
+		meta.__dict__[key] = value
+
+	return meta
+
+def load_snapshot_row(meta, doctype, is_child, values):
+	controller = get_controller(doctype)
+	d = controller.__new__(controller)
+	d.__dict__.update(values)
+	if is_child:
+		d.parent_doc = meta
+	return d
+
+def get_meta_cache_conf(key):
+	conf = getattr(frappe.local, "conf", None) or {}
+	return conf.get(key)
+
+class SnapshotRows(list):
+	"""List of child documents as `(doctype, is_child, values)` in a meta snapshot."""
+	pass
+
 doctype_table_fields = [
 	frappe._dict({"fieldname": "fields", "options": "DocField"}),
 	frappe._dict({"fieldname": "permissions", "options": "DocPerm"})
@@ -497,6 +614,7 @@ def trim_tables(doctype=None):
 			frappe.db.sql_ddl(query)
 
 def clear_cache(doctype=None):
+	from frappe.permissions import clear_role_permissions_cache
 	cache = frappe.cache()
 
 	if getattr(frappe.local, 'meta_cache') and (doctype in frappe.local.meta_cache):
@@ -512,6 +630,8 @@ def clear_cache(doctype=None):
 		for name in groups:
 			cache.hdel(name, dt)
 
+		clear_role_permissions_cache(dt)
+
 	if doctype:
 		clear_single(doctype)
 
@@ -528,3 +648,5 @@ def clear_cache(doctype=None):
 		# clear all
 		for name in groups:
 			cache.delete_value(name)
+
+		clear_role_permissions_cache()
@@ -4,9 +4,9 @@
 from __future__ import unicode_literals, print_function
 from six.moves import range
 from six import string_types
-import frappe, copy, json
+import frappe, copy, json, hashlib
 from frappe import _, msgprint
-from frappe.utils import cint
+from frappe.utils import cint, cstr
 import frappe.share
 rights = ("read", "write", "create", "delete", "submit", "cancel", "amend",
 	"print", "email", "report", "import", "export", "set_user_permissions", "share")
@@ -48,18 +48,17 @@ def has_permission(doctype, ptype="read", doc=None, verbose=False, user=None):
 
 	def false_if_not_shared():
 		if ptype in ("read", "write", "share", "email", "print"):
-			shared = frappe.share.get_shared(doctype, user,
-				["read" if ptype in ("email", "print") else ptype])
+			right = "read" if ptype in ("email", "print") else ptype
 
 			if doc:
 				doc_name = doc if isinstance(doc, string_types) else doc.name
-				if doc_name in shared:
+				if frappe.share.is_shared(doctype, doc_name, user, right):
 					if verbose: print("Shared")
 					if ptype in ("read", "write", "share") or meta.permissions[0].get(ptype):
 						if verbose: print("Is shared")
 						return True
 
-			elif shared:
+			elif frappe.share.get_shared_count(doctype, user, right):
 				# if atleast one shared doc of that type, then return True
 				# this is used in db_query to check if permission on DocType
 				if verbose: print("Has a shared document")
@@ -181,77 +180,102 @@ def get_role_permissions(meta, user=None, verbose=False):
 	cache_key = (meta.name, user)
 
 	if not frappe.local.role_permissions.get(cache_key):
-		perms = frappe._dict(
-			apply_user_permissions={},
-			user_permission_doctypes={},
-			if_owner={}
-		)
 		roles = frappe.get_roles(user)
-		dont_match = []
-		has_a_role_with_apply_user_permissions = False
-
-		for p in meta.permissions:
-			if cint(p.permlevel)==0 and (p.role in roles):
-				# apply only for level 0
-
-				for ptype in rights:
-					# build if_owner dict if applicable for this right
-					perms[ptype] = perms.get(ptype, 0) or cint(p.get(ptype))
-
-					if ptype != "set_user_permissions" and p.get(ptype):
-						perms["apply_user_permissions"][ptype] = (perms["apply_user_permissions"].get(ptype, 1)
-							and p.get("apply_user_permissions"))
-
-					if p.if_owner and p.get(ptype):
-						perms["if_owner"][ptype] = 1
-
-					if p.get(ptype) and not p.if_owner and not p.get("apply_user_permissions"):
-						dont_match.append(ptype)
-
-				if p.apply_user_permissions:
-					has_a_role_with_apply_user_permissions = True
-
-					if p.user_permission_doctypes:
-						# set user_permission_doctypes in perms
-						try:
-							user_permission_doctypes = json.loads(p.user_permission_doctypes)
-						except ValueError:
-							user_permission_doctypes = []
-					else:
-						user_permission_doctypes = get_linked_doctypes(meta.name)
-
-					if user_permission_doctypes:
-						# perms["user_permission_doctypes"][ptype] would be a list of list like [["User", "Blog Post"], ["User"]]
-						for ptype in rights:
-							if p.get(ptype):
-								perms["user_permission_doctypes"].setdefault(ptype, []).append(user_permission_doctypes)
-
-		# if atleast one record having both Apply User Permission and If Owner unchecked is found,
-		# don't match for those rights
-		for ptype in rights:
-			if ptype in dont_match:
-				if perms["apply_user_permissions"].get(ptype):
-					del perms["apply_user_permissions"][ptype]
 
-				if perms["if_owner"].get(ptype):
-					del perms["if_owner"][ptype]
+		# evaluated permissions only depend on the roles and the DocType,
+		# so they are shared across requests and users with the same roles
+		perms = frappe.cache().hget(get_role_permissions_cache_name(meta.name),
+			get_role_permissions_cache_key(meta, roles),
+			lambda: evaluate_role_permissions(meta, roles))
+
+		frappe.local.role_permissions[cache_key] = perms
+
+	return frappe.local.role_permissions[cache_key]
+
+def evaluate_role_permissions(meta, roles):
+	"""Returns role permissions of DocType `meta` for the given roles, see `get_role_permissions`"""
+	perms = frappe._dict(
+		apply_user_permissions={},
+		user_permission_doctypes={},
+		if_owner={}
+	)
+	dont_match = []
+	has_a_role_with_apply_user_permissions = False
+
+	for p in meta.permissions:
+		if cint(p.permlevel)==0 and (p.role in roles):
+			# apply only for level 0
 
-		# if one row has only "Apply User Permissions" checked and another has only "If Owner" checked,
-		# set Apply User Permissions as checked
-		# i.e. the case when there is a role with apply_user_permissions as 1, but resultant apply_user_permissions is 0
-		if has_a_role_with_apply_user_permissions:
 			for ptype in rights:
-				if perms["if_owner"].get(ptype) and perms["apply_user_permissions"].get(ptype)==0:
-					perms["apply_user_permissions"][ptype] = 1
+				# build if_owner dict if applicable for this right
+				perms[ptype] = perms.get(ptype, 0) or cint(p.get(ptype))
+
+				if ptype != "set_user_permissions" and p.get(ptype):
+					perms["apply_user_permissions"][ptype] = (perms["apply_user_permissions"].get(ptype, 1)
+						and p.get("apply_user_permissions"))
+
+				if p.if_owner and p.get(ptype):
+					perms["if_owner"][ptype] = 1
+
+				if p.get(ptype) and not p.if_owner and not p.get("apply_user_permissions"):
+					dont_match.append(ptype)
+
+			if p.apply_user_permissions:
+				has_a_role_with_apply_user_permissions = True
+
+				if p.user_permission_doctypes:
+					# set user_permission_doctypes in perms
+					try:
+						user_permission_doctypes = json.loads(p.user_permission_doctypes)
+					except ValueError:
+						user_permission_doctypes = []
+				else:
+					user_permission_doctypes = get_linked_doctypes(meta.name)
+
+				if user_permission_doctypes:
+					# perms["user_permission_doctypes"][ptype] would be a list of list like [["User", "Blog Post"], ["User"]]
+					for ptype in rights:
+						if p.get(ptype):
+							perms["user_permission_doctypes"].setdefault(ptype, []).append(user_permission_doctypes)
+
+	# if atleast one record having both Apply User Permission and If Owner unchecked is found,
+	# don't match for those rights
+	for ptype in rights:
+		if ptype in dont_match:
+			if perms["apply_user_permissions"].get(ptype):
+				del perms["apply_user_permissions"][ptype]
+
+			if perms["if_owner"].get(ptype):
+				del perms["if_owner"][ptype]
+
+	# if one row has only "Apply User Permissions" checked and another has only "If Owner" checked,
+	# set Apply User Permissions as checked
+	# i.e. the case when there is a role with apply_user_permissions as 1, but resultant apply_user_permissions is 0
+	if has_a_role_with_apply_user_permissions:
+		for ptype in rights:
+			if perms["if_owner"].get(ptype) and perms["apply_user_permissions"].get(ptype)==0:
+				perms["apply_user_permissions"][ptype] = 1
 
-		# delete 0 values
-		for key, value in list(perms.get("apply_user_permissions").items()):
-			if not value:
-				del perms["apply_user_permissions"][key]
+	# delete 0 values
+	for key, value in list(perms.get("apply_user_permissions").items()):
+		if not value:
+			del perms["apply_user_permissions"][key]
 
-		frappe.local.role_permissions[cache_key] = perms
+	return perms
 
-	return frappe.local.role_permissions[cache_key]
+def get_role_permissions_cache_name(doctype):
+	return "role_permissions::" + doctype
+
+def get_role_permissions_cache_key(meta, roles):
+	"""Returns hash of the roles and DocType version"""
+	return hashlib.md5("\n".join([cstr(meta.modified)] + sorted(set(roles))).encode("utf-8")).hexdigest()
+
+def clear_role_permissions_cache(doctype=None):
+	"""Clear role permissions cached in redis for the given DocType (all DocTypes if not set)"""
+	if doctype:
+		frappe.cache().delete_value(get_role_permissions_cache_name(doctype))
+	else:
+		frappe.cache().delete_keys("role_permissions::")
 
 def get_user_permissions(user):
 	from frappe.core.doctype.user_permission.user_permission import get_user_permissions
@@ -485,6 +509,8 @@ def update_permission_property(doctype, role, permlevel, ptype, value=None, vali
 	frappe.db.sql("""
 		update `tabCustom DocPerm`
 		set `{0}`=%s where name=%s""".format(ptype), (value, name))
+	clear_role_permissions_cache(doctype)
+
 	if validate:
 		validate_permissions_for_doctype(doctype)
 
@@ -534,6 +560,7 @@ def reset_perms(doctype):
 	delete_notification_count_for(doctype)
 
 	frappe.db.sql("""delete from `tabCustom DocPerm` where parent=%s""", doctype)
+	clear_role_permissions_cache(doctype)
 
 def get_linked_doctypes(dt):
 	return list(set([dt] + [d.options for d in
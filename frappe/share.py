@@ -2,10 +2,19 @@
 # MIT License. See license.txt
 
 from __future__ import unicode_literals
+import redis
 import frappe
 from frappe import _
 from frappe.utils import cint
 
+SHARE_RIGHTS = ("read", "write", "share")
+
+# marker member of cached sets of shared documents, as redis does not store empty sets
+LOADED = ""
+
+# cached sets are kept up to date on change of DocShare, and rebuilt after this time
+SHARE_SET_EXPIRY = 6 * 3600
+
 @frappe.whitelist()
 def add(doctype, name, user=None, read=1, write=0, share=0, everyone=0, flags=None, notify=0):
 	"""Share the given document with a user."""
@@ -107,6 +116,10 @@ def get_shared(doctype, user=None, rights=None):
 	if not rights:
 		rights = ["read"]
 
+	if len(rights)==1:
+		return list(get_shared_names(doctype, user, rights[0]))
+
+	# all rights must be given by the same share
 	condition = " and ".join(["`{0}`=1".format(right) for right in rights])
 
 	return frappe.db.sql_list("""select share_name from tabDocShare
@@ -114,6 +127,133 @@ def get_shared(doctype, user=None, rights=None):
 			condition=condition, everyone="or everyone=1" if user!="Guest" else ""),
 		(user, doctype))
 
+def is_shared(doctype, name, user=None, right="read"):
+	"""Returns True if the document is shared with the user (or everyone) with `right`."""
+	if not user:
+		user = frappe.session.user
+
+	if has_pending_changes():
+		return name in get_shared_names(doctype, user, right)
+
+	share_users = get_share_users(user)
+	try:
+		members = frappe.cache().sismember_many([(get_share_set_key(doctype, u, right), value)
+			for u in share_users for value in (LOADED, name)])
+	except redis.exceptions.ConnectionError:
+		return name in get_shared_names(doctype, user, right)
+
+	for i, u in enumerate(share_users):
+		loaded, shared = members[2 * i], members[2 * i + 1]
+		if not loaded:
+			shared = name in load_share_set(doctype, u, right)
+
+		if shared:
+			return True
+
+	return False
+
+def get_shared_count(doctype, user=None, right="read"):
+	"""Returns number of documents shared with the user, counting documents shared with
+	both the user and everyone twice. Used to choose how to query shared documents."""
+	if not user:
+		user = frappe.session.user
+
+	share_users = get_share_users(user)
+	if has_pending_changes():
+		return sum(len(get_shared_names_from_db(doctype, u, right)) for u in share_users)
+
+	try:
+		sizes = frappe.cache().get_set_sizes([get_share_set_key(doctype, u, right)
+			for u in share_users])
+	except redis.exceptions.ConnectionError:
+		return len(get_shared_names(doctype, user, right))
+
+	count = 0
+	for u, size in zip(share_users, sizes):
+		# sets include the `LOADED` marker, empty sets are not loaded yet
+		count += (size - 1) if size else len(load_share_set(doctype, u, right))
+
+	return count
+
+def get_shared_names(doctype, user, right="read"):
+	"""Returns set of names of documents shared with the user (or everyone) with `right`."""
+	share_users = get_share_users(user)
+	if has_pending_changes():
+		return set().union(*[get_shared_names_from_db(doctype, u, right) for u in share_users])
+
+	try:
+		sets = frappe.cache().get_sets([get_share_set_key(doctype, u, right) for u in share_users])
+	except redis.exceptions.ConnectionError:
+		sets = [set() for u in share_users]
+
+	names = set()
+	for u, members in zip(share_users, sets):
+		if LOADED in members:
+			members.discard(LOADED)
+		else:
+			members = load_share_set(doctype, u, right)
+		names.update(members)
+
+	return names
+
+def get_share_users(user):
+	"""Returns users whose shares apply to `user`, `None` is for shares with everyone."""
+	return [user] if user=="Guest" else [user, None]
+
+def get_share_set_key(doctype, user, right):
+	return "docshare:{0}:{1}:{2}".format(user or "", doctype, right)
+
+def has_pending_changes():
+	"""Returns True if shares were changed in the current transaction. The cached sets are
+	updated after commit, until then shares are read from the database."""
+	return any(method is update_share_sets for method, args in frappe.local.after_commit)
+
+def get_shared_names_from_db(doctype, user, right):
+	"""Returns names of documents shared with the user (`None` for everyone) with `right`."""
+	if user:
+		condition, values = "user=%s", (doctype, user)
+	else:
+		condition, values = "everyone=1", (doctype,)
+
+	return set(frappe.db.sql_list("""select share_name from tabDocShare
+		where share_doctype=%s and {condition} and `{right}`=1""".format(condition=condition,
+			right=right), values))
+
+def load_share_set(doctype, user, right):
+	"""Load names of documents shared with the user (`None` for everyone) with `right` from
+	the database into the cached set, and return them."""
+	names = get_shared_names_from_db(doctype, user, right)
+
+	try:
+		frappe.cache().set_members(get_share_set_key(doctype, user, right), [LOADED] + list(names),
+			expires_in_sec=SHARE_SET_EXPIRY)
+	except redis.exceptions.ConnectionError:
+		pass
+
+	return names
+
+def update_share_sets(share, removed=False):
+	"""Add or remove the shared document in the cached sets of its user, after commit of a change
+	of `DocShare`. Sets that are not loaded are left alone, they are loaded on next use."""
+	user = None if share.everyone else share.user
+	try:
+		for right in SHARE_RIGHTS:
+			key = get_share_set_key(share.share_doctype, user, right)
+			if share.get(right) and not removed:
+				frappe.cache().sadd_if_member(key, LOADED, share.share_name)
+			else:
+				frappe.cache().srem(key, share.share_name)
+	except redis.exceptions.ConnectionError:
+		pass
+
+def clear_share_cache(user=None):
+	"""Clear cached sets of shared documents of the given user, or all."""
+	if user:
+		frappe.cache().delete_keys("docshare:{0}:".format(user))
+
+	else:
+		frappe.cache().delete_keys("docshare:")
+
 def get_shared_doctypes(user=None):
 	"""Return list of doctypes in which documents are shared for the given user."""
 	if not user:
@@ -27,3 +27,63 @@ class TestDB(unittest.TestCase):
 	def test_multiple_queries(self):
 		# implicit commit
 		self.assertRaises(frappe.SQLError, frappe.db.sql, """select name from `tabUser`; truncate `tabEmail Queue`""")
+
+	def test_connection_pool(self):
+		from frappe.database import Database, clear_connection_pools
+
+		frappe.conf.db_pool_size = 1
+		try:
+			db = Database(user=frappe.conf.db_name, password=frappe.conf.db_password)
+			db.sql("select 1")
+			conn = db._conn
+			db.close()
+
+			db.sql("select name from `tabUser` limit 1")
+			self.assertTrue(db._conn is conn)
+			db.close()
+		finally:
+			frappe.conf.db_pool_size = None
+			clear_connection_pools()
+
+	def test_bulk_insert(self):
+		frappe.db.sql("delete from `tabToDo` where description like 'test bulk insert%'")
+		frappe.db.bulk_insert("ToDo", ["name", "description", "status"],
+			[["test-bulk-{0}".format(i), "test bulk insert {0}".format(i), "Open"] for i in range(5)],
+			chunk_size=2)
+
+		self.assertEquals(frappe.db.count("ToDo", {"description": ("like", "test bulk insert%")}), 5)
+		frappe.db.sql("delete from `tabToDo` where description like 'test bulk insert%'")
+
+	def test_iterate(self):
+		query = "select name, email from tabUser order by name"
+		rows = frappe.db.sql(query, as_dict=True)
+
+		result = frappe.db.sql(query, as_dict=True, iterate=True)
+		self.assertFalse(isinstance(result, list))
+		self.assertEquals(list(result), rows)
+
+		# running another query reads the remaining rows into memory
+		result = frappe.db.sql(query, iterate=True)
+		first = next(result)
+		self.assertEquals(frappe.db.sql("select 1")[0][0], 1)
+		self.assertEquals([first] + list(result), [(r.name, r.email) for r in rows])
+
+		self.assertEquals(list(frappe.get_all("User", fields=["name", "email"],
+			order_by="name asc", iterate=True)), rows)
+
+	def test_row_conversion(self):
+		from frappe.database import rows_to_dicts, rows_to_namedtuples
+
+		rows = ((1, "a"), (2, "b"))
+		self.assertEquals(rows_to_dicts(rows, ["idx", "name"], update={"doctype": "User"}),
+			[{"idx": 1, "name": "a", "doctype": "User"}, {"idx": 2, "name": "b", "doctype": "User"}])
+
+		rows = rows_to_namedtuples(rows, ["name", "count(*)"])
+		self.assertEquals(rows[1].name, 2)
+		self.assertEquals(rows[1][1], "b")
+		self.assertEquals(rows[1]._1, "b")
+
+		row = frappe.db.sql("select name, email from tabUser where name='Administrator'",
+			as_namedtuple=True)[0]
+		self.assertEquals((row.name, row.email), tuple(frappe.db.get_value("User", "Administrator",
+			["name", "email"])))
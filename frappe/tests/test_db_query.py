@@ -90,6 +90,109 @@ class TestReportview(unittest.TestCase):
 		self.assertTrue(get_filters_cond('DocType', dict(istable=1), [], ignore_permissions=True))
 		frappe.set_user('Administrator')
 
+	def test_cursor_pagination(self):
+		expected = [d.name for d in DatabaseQuery("DocType").execute(order_by="module asc",
+			limit_page_length=None)]
+
+		names, cursor = [], ""
+		while cursor is not None:
+			query = DatabaseQuery("DocType")
+			data = query.execute(fields=["name", "module"], order_by="module asc",
+				limit_page_length=50, after=cursor)
+
+			self.assertTrue(all("_cursor_0" not in d for d in data))
+			names.extend([d.name for d in data])
+			cursor = query.next_cursor
+
+		self.assertEquals(len(names), len(expected))
+		self.assertEquals(set(names), set(expected))
+
+		# as list, ordered by name only
+		query = DatabaseQuery("DocType")
+		data = query.execute(order_by="name asc", limit_page_length=2, as_list=True, after="")
+		self.assertEquals(len(data[0]), 1)
+
+		data = DatabaseQuery("DocType").execute(order_by="name asc", limit_page_length=2,
+			as_list=True, after=query.next_cursor)
+		self.assertEquals(list(data), list(DatabaseQuery("DocType").execute(order_by="name asc",
+			limit_start=2, limit_page_length=2, as_list=True)))
+
+	def test_cursor_with_typed_values(self):
+		import base64, json
+		from frappe.model.db_query import decode_cursor
+
+		# datetime and integer order columns are compared as their type, not as text
+		for order_by in ("modified desc", "idx asc, creation asc"):
+			expected = [d.name for d in DatabaseQuery("DocType").execute(order_by=order_by,
+				limit_page_length=None)]
+
+			names, cursor = [], ""
+			while cursor is not None:
+				query = DatabaseQuery("DocType")
+				names.extend([d.name for d in query.execute(order_by=order_by,
+					limit_page_length=40, after=cursor)])
+				cursor = query.next_cursor
+				if cursor:
+					self.assertEquals(decode_cursor(cursor)[0][0],
+						"datetime" if order_by.startswith("modified") else "int")
+
+			self.assertEquals(sorted(names), sorted(expected))
+			self.assertEquals(len(names), len(set(names)))
+
+		# values are validated against their type
+		cursor = base64.urlsafe_b64encode(json.dumps([["datetime", "1' or '1"],
+			["text", "x"]]).encode("utf-8")).decode("utf-8")
+		self.assertRaises(frappe.ValidationError, DatabaseQuery("DocType").execute,
+			order_by="modified desc", limit_page_length=10, after=cursor)
+
+	def test_cursor_with_child_tables(self):
+		from frappe.model.db_query import can_page_by_cursor
+
+		self.assertRaises(frappe.ValidationError, DatabaseQuery("DocType").execute,
+			fields=["name", "`tabDocField`.`fieldname`"], limit_page_length=10, after="")
+
+		self.assertTrue(can_page_by_cursor("name asc", doctype="DocType", fields=["name", "module"]))
+		self.assertFalse(can_page_by_cursor("name asc", doctype="DocType",
+			fields=["name", "`tabDocField`.`fieldname`"]))
+		self.assertFalse(can_page_by_cursor("name asc", doctype="DocType",
+			filters=[["DocField", "fieldtype", "=", "Data"]]))
+
+	def test_export_rows_in_chunks(self):
+		import frappe.desk.reportview
+		from frappe.desk.reportview import get_export_rows
+
+		expected = DatabaseQuery("DocType").execute(fields=["name", "module"],
+			order_by="name asc", as_list=True)
+
+		frappe.desk.reportview.EXPORT_CHUNK_SIZE = 7
+		try:
+			rows = list(get_export_rows("DocType", {"fields": ["name", "module"],
+				"order_by": "name asc"}))
+		finally:
+			frappe.desk.reportview.EXPORT_CHUNK_SIZE = 1000
+
+		self.assertEquals(rows[0][0], "Sr")
+		self.assertEquals(len(rows), len(expected) + 1)
+		self.assertEquals([r[1:] for r in rows[1:]], [list(r) for r in expected])
+		self.assertEquals(rows[-1][0], len(expected))
+
+	def test_export_rows_with_child_table(self):
+		import frappe.desk.reportview
+		from frappe.desk.reportview import get_export_rows
+
+		fields = ["name", "`tabDocField`.`fieldname`"]
+		expected = DatabaseQuery("DocType").execute(fields=fields, order_by="name asc",
+			as_list=True, limit_page_length=None)
+
+		frappe.desk.reportview.EXPORT_CHUNK_SIZE = 7
+		try:
+			rows = list(get_export_rows("DocType", {"fields": fields, "order_by": "name asc"}))
+		finally:
+			frappe.desk.reportview.EXPORT_CHUNK_SIZE = 1000
+
+		# no rows lost at chunk boundaries
+		self.assertEquals(len(rows), len(expected) + 1)
+
 def create_event(subject="_Test Event", starts_on=None):
 	""" create a test event """
 
@@ -20,6 +20,18 @@ class TestDocument(unittest.TestCase):
 		self.assertTrue(isinstance(d.permissions, list))
 		self.assertTrue(filter(lambda d: d.fieldname=="email", d.fields))
 
+	def test_get_docs(self):
+		names = ["Administrator", "Guest"]
+		docs = frappe.get_docs("User", names)
+
+		self.assertEquals([d.name for d in docs], names)
+		for d in docs:
+			expected = frappe.get_doc("User", d.name)
+			self.assertEquals([r.role for r in d.roles], [r.role for r in expected.roles])
+			self.assertFalse(d.is_new())
+
+		self.assertRaises(frappe.DoesNotExistError, frappe.get_docs, "User", ["_does_not_exist_"])
+
 	def test_load_single(self):
 		d = frappe.get_doc("Website Settings", "Website Settings")
 		self.assertEquals(d.name, "Website Settings")
@@ -61,6 +73,30 @@ class TestDocument(unittest.TestCase):
 
 		self.assertEquals(frappe.db.get_value(d.doctype, d.name, "subject"), "subject changed")
 
+	def test_insert_and_update_child_rows_in_batch(self):
+		frappe.delete_doc_if_exists("User", "test_batch_children@example.com")
+
+		d = frappe.get_doc({
+			"doctype": "User",
+			"email": "test_batch_children@example.com",
+			"first_name": "Batch",
+			"roles": [{"role": "Blogger"}, {"role": "Website Manager"}]
+		}).insert()
+
+		def get_roles():
+			return sorted(frappe.db.sql_list("""select role from `tabHas Role`
+				where parenttype='User' and parent=%s""", d.name))
+
+		self.assertEquals(get_roles(), ["Blogger", "Website Manager"])
+
+		d.remove(d.roles[0])
+		d.append("roles", {"role": "System Manager"})
+		d.append("roles", {"role": "Newsletter Manager"})
+		d.save()
+
+		self.assertEquals(get_roles(), ["Newsletter Manager", "System Manager", "Website Manager"])
+		self.assertTrue(all(not row.is_new() for row in d.roles))
+
 	def test_mandatory(self):
 		frappe.delete_doc_if_exists("User", "test_mandatory@example.com")
 
@@ -124,6 +160,20 @@ class TestDocument(unittest.TestCase):
 
 		self.assertEquals(frappe.db.get_value("User", d.name), d.name)
 
+	def test_get_link_values(self):
+		from frappe.model.base_document import get_link_values
+
+		d = frappe.get_doc({
+			"doctype": "User",
+			"email": "test_get_link_values@example.com",
+			"roles": [{"role": "System Manager"}, {"role": "system manager"}, {"role": "ABC"}]
+		})
+		d.set_parent_in_children()
+
+		link_values = get_link_values([d] + d.get_all_children())
+		self.assertEquals(link_values[("Role", "system manager")].name, "System Manager")
+		self.assertTrue(("Role", "abc") not in link_values)
+
 	def test_validate(self):
 		d = self.test_insert()
 		d.starts_on = "2014-01-01"
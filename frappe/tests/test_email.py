@@ -160,6 +160,48 @@ class TestEmail(unittest.TestCase):
 			reference_doctype = "User", reference_name="Administrator",
 			subject='Testing Email Queue', message='This email is queued!')
 
+	def test_prepared_message(self):
+		from frappe.email.queue import prepare_message
+		self.test_email_queue()
+
+		email = frappe.db.sql("""select name, message, sender, reference_doctype, reference_name,
+			unsubscribe_param, unsubscribe_method, expose_recipients, show_as_cc,
+			add_unsubscribe_link, attachments from `tabEmail Queue`""", as_dict=True)[0]
+		recipients_list = frappe.db.sql("""select name, recipient, status from
+			`tabEmail Queue Recipient` where parent=%s""", email.name, as_dict=True)
+
+		message = prepare_message(email, 'test@example.com', recipients_list)
+		self.assertTrue(email.prepared_message)
+		self.assertTrue('<!--unsubscribe url-->' in email.prepared_message)
+		self.assertFalse(b'<!--unsubscribe url-->' in message)
+
+		other_message = prepare_message(email, 'test1@example.com', recipients_list)
+		self.assertNotEquals(message, other_message)
+
+	def test_smtp_server_pool(self):
+		from frappe.email.smtp import SMTPServerPool
+		pool = SMTPServerPool()
+
+		server = pool.get('User', sender="admin@example.com")
+		self.assertTrue(pool.get('User', sender="admin@example.com") is server)
+		self.assertEquals(len(pool.servers), 1)
+
+		pool.discard(server)
+		self.assertEquals(len(pool.servers), 0)
+		self.assertFalse(pool.get('User', sender="admin@example.com") is server)
+
+	def test_throughput(self):
+		from frappe.email.queue import update_throughput, get_throughput
+		frappe.cache().delete_value("email_queue_throughput")
+
+		update_throughput(10, 2.0)
+		update_throughput(20, 4.0)
+
+		throughput = get_throughput()
+		self.assertEquals(throughput.sent, 30)
+		self.assertEquals(throughput.jobs, 2)
+		self.assertEquals(throughput.emails_per_second, 5.0)
+
 	def test_image_parsing(self):
 		import re
 		email_account = frappe.get_doc('Email Account', '_Test Email Account 1')
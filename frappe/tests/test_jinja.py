@@ -0,0 +1,34 @@
+# Copyright (c) 2015, Frappe Technologies Pvt. Ltd. and Contributors
+# MIT License. See license.txt
+from __future__ import unicode_literals
+
+import unittest
+import frappe
+from frappe.utils.jinja import (get_jenv, get_template_from_string, get_template_metrics,
+	clear_template_metrics)
+
+class TestJinja(unittest.TestCase):
+	def tearDown(self):
+		frappe.set_user("Administrator")
+
+	def test_shared_environment(self):
+		jenv = get_jenv()
+		frappe.set_user("Guest")
+		self.assertTrue(get_jenv() is jenv)
+
+		# request values are read from the current request
+		self.assertEquals(frappe.render_template("{{ frappe.user }}", {}), "Guest")
+		frappe.set_user("Administrator")
+		self.assertEquals(frappe.render_template("{{ frappe.user }}", {}), "Administrator")
+
+	def test_string_template_cache(self):
+		clear_template_metrics()
+		source = "<p>{{ doc.name }} {{ frappe.utils.random_string(4) }}</p>"
+
+		template = get_template_from_string(source)
+		self.assertTrue(get_template_from_string(source) is template)
+		self.assertEquals(frappe.render_template(source, {"doc": {"name": "_Test"}})[:9], "<p>_Test ")
+
+		metrics = get_template_metrics()
+		self.assertTrue(metrics.compile <= 1)
+		self.assertEquals(metrics.templates["<string>"].render, 1)
@@ -0,0 +1,44 @@
+# Copyright (c) 2015, Frappe Technologies Pvt. Ltd. and Contributors
+# MIT License. See license.txt
+from __future__ import unicode_literals
+
+import frappe, unittest
+from six.moves import cPickle as pickle
+from frappe.model.meta import Meta
+
+class TestMeta(unittest.TestCase):
+	def test_meta_snapshot(self):
+		meta = Meta("User")
+		conf = frappe.local.conf
+
+		for threshold in (None, 1):
+			frappe.local.conf = frappe._dict(conf, meta_cache_compress_threshold=threshold)
+			loaded = pickle.loads(pickle.dumps(meta, pickle.HIGHEST_PROTOCOL))
+
+			self.assertTrue(isinstance(loaded, Meta))
+			self.assertEquals([df.fieldname for df in loaded.fields],
+				[df.fieldname for df in meta.fields])
+			self.assertEquals(loaded.get_field("email").parent_doc, loaded)
+			self.assertEquals(len(loaded.permissions), len(meta.permissions))
+			self.assertEquals(loaded.get_valid_columns(), meta.get_valid_columns())
+
+		frappe.local.conf = conf
+
+	def test_field_index(self):
+		from frappe.model.base_document import _filter
+		meta = frappe.get_meta("User")
+
+		self.assertEquals(meta.get_field("email").fieldname, "email")
+		self.assertEquals(meta.get_field("_does_not_exist"), None)
+
+		for fieldtype in ("Link", "Table", "Check"):
+			self.assertEquals(meta.get("fields", {"fieldtype": fieldtype}),
+				_filter(meta.fields, {"fieldtype": fieldtype}))
+
+		self.assertEquals(meta.get_link_fields(),
+			_filter(meta.fields, {"fieldtype": "Link", "options":["!=", "[Select]"]}))
+		self.assertEquals(meta.get_mandatory_fields(), _filter(meta.fields, {"reqd": ('=', 1)}))
+
+		# returned lists can be changed by the caller
+		meta.get_link_fields().append(None)
+		self.assertTrue(None not in meta.get_link_fields())
@@ -0,0 +1,30 @@
+# Copyright (c) 2015, Frappe Technologies Pvt. Ltd. and Contributors
+# MIT License. See license.txt
+from __future__ import unicode_literals
+
+import io
+import unittest
+import frappe
+from PyPDF2 import PdfFileReader
+from frappe.utils.pdf import get_pdf, get_pdfs
+
+class TestPdf(unittest.TestCase):
+	html = "<html><head></head><body><p>{0}</p></body></html>"
+
+	def tearDown(self):
+		frappe.local.conf.pop("pdf_render_workers", None)
+
+	def test_get_pdf(self):
+		pdf = get_pdf(self.html.format("Test"))
+		self.assertEquals(pdf[:4], b"%PDF")
+
+	def test_get_pdfs(self):
+		frappe.local.conf.pdf_render_workers = 0
+		pdf = get_pdfs([self.html.format(i) for i in range(3)])
+		self.assertEquals(PdfFileReader(io.BytesIO(pdf)).numPages, 3)
+
+	def test_get_pdfs_with_pool(self):
+		# more documents than workers, rendered concurrently
+		frappe.local.conf.pdf_render_workers = 2
+		pdf = get_pdfs([self.html.format(i) for i in range(7)])
+		self.assertEquals(PdfFileReader(io.BytesIO(pdf)).numPages, 7)
@@ -357,6 +357,26 @@ class TestPermissions(unittest.TestCase):
 		# restrict by module
 		self.assertTrue('Module Def' in json.loads(_perm.user_permission_doctypes))
 
+	def test_role_permissions_cache(self):
+		from frappe.permissions import (get_role_permissions, get_role_permissions_cache_name,
+			get_role_permissions_cache_key)
+
+		meta = frappe.get_meta("Blog Post")
+		cache_name = get_role_permissions_cache_name("Blog Post")
+		cache_key = get_role_permissions_cache_key(meta, frappe.get_roles("test2@example.com"))
+
+		perms = get_role_permissions(meta, user="test2@example.com")
+		self.assertFalse(perms.get("if_owner", {}).get("read"))
+		self.assertEquals(frappe.cache().hget(cache_name, cache_key), perms)
+
+		# changing a permission rule clears the cached permissions
+		update("Blog Post", "Blogger", 0, "if_owner", 1)
+		self.assertEquals(frappe.cache().hget(cache_name, cache_key), None)
+
+		frappe.local.role_permissions = {}
+		perms = get_role_permissions(frappe.get_meta("Blog Post"), user="test2@example.com")
+		self.assertTrue(perms.get("if_owner", {}).get("read"))
+
 
 def set_user_permission_doctypes(doctypes, role, apply_user_permissions,
 	user_permission_doctypes):
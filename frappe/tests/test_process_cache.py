@@ -0,0 +1,60 @@
+# Copyright (c) 2015, Frappe Technologies Pvt. Ltd. and Contributors
+# MIT License. See license.txt
+from __future__ import unicode_literals
+
+import unittest
+import frappe
+import frappe.utils.process_cache
+from frappe.utils.process_cache import ProcessCache, get_process_cache
+
+class TestProcessCache(unittest.TestCase):
+	def test_lru_eviction(self):
+		cache = ProcessCache(max_items=2, max_memory=100)
+		cache.set(b"site|meta", "a", 10, cache.generation)
+		cache.set(b"site|app_hooks", "b", 10, cache.generation)
+
+		# touch first key, so that the second one is evicted
+		self.assertEquals(cache.get(b"site|meta"), "a")
+		cache.set(b"site|defaults", "c", 10, cache.generation)
+
+		self.assertEquals(cache.get(b"site|app_hooks"), None)
+		self.assertEquals(cache.get(b"site|meta"), "a")
+		self.assertEquals(cache.get_stats().evictions, 1)
+
+		# evicted by memory
+		cache.set(b"site|table_columns", "d", 95, cache.generation)
+		self.assertEquals(cache.get_stats().entries, 1)
+
+	def test_invalidation(self):
+		cache = ProcessCache(max_items=10)
+		cache.set((b"site|meta", "User"), "user", 10, cache.generation)
+		cache.set((b"site|meta", "Role"), "role", 10, cache.generation)
+
+		cache.invalidate(b"site|meta", "User")
+		self.assertEquals(cache.get((b"site|meta", "User")), None)
+		self.assertEquals(cache.get((b"site|meta", "Role")), "role")
+
+		cache.invalidate_prefix(b"site|")
+		self.assertEquals(cache.get((b"site|meta", "Role")), None)
+
+		# value read before an invalidation is not stored
+		generation = cache.generation
+		cache.invalidate(b"site|meta")
+		cache.set((b"site|meta", "User"), "stale", 10, generation)
+		self.assertEquals(cache.get((b"site|meta", "User")), None)
+
+	def test_is_cached(self):
+		self.assertFalse(ProcessCache().is_cached(b"site|meta"))
+		self.assertTrue(ProcessCache(max_items=10).is_cached(b"site|meta"))
+		self.assertFalse(ProcessCache(max_items=10).is_cached(b"site|session"))
+
+	def test_settings_not_from_site_config(self):
+		process_cache = frappe.utils.process_cache._process_cache
+		frappe.local.conf.process_cache_ttl = 12345
+		frappe.utils.process_cache._process_cache = None
+		try:
+			# shared by all sites of the process, site config is ignored
+			self.assertNotEquals(get_process_cache().ttl, 12345)
+		finally:
+			del frappe.local.conf["process_cache_ttl"]
+			frappe.utils.process_cache._process_cache = process_cache
@@ -0,0 +1,44 @@
+# Copyright (c) 2015, Frappe Technologies Pvt. Ltd. and Contributors
+# MIT License. See license.txt
+from __future__ import unicode_literals
+
+import unittest
+import frappe
+from frappe.utils.query_cache import QueryCache, get_query_cache
+
+class TestQueryCache(unittest.TestCase):
+	def test_hits_and_reset(self):
+		cache = QueryCache(max_items=2)
+		build = lambda: "select 1"
+
+		self.assertEquals(cache.get(("get_values", "User"), build), "select 1")
+		cache.get(("get_values", "User"), build)
+		cache.get(("insert", "User"), build)
+
+		stats = cache.get_stats()
+		self.assertEquals(stats.kinds["get_values"].hits, 1)
+		self.assertEquals(stats.kinds["get_values"].hit_rate, 0.5)
+		self.assertEquals(stats.kinds["insert"].misses, 1)
+
+		# full, start over
+		cache.get(("update", "User"), build)
+		self.assertEquals(cache.get_stats().entries, 1)
+		self.assertEquals(cache.get_stats().resets, 1)
+
+	def test_build_conditions(self):
+		filters = {"name": ("in", ("a", "b")), "enabled": 1, "user_type[0]": ("!=", "Website User")}
+		conditions, values = frappe.db.build_conditions(filters)
+		self.assertTrue("`name` in (%(name_0)s, %(name_1)s)" in conditions)
+		self.assertTrue("ifnull(`user_type`, 0) != %(user_type[0])s" in conditions)
+		self.assertEquals(values, {"name_0": "a", "name_1": "b", "enabled": 1,
+			"user_type[0]": "Website User"})
+
+		# same shape, different values
+		hits = get_query_cache().get_stats().kinds["conditions"].hits
+		self.assertEquals(frappe.db.build_conditions({"name": ("in", ("c", "d")), "enabled": 0,
+			"user_type[0]": ("!=", "System User")}), (conditions, {"name_0": "c", "name_1": "d",
+			"enabled": 0, "user_type[0]": "System User"}))
+		self.assertEquals(get_query_cache().get_stats().kinds["conditions"].hits, hits + 1)
+
+		self.assertEquals(frappe.db.get_value("User", {"name": ("in", ("Administrator", "Guest"))},
+			"name", order_by="name asc"), "Administrator")
@@ -0,0 +1,36 @@
+# Copyright (c) 2015, Frappe Technologies Pvt. Ltd. and Contributors
+# MIT License. See license.txt
+from __future__ import unicode_literals
+
+import unittest
+import frappe
+from frappe.utils.query_profiler import QueryProfiler, normalize_query
+
+class TestQueryProfiler(unittest.TestCase):
+	def tearDown(self):
+		frappe.local.query_profiler = None
+
+	def test_normalize_query(self):
+		self.assertEquals(normalize_query("""select name from `tabUser`
+			where name in ('a', 'b\\'c') and idx > 10 limit 0, 20"""),
+			"select name from `tabUser` where name in (?) and idx > ? limit ?, ?")
+
+	def test_profile_queries(self):
+		profiler = frappe.local.query_profiler = QueryProfiler()
+
+		frappe.db.sql("select name from tabUser where name=%s", "Administrator")
+		frappe.db.sql("select name from tabUser where name=%s", "Administrator")
+		frappe.db.sql("select name from tabUser where name=%s", "Guest")
+
+		self.assertEquals(profiler.count, 3)
+		self.assertEquals(len(profiler.queries), 1)
+
+		stats = list(profiler.queries.values())[0]
+		self.assertEquals(stats.query, "select name from tabUser where name=?")
+		self.assertEquals(stats.count, 3)
+		self.assertEquals(stats.duplicates, 1)
+		self.assertTrue("test_query_profiler.py" in stats.call_site)
+
+		summary = profiler.get_summary()
+		self.assertEquals(summary["duplicates"], 1)
+		self.assertEquals(summary["slowest"][0]["query"], stats.query)
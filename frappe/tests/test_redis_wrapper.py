@@ -0,0 +1,47 @@
+# Copyright (c) 2015, Frappe Technologies Pvt. Ltd. and Contributors
+# MIT License. See license.txt
+from __future__ import unicode_literals
+
+import frappe, unittest
+
+class TestRedisWrapper(unittest.TestCase):
+	def setUp(self):
+		frappe.cache().delete_keys("_test_redis_wrapper")
+
+	def test_get_and_set_values(self):
+		cache = frappe.cache()
+		cache.set_values({"_test_redis_wrapper_a": 1, "_test_redis_wrapper_b": [1, 2]})
+
+		# read from redis, not from frappe.local.cache
+		frappe.local.cache = {}
+		self.assertEquals(cache.get_values(["_test_redis_wrapper_a", "_test_redis_wrapper_b",
+			"_test_redis_wrapper_c"]),
+			{"_test_redis_wrapper_a": 1, "_test_redis_wrapper_b": [1, 2], "_test_redis_wrapper_c": None})
+
+		self.assertEquals(sorted(cache.get_all("_test_redis_wrapper").keys()),
+			["_test_redis_wrapper_a", "_test_redis_wrapper_b"])
+
+		cache.delete_keys("_test_redis_wrapper")
+		frappe.local.cache = {}
+		self.assertEquals(cache.get_keys("_test_redis_wrapper"), [])
+
+	def test_hmget_and_pipeline(self):
+		cache = frappe.cache()
+		with cache.pipeline() as pipe:
+			pipe.hset("_test_redis_wrapper_hash", "a", 1)
+			pipe.hset("_test_redis_wrapper_hash", "b", 2)
+			pipe.set_value("_test_redis_wrapper_value", "x")
+			pipe.execute()
+
+		frappe.local.cache = {}
+		self.assertEquals(cache.hmget("_test_redis_wrapper_hash", ["a", "b", "c"]),
+			{"a": 1, "b": 2, "c": None})
+
+		frappe.local.cache = {}
+		with cache.pipeline() as pipe:
+			pipe.hget("_test_redis_wrapper_hash", "b")
+			pipe.get_value("_test_redis_wrapper_value")
+			pipe.hget("_test_redis_wrapper_hash", "c")
+			self.assertEquals(pipe.execute(), [2, "x", None])
+
+		cache.delete_keys("_test_redis_wrapper")
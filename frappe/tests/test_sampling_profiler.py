@@ -0,0 +1,45 @@
+# Copyright (c) 2015, Frappe Technologies Pvt. Ltd. and Contributors
+# MIT License. See license.txt
+from __future__ import unicode_literals
+
+import threading
+import time
+import unittest
+import frappe
+from werkzeug.test import EnvironBuilder
+from werkzeug.wrappers import Request
+from frappe.utils.sampling_profiler import Sampler, get_route
+
+class TestSamplingProfiler(unittest.TestCase):
+	def test_sampler(self):
+		sampler = Sampler(threading.current_thread().ident, interval=0.001)
+		sampler.start()
+
+		def busy():
+			end = time.time() + 0.1
+			while time.time() < end:
+				pass
+
+		busy()
+		stacks = sampler.stop()
+
+		self.assertTrue(stacks)
+		self.assertTrue(any(stack.endswith("test_sampling_profiler.py:busy")
+			for stack in stacks))
+
+	def test_get_route(self):
+		def route_for(path):
+			frappe.local.request = Request(EnvironBuilder(path=path).get_environ())
+			return get_route()
+
+		form_dict, request = frappe.local.form_dict, getattr(frappe.local, "request", None)
+		frappe.local.form_dict = frappe._dict()
+		try:
+			# one route per api method or DocType, not per document
+			self.assertEquals(route_for("/api/resource/ToDo/abc123"), "/api/resource/ToDo")
+			self.assertEquals(route_for("/api/method/frappe.auth.get_logged_user"),
+				"/api/method/frappe.auth.get_logged_user")
+			self.assertEquals(route_for("/files/test.png"), "/files")
+		finally:
+			frappe.local.form_dict = form_dict
+			frappe.local.request = request
@@ -23,3 +23,68 @@ class TestWebsite(unittest.TestCase):
 		self.assertTrue('/* login-css */' in html)
 		self.assertTrue('// login.js' in html)
 		self.assertTrue('<!-- login.html -->' in html)
+
+	def test_page_cache_etag(self):
+		developer_mode = frappe.conf.developer_mode
+		frappe.conf.developer_mode = 0
+		try:
+			render.clear_cache("about")
+			set_request(method='GET', path='about')
+			response = render.render()
+			etag = response.headers.get("ETag")
+			self.assertTrue(etag)
+			self.assertTrue(frappe.cache().hget("website_page:about", frappe.local.lang))
+
+			# unchanged page is not sent again
+			frappe.local.response = frappe._dict()
+			set_request(method='GET', path='about', headers={"If-None-Match": etag})
+			response = render.render()
+			self.assertEquals(response.status_code, 304)
+			self.assertTrue(frappe.local.response.from_cache)
+
+			render.clear_cache("about")
+			self.assertFalse(frappe.cache().hget("website_page:about", frappe.local.lang))
+		finally:
+			frappe.conf.developer_mode = developer_mode
+
+	def test_static_file(self):
+		from frappe.website.static_files import get_static_file, get_response
+
+		self.assertFalse(get_static_file("about.py"))
+		info = get_static_file("robots.txt")
+		self.assertEquals(info.mimetype, "text/plain")
+
+		set_request(method='GET', path='robots.txt')
+		response = get_response(info)
+		etag = response.headers.get("ETag")
+		self.assertTrue(etag)
+		response.close()
+
+		set_request(method='GET', path='robots.txt', headers={"If-None-Match": etag})
+		self.assertEquals(get_response(info).status_code, 304)
+
+		set_request(method='GET', path='robots.txt', headers={"Range": "bytes=0-9"})
+		response = get_response(info)
+		self.assertEquals(response.status_code, 206)
+		self.assertEquals(len(response.get_data()), 10)
+		response.close()
+
+	def test_static_file_in_symlinked_folder(self):
+		import os, shutil, tempfile
+		from frappe.website.static_files import build_app_index
+
+		folder = tempfile.mkdtemp()
+		link = frappe.get_app_path("frappe", "www", "_test_static_link")
+		with open(os.path.join(folder, "test.png"), "w") as f:
+			f.write("test")
+
+		# links back to the folder are not followed in circles
+		os.symlink(folder, os.path.join(folder, "loop"))
+		os.symlink(folder, link)
+		try:
+			index = build_app_index("frappe")
+			self.assertTrue("_test_static_link/test.png" in index)
+			self.assertFalse("_test_static_link/loop/test.png" in index)
+		finally:
+			os.remove(link)
+			shutil.rmtree(folder)
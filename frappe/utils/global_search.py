@@ -80,11 +80,13 @@ def rebuild_for_doctype(doctype):
 	parent_search_fields = meta.get_global_search_fields()
 	fieldnames = get_selected_fields(meta, parent_search_fields)
 
-	# Get all records from parent doctype table
-	all_records = frappe.get_all(doctype, fields=fieldnames, filters=_get_filters())
-
 	# Children data
 	all_children, child_search_fields = get_children_data(doctype, meta)
+
+	# Read records from parent doctype table with an unbuffered cursor
+	all_records = frappe.get_all(doctype, fields=fieldnames, filters=_get_filters(),
+		iterate=True)
+
 	all_contents = []
 
 	for doc in all_records:
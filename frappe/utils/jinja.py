@@ -1,24 +1,205 @@
 # Copyright (c) 2015, Frappe Technologies Pvt. Ltd. and Contributors
 # MIT License. See license.txt
+"""
+Jinja environment of frappe.
+
+The environment is built once per process for each combination of template apps and
+filters and is shared by all requests, so that compiled templates are kept in its cache.
+Values that depend on the request (`frappe.user`, `frappe.form_dict` etc.) are proxies
+to `frappe.local`.
+
+Compiled templates are also stored in a bytecode cache, in the file system by default
+or in redis if `jinja_bytecode_cache` is set to `"redis"` in `common_site_config.json`,
+so that new processes do not compile them again, see `bench warmup-templates`.
+"""
 from __future__ import unicode_literals
+import threading
+import time
+
+from jinja2 import Environment, Template
+
+# max number of templates compiled from strings (print formats, web forms etc.) per process
+STRING_TEMPLATES = 400
+
+# (apps, filters, in_setup_help) -> environment
+_environments = {}
+_lock = threading.Lock()
+
+# md5 of source -> template compiled from string
+_string_templates = {}
+
+# template name -> compile and render counters
+_metrics = {}
+
+class FrappeTemplate(Template):
+	def render(self, *args, **kwargs):
+		start = time.time()
+		try:
+			return super(FrappeTemplate, self).render(*args, **kwargs)
+		finally:
+			add_to_metrics(self.name, "render", time.time() - start)
+
+class FrappeEnvironment(Environment):
+	template_class = FrappeTemplate
+
+	def compile(self, source, name=None, filename=None, raw=False, defer_init=False):
+		start = time.time()
+		try:
+			return super(FrappeEnvironment, self).compile(source, name, filename, raw, defer_init)
+		finally:
+			if not raw:
+				add_to_metrics(name, "compile", time.time() - start)
 
 def get_jenv():
 	import frappe
 
 	if not getattr(frappe.local, 'jenv', None):
-		from jinja2 import Environment, DebugUndefined
-
-		# frappe will be loaded last, so app templates will get precedence
-		jenv = Environment(loader = get_jloader(),
-			undefined=DebugUndefined)
-		set_filters(jenv)
-
-		jenv.globals.update(get_allowed_functions_for_jenv())
+		key = get_jenv_key()
+		jenv = _environments.get(key)
+		if not jenv:
+			with _lock:
+				jenv = _environments.get(key)
+				if not jenv:
+					jenv = _environments[key] = make_jenv(key)
 
 		frappe.local.jenv = jenv
 
 	return frappe.local.jenv
 
+def get_jenv_key():
+	import frappe
+	filters = [] if frappe.flags.in_setup_help else frappe.get_hooks("jenv_filter")
+	return (tuple(get_template_apps()), tuple(filters), bool(frappe.flags.in_setup_help))
+
+def make_jenv(key):
+	from jinja2 import ChoiceLoader, PackageLoader, PrefixLoader, DebugUndefined
+
+	apps = key[0]
+
+	# frappe will be loaded last, so app templates will get precedence
+	loader = ChoiceLoader(
+		# search for something like app/templates/...
+		[PrefixLoader(dict(
+			(app, PackageLoader(app, ".")) for app in apps
+		))]
+
+		# search for something like templates/...
+		+ [PackageLoader(app, ".") for app in apps]
+	)
+
+	jenv = FrappeEnvironment(loader=loader, undefined=DebugUndefined,
+		bytecode_cache=get_bytecode_cache())
+	set_filters(jenv)
+
+	jenv.globals.update(get_allowed_functions_for_jenv())
+
+	return jenv
+
+def get_bytecode_cache():
+	import frappe
+	from jinja2 import FileSystemBytecodeCache, MemcachedBytecodeCache
+
+	# the environment is shared by the sites of the process
+	if frappe.get_common_site_config().get("jinja_bytecode_cache")=="redis":
+		# bytecode does not depend on the site, keys are not prefixed
+		return MemcachedBytecodeCache(frappe.cache(), prefix="jinja_bytecode:")
+
+	return FileSystemBytecodeCache()
+
+def get_template_from_string(source):
+	"""Returns template compiled from `source`, cached in the process and the bytecode cache."""
+	import hashlib
+	from frappe.utils import encode
+
+	jenv = get_jenv()
+	key = (id(jenv), hashlib.md5(encode(source)).hexdigest())
+	template = _string_templates.get(key)
+	if not template:
+		if len(_string_templates) >= STRING_TEMPLATES:
+			_string_templates.clear()
+
+		template = _string_templates[key] = compile_from_string(jenv, source, key[1])
+
+	return template
+
+def compile_from_string(jenv, source, source_hash):
+	bcc = jenv.bytecode_cache
+	if not bcc:
+		return jenv.from_string(source)
+
+	bucket = bcc.get_bucket(jenv, "<string:{0}>".format(source_hash), None, source)
+	code = bucket.code
+	if code is None:
+		code = bucket.code = jenv.compile(source)
+		bcc.set_bucket(bucket)
+
+	return jenv.template_class.from_code(jenv, code, jenv.make_globals(None))
+
+def warmup_templates():
+	"""Compile templates of installed apps (`templates` and `www` folders) and Print Formats
+	so that they are in the bytecode cache.
+
+	Returns number of templates loaded and list of `(template, error)` that failed."""
+	import os
+	import frappe
+	from frappe.www.printview import get_print_format
+
+	jenv = get_jenv()
+	count, errors = 0, []
+
+	for app in get_template_apps():
+		app_path = frappe.get_app_path(app)
+		for folder in ("templates", "www"):
+			for root, dirs, files in os.walk(os.path.join(app_path, folder)):
+				for filename in files:
+					if not filename.endswith(".html"):
+						continue
+
+					path = os.path.relpath(os.path.join(root, filename), app_path).replace(os.sep, "/")
+					try:
+						jenv.get_template(path)
+						count += 1
+					except Exception as e:
+						errors.append((path, e))
+
+	for print_format in frappe.get_all("Print Format", filters={"disabled": 0},
+		fields=["name", "doc_type", "disabled", "html", "custom_format", "standard", "format_data"]):
+		if not print_format.custom_format and (print_format.format_data or print_format.standard!="Yes"):
+			# rendered with the standard template
+			continue
+
+		try:
+			get_template_from_string(get_print_format(print_format.doc_type, print_format))
+			count += 1
+		except Exception as e:
+			errors.append(("Print Format " + print_format.name, e))
+
+	return count, errors
+
+def add_to_metrics(name, action, elapsed):
+	metrics = _metrics.setdefault(name or "<string>", {"compile": 0, "compile_time": 0.0,
+		"render": 0, "render_time": 0.0})
+	metrics[action] += 1
+	metrics[action + "_time"] += elapsed
+
+def get_template_metrics():
+	"""Returns number of compiles and renders and time taken (ms) by template, in this process."""
+	import frappe
+	out = frappe._dict(compile=0, compile_time=0.0, render=0, render_time=0.0, templates={})
+	for name, metrics in _metrics.items():
+		out.templates[name] = frappe._dict(metrics)
+		for key in ("compile", "render"):
+			out[key] += metrics[key]
+			out[key + "_time"] += metrics[key + "_time"] * 1000
+			out.templates[name][key + "_time"] = round(metrics[key + "_time"] * 1000, 2)
+
+	out.compile_time = round(out.compile_time, 2)
+	out.render_time = round(out.render_time, 2)
+	return out
+
+def clear_template_metrics():
+	_metrics.clear()
+
 def get_template(path):
 	return get_jenv().get_template(path)
 
@@ -43,9 +224,8 @@ def validate_template(html):
 	import frappe
 	from jinja2 import TemplateSyntaxError
 
-	jenv = get_jenv()
 	try:
-		jenv.from_string(html)
+		get_template_from_string(html)
 	except TemplateSyntaxError as e:
 		frappe.msgprint('Line {}: {}'.format(e.lineno, e.message))
 		frappe.throw(frappe._("Syntax error in template"))
@@ -66,7 +246,7 @@ def render_template(template, context, is_path=None):
 		or (template.endswith('.html') and '\n' not in template)):
 		return get_jenv().get_template(template).render(context)
 	else:
-		return get_jenv().from_string(template).render(context)
+		return get_template_from_string(template).render(context)
 
 def get_allowed_functions_for_jenv():
 	import os, json
@@ -81,11 +261,10 @@ def get_allowed_functions_for_jenv():
 	from html2text import html2text
 	from frappe.www.printview import get_visible_columns
 
+	from werkzeug.local import LocalProxy
+
 	datautils = {}
-	if frappe.db:
-		date_format = frappe.db.get_default("date_format") or "yyyy-mm-dd"
-	else:
-		date_format = 'yyyy-mm-dd'
+	date_format = LocalProxy(get_date_format)
 
 	for key, obj in frappe.utils.data.__dict__.items():
 		if key.startswith("_"):
@@ -96,10 +275,9 @@ def get_allowed_functions_for_jenv():
 			# only allow functions
 			datautils[key] = obj
 
-	if "_" in getattr(frappe.local, 'form_dict', {}):
-		del frappe.local.form_dict["_"]
-
-	user = getattr(frappe.local, "session", None) and frappe.local.session.user or "Guest"
+	# the environment is shared by requests, read these from the current request
+	user = LocalProxy(get_user)
+	session_data = lambda key, default: LocalProxy(lambda: get_session_data(key, default))
 
 	out = {
 		# make available limited methods of frappe
@@ -110,7 +288,7 @@ def get_allowed_functions_for_jenv():
 			"format_value": frappe.format_value,
 			'date_format': date_format,
 			"format_date": frappe.utils.data.global_date_format,
-			"form_dict": getattr(frappe.local, 'form_dict', {}),
+			"form_dict": LocalProxy(get_form_dict),
 			"local": frappe.local,
 			"get_hooks": frappe.get_hooks,
 			"get_meta": frappe.get_meta,
@@ -121,11 +299,11 @@ def get_allowed_functions_for_jenv():
 			"user": user,
 			"get_fullname": frappe.utils.get_fullname,
 			"get_gravatar": frappe.utils.get_gravatar_url,
-			"full_name": frappe.local.session.data.full_name if getattr(frappe.local, "session", None) else "Guest",
+			"full_name": session_data("full_name", "Guest"),
 			"render_template": frappe.render_template,
 			'session': {
 				'user': user,
-				'csrf_token': frappe.local.session.data.csrf_token if getattr(frappe.local, "session", None) else ''
+				'csrf_token': session_data("csrf_token", "")
 			},
 		},
 		'style': {
@@ -151,40 +329,63 @@ def get_allowed_functions_for_jenv():
 		out['get_visible_columns'] = get_visible_columns
 		out['frappe']['date_format'] = date_format
 		out['frappe']["db"] = {
-			"get_value": frappe.db.get_value,
-			"get_default": frappe.db.get_default,
+			"get_value": lambda *args, **kwargs: frappe.db.get_value(*args, **kwargs),
+			"get_default": lambda *args, **kwargs: frappe.db.get_default(*args, **kwargs),
 		}
 
 	return out
 
-def get_jloader():
+def get_date_format():
 	import frappe
-	if not getattr(frappe.local, 'jloader', None):
-		from jinja2 import ChoiceLoader, PackageLoader, PrefixLoader
+	if getattr(frappe.local, "db", None):
+		return frappe.db.get_default("date_format") or "yyyy-mm-dd"
+	else:
+		return 'yyyy-mm-dd'
+
+def get_form_dict():
+	import frappe
+	form_dict = getattr(frappe.local, 'form_dict', None)
+	if form_dict is None:
+		return {}
 
-		if frappe.local.flags.in_setup_help:
-			apps = ['frappe']
-		else:
-			apps = frappe.get_hooks('template_apps')
-			if not apps:
-				apps = frappe.local.flags.web_pages_apps or frappe.get_installed_apps(sort=True)
-				apps.reverse()
+	if "_" in form_dict:
+		del form_dict["_"]
 
-		if not "frappe" in apps:
-			apps.append('frappe')
+	return form_dict
+
+def get_user():
+	import frappe
+	return getattr(frappe.local, "session", None) and frappe.local.session.user or "Guest"
+
+def get_session_data(key, default):
+	import frappe
+	if getattr(frappe.local, "session", None):
+		return frappe.local.session.data.get(key)
 
-		frappe.local.jloader = ChoiceLoader(
-			# search for something like app/templates/...
-			[PrefixLoader(dict(
-				(app, PackageLoader(app, ".")) for app in apps
-			))]
+	return default
 
-			# search for something like templates/...
-			+ [PackageLoader(app, ".") for app in apps]
-		)
+def get_jloader():
+	import frappe
+	if not getattr(frappe.local, 'jloader', None):
+		frappe.local.jloader = get_jenv().loader
 
 	return frappe.local.jloader
 
+def get_template_apps():
+	import frappe
+	if frappe.local.flags.in_setup_help:
+		apps = ['frappe']
+	else:
+		apps = list(frappe.get_hooks('template_apps'))
+		if not apps:
+			apps = list(frappe.local.flags.web_pages_apps or frappe.get_installed_apps(sort=True))
+			apps.reverse()
+
+	if not "frappe" in apps:
+		apps.append('frappe')
+
+	return apps
+
 def set_filters(jenv):
 	import frappe
 	from frappe.utils import global_date_format, cint, cstr, flt, markdown
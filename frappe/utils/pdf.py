@@ -2,49 +2,115 @@
 # MIT License. See license.txt
 from __future__ import unicode_literals
 
-import pdfkit, os, frappe
-from frappe.utils import scrub_urls
+import pdfkit, os, io, subprocess, frappe
+from multiprocessing.pool import ThreadPool
+from frappe.utils import scrub_urls, cint, cstr
 from frappe import _
 from bs4 import BeautifulSoup
 from PyPDF2 import PdfFileWriter, PdfFileReader
 
+# errors of wkhtmltopdf for which the rendered pdf is still used
+CONTENT_ERRORS = ("ContentNotFoundError", "ContentOperationNotPermittedError",
+	"UnknownContentError", "RemoteHostClosedError")
+
+# (pid, workers, pool), so that a forked process starts its own pool
+_pool = (None, None, None)
+
 def get_pdf(html, options=None, output = None):
 	html = scrub_urls(html)
 	html, options = prepare_options(html, options)
-	fname = os.path.join("/tmp", "frappe-pdf-{0}.pdf".format(frappe.generate_hash()))
 
 	try:
-		pdfkit.from_string(html, fname, options=options or {})
-		if output:
-			append_pdf(PdfFileReader(file(fname,"rb")),output)
-		else:
-			with open(fname, "rb") as fileobj:
-				filedata = fileobj.read()
-
-	except IOError as e:
-		if ("ContentNotFoundError" in e.message
-			or "ContentOperationNotPermittedError" in e.message
-			or "UnknownContentError" in e.message
-			or "RemoteHostClosedError" in e.message):
-
-			# allow pdfs with missing images if file got created
-			if os.path.exists(fname):
-				with open(fname, "rb") as fileobj:
-					filedata = fileobj.read()
-
-			else:
-				frappe.throw(_("PDF generation failed because of broken image links"))
-		else:
-			raise
-
+		filedata = render_pdf(html, options)
 	finally:
-		cleanup(fname, options)
+		cleanup(options)
+
+	if filedata is None:
+		frappe.throw(_("PDF generation failed because of broken image links"))
 
 	if output:
+		append_pdf(PdfFileReader(io.BytesIO(filedata)), output)
 		return output
 
 	return filedata
 
+def get_pdfs(htmls, options=None):
+	"""Render documents concurrently with the pdf pool and return them as a single pdf.
+
+	:param htmls: List of html of the documents, in the order of pages.
+	:param options: wkhtmltopdf options, same for all documents."""
+	jobs = []
+	try:
+		for html in htmls:
+			jobs.append(prepare_options(scrub_urls(html), dict(options or {})))
+
+		pool = get_pool()
+		if pool:
+			results = pool.map(lambda job: render_pdf(*job), jobs, chunksize=1)
+		else:
+			results = [render_pdf(html, job_options) for html, job_options in jobs]
+
+	finally:
+		for html, job_options in jobs:
+			cleanup(job_options)
+
+	output = PdfFileWriter()
+	for filedata in results:
+		if filedata is None:
+			frappe.throw(_("PDF generation failed because of broken image links"))
+
+		append_pdf(PdfFileReader(io.BytesIO(filedata)), output)
+
+	return read_pdf(output)
+
+def render_pdf(html, options):
+	"""Returns pdf rendered by wkhtmltopdf (via stdin and stdout), or None if it failed
+	because of missing content. Does not use `frappe.local`, it is run in pool threads."""
+	kit = pdfkit.PDFKit(html, "string", options=options or {})
+	# close_fds, so that wkhtmltopdf does not inherit the stdin pipes of processes started
+	# by other pool threads (py2 pipes are inheritable) and wait for their EOF
+	process = subprocess.Popen(kit.command(), stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+		stderr=subprocess.PIPE, env=getattr(kit, "environ", None), close_fds=True)
+	filedata, stderr = process.communicate(input=html.encode("utf-8"))
+
+	if process.returncode != 0:
+		stderr = cstr(stderr)
+		if any(error in stderr for error in CONTENT_ERRORS):
+			# allow pdfs with missing images if the pdf got created
+			return filedata if filedata.startswith(b"%PDF") else None
+
+		if not filedata.startswith(b"%PDF") or "Error" in stderr:
+			raise IOError("wkhtmltopdf reported an error:\n" + stderr)
+
+	return filedata
+
+def get_pool():
+	"""Returns the pool of render threads of this process, None to render one document at
+	a time (the default).
+
+	Set `pdf_render_workers` in site config to render documents concurrently. Each thread
+	runs one wkhtmltopdf process, in every web and background worker process."""
+	global _pool
+	workers = cint(frappe.conf.get("pdf_render_workers"))
+	if workers < 2:
+		return None
+
+	pid, pool_workers, pool = _pool
+	if pid != os.getpid() or pool_workers != workers:
+		if pid == os.getpid():
+			pool.close()
+
+		pool = ThreadPool(workers)
+		_pool = (os.getpid(), workers, pool)
+
+	return pool
+
+def read_pdf(output):
+	"""Returns content of the `PdfFileWriter`."""
+	out = io.BytesIO()
+	output.write(out)
+	return out.getvalue()
+
 def append_pdf(input,output):
 	# Merging multiple pdf files
     [output.addPage(input.getPage(page_num)) for page_num in range(input.numPages)]
@@ -141,10 +207,7 @@ def prepare_header_footer(soup):
 
 	return options
 
-def cleanup(fname, options):
-	if os.path.exists(fname):
-		os.remove(fname)
-
+def cleanup(options):
 	for key in ("header-html", "footer-html"):
 		if options.get(key) and os.path.exists(options[key]):
 			os.remove(options[key])
@@ -1,13 +1,12 @@
 from __future__ import unicode_literals
 
-import frappe, os, copy, json, re
+import frappe, copy, json, re
 from frappe import _
 
 from frappe.modules import get_doc_path
 from jinja2 import TemplateNotFound
 from frappe.utils import cint, strip_html
-from frappe.utils.pdf import get_pdf
-from PyPDF2 import PdfFileWriter, PdfFileReader
+from frappe.utils.pdf import get_pdf, get_pdfs, read_pdf
 
 no_cache = 1
 no_sitemap = 1
@@ -22,24 +21,16 @@ def download_multi_pdf(doctype, name, format=None):
 	import json
 	result = json.loads(name)
 
-	# Concatenating pdf files
-	output = PdfFileWriter()
-	for i, ss in enumerate(result):
-		output = frappe.get_print(doctype, ss, format, as_pdf = True, output = output)
+	# rendered concurrently and merged into one pdf
+	htmls = [frappe.get_print(doctype, ss, format) for ss in result]
 
 	frappe.local.response.filename = "{doctype}.pdf".format(doctype=doctype.replace(" ", "-").replace("/", "-"))
-	frappe.local.response.filecontent = read_multi_pdf(output)
+	frappe.local.response.filecontent = get_pdfs(htmls)
 	frappe.local.response.type = "download"
 
 def read_multi_pdf(output):
 	# Get the content of the merged pdf files
-	fname = os.path.join("/tmp", "frappe-pdf-{0}.pdf".format(frappe.generate_hash()))
-	output.write(open(fname,"wb"))
-
-	with open(fname, "rb") as fileobj:
-		filedata = fileobj.read()
-
-	return filedata
+	return read_pdf(output)
 
 @frappe.whitelist()
 def download_pdf(doctype, name, format=None, doc=None):
@@ -0,0 +1,223 @@
+# Copyright (c) 2015, Frappe Technologies Pvt. Ltd. and Contributors
+# MIT License. See license.txt
+"""
+Bounded in-process LRU tier in front of Redis for hot, rarely changing cache keys
+like `meta`, `app_hooks` and `defaults`.
+
+Enable it by setting `process_cache_max_items` in `common_site_config.json`. Optional
+settings are `process_cache_max_memory` (bytes, default 64 MB), `process_cache_ttl`
+(seconds, default 300) and `process_cache_keys` (list of cache keys / hash names).
+
+Values are shared by all requests served by the process, so they must be treated as
+read-only. Writes and deletes of these keys are published on a Redis channel and every
+process drops its local copy when it receives the message.
+"""
+
+from __future__ import unicode_literals
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import redis
+from six.moves import cPickle as pickle
+
+import frappe
+from frappe.utils import cint
+
+# cache keys and hash names that are read on (almost) every request
+DEFAULT_KEYS = ("meta", "app_hooks", "app_modules", "table_columns", "defaults")
+
+INVALIDATION_CHANNEL = "frappe:process_cache:invalidate"
+
+class ProcessCache(object):
+	def __init__(self, max_items=0, max_memory=64 * 1024 * 1024, ttl=300, keys=DEFAULT_KEYS):
+		self.max_items = max_items
+		self.max_memory = max_memory
+		self.ttl = ttl
+		self.keys = set(keys)
+
+		# key -> (value, size, expires_at), least recently used first
+		self.data = OrderedDict()
+		self.memory = 0
+
+		# incremented on every invalidation, so that values read from redis
+		# while an invalidation was received are not stored
+		self.generation = 0
+
+		self.hits = self.misses = self.evictions = self.invalidations = 0
+		self.lock = threading.RLock()
+		self.listener_pid = None
+
+	def is_cached(self, key):
+		"""Returns True if the (prefixed) redis key belongs to the process cache."""
+		if not self.max_items:
+			return False
+
+		key = get_unprefixed_key(key)
+		return key in self.keys
+
+	def get(self, key):
+		"""Returns the cached value or `None`."""
+		with self.lock:
+			entry = self.data.get(key)
+			if entry is None:
+				self.misses += 1
+				return None
+
+			value, size, expires_at = entry
+			if expires_at < time.time():
+				self._remove(key)
+				self.misses += 1
+				return None
+
+			# mark as most recently used
+			del self.data[key]
+			self.data[key] = entry
+			self.hits += 1
+
+			return value
+
+	def set(self, key, value, size, generation):
+		"""Store value of the given (pickled) size, evicting the least recently used entries.
+
+		:param generation: `self.generation` before the value was read from redis."""
+		with self.lock:
+			if generation != self.generation or size > self.max_memory:
+				return
+
+			if key in self.data:
+				self._remove(key)
+
+			self.data[key] = (value, size, time.time() + self.ttl)
+			self.memory += size
+
+			while len(self.data) > self.max_items or self.memory > self.max_memory:
+				self._remove(next(iter(self.data)))
+				self.evictions += 1
+
+	def invalidate(self, name, key=None):
+		"""Remove value of `name`, or field `key` of hash `name` (all fields if `key` is None)."""
+		with self.lock:
+			self.generation += 1
+			self.invalidations += 1
+
+			if key is not None:
+				self._remove((name, key))
+				return
+
+			self._remove(name)
+			for cache_key in list(self.data):
+				if isinstance(cache_key, tuple) and cache_key[0]==name:
+					self._remove(cache_key)
+
+	def invalidate_prefix(self, prefix):
+		"""Remove all values whose redis key starts with `prefix` (e.g. all keys of a site)."""
+		with self.lock:
+			self.generation += 1
+			self.invalidations += 1
+
+			for cache_key in list(self.data):
+				name = cache_key[0] if isinstance(cache_key, tuple) else cache_key
+				if name.startswith(prefix):
+					self._remove(cache_key)
+
+	def clear(self):
+		with self.lock:
+			self.generation += 1
+			self.data = OrderedDict()
+			self.memory = 0
+
+	def _remove(self, key):
+		entry = self.data.pop(key, None)
+		if entry:
+			self.memory -= entry[1]
+
+	def get_stats(self):
+		"""Returns hit / miss counters and current size for monitoring."""
+		with self.lock:
+			lookups = self.hits + self.misses
+			return frappe._dict({
+				"enabled": bool(self.max_items),
+				"entries": len(self.data),
+				"memory": self.memory,
+				"hits": self.hits,
+				"misses": self.misses,
+				"hit_rate": (float(self.hits) / lookups) if lookups else 0.0,
+				"evictions": self.evictions,
+				"invalidations": self.invalidations
+			})
+
+	def ensure_listener(self, redis_server):
+		"""Start the invalidation listener thread in this process (once per pid, to survive forks)."""
+		pid = os.getpid()
+		if self.listener_pid == pid:
+			return
+
+		with self.lock:
+			if self.listener_pid == pid:
+				return
+
+			# values cached by the parent process may be stale
+			self.clear()
+			self.listener_pid = pid
+
+			thread = threading.Thread(target=self.listen, args=(redis_server,))
+			thread.daemon = True
+			thread.start()
+
+	def listen(self, redis_server):
+		while True:
+			try:
+				pubsub = redis_server.pubsub(ignore_subscribe_messages=True)
+				pubsub.subscribe(INVALIDATION_CHANNEL)
+
+				for message in pubsub.listen():
+					if message and message.get("type")=="message":
+						self.handle_message(message["data"])
+
+			except redis.exceptions.ConnectionError:
+				# invalidations may have been missed
+				self.clear()
+				time.sleep(1)
+
+	def handle_message(self, data):
+		try:
+			action, name, key = pickle.loads(data)
+		except Exception:
+			return
+
+		if action=="prefix":
+			self.invalidate_prefix(name)
+		else:
+			self.invalidate(name, key)
+
+def publish_invalidation(redis_server, action, name, key=None):
+	try:
+		redis_server.publish(INVALIDATION_CHANNEL,
+			pickle.dumps((action, name, key), pickle.HIGHEST_PROTOCOL))
+	except redis.exceptions.ConnectionError:
+		pass
+
+def get_unprefixed_key(key):
+	"""Returns `key` without the site prefix added by `RedisWrapper.make_key`."""
+	if isinstance(key, bytes):
+		key = key.decode('utf-8')
+
+	return key.split("|", 1)[-1]
+
+_process_cache = None
+
+def get_process_cache():
+	"""Returns the process cache, configured from `common_site_config.json` on first use
+	(the process serves all sites of the bench)."""
+	global _process_cache
+	if not _process_cache:
+		conf = frappe.get_common_site_config()
+		_process_cache = ProcessCache(
+			max_items=cint(conf.get("process_cache_max_items")),
+			max_memory=cint(conf.get("process_cache_max_memory")) or 64 * 1024 * 1024,
+			ttl=cint(conf.get("process_cache_ttl")) or 300,
+			keys=conf.get("process_cache_keys") or DEFAULT_KEYS)
+
+	return _process_cache
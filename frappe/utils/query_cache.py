@@ -0,0 +1,76 @@
+# Copyright (c) 2015, Frappe Technologies Pvt. Ltd. and Contributors
+# MIT License. See license.txt
+"""
+Per-process cache of SQL built by the ORM, keyed by the query shape (doctype, fields,
+filter operators etc.), so that hot queries like `get_value`, `db_insert` and `db_update`
+are not formatted again on every call. Only SQL text is cached, values are always
+passed as query parameters.
+
+The number of cached queries can be set with `query_cache_max_items` in
+`common_site_config.json` (default 2000, 0 to disable).
+"""
+
+from __future__ import unicode_literals
+
+import frappe
+from frappe.utils import cint
+
+class QueryCache(object):
+	def __init__(self, max_items=2000):
+		self.max_items = max_items
+		self.data = {}
+
+		# counters by kind of query (the first part of the key)
+		self.hits = {}
+		self.misses = {}
+		self.resets = 0
+
+	def get(self, key, generator):
+		"""Returns the query cached for `key`, building it with `generator()` on a miss.
+
+		:param key: Tuple of the query shape, starting with the kind of query."""
+		query = self.data.get(key)
+		if query is not None:
+			self.hits[key[0]] = self.hits.get(key[0], 0) + 1
+			return query
+
+		self.misses[key[0]] = self.misses.get(key[0], 0) + 1
+		query = generator()
+
+		if self.max_items:
+			if len(self.data) >= self.max_items:
+				# shapes are few in practice, start over instead of tracking usage
+				self.data = {}
+				self.resets += 1
+
+			self.data[key] = query
+
+		return query
+
+	def clear(self):
+		self.data = {}
+
+	def get_stats(self):
+		"""Returns hit / miss counters and hit rate by kind of query."""
+		stats = frappe._dict({"entries": len(self.data), "resets": self.resets, "kinds": {}})
+		for kind in set(self.hits) | set(self.misses):
+			hits, misses = self.hits.get(kind, 0), self.misses.get(kind, 0)
+			stats.kinds[kind] = frappe._dict({
+				"hits": hits,
+				"misses": misses,
+				"hit_rate": float(hits) / (hits + misses)
+			})
+
+		return stats
+
+_query_cache = None
+
+def get_query_cache():
+	"""Returns the query cache, configured from `common_site_config.json` on first use."""
+	global _query_cache
+	if not _query_cache:
+		conf = frappe.get_common_site_config()
+		max_items = conf.get("query_cache_max_items")
+		_query_cache = QueryCache(2000 if max_items is None else cint(max_items))
+
+	return _query_cache
@@ -0,0 +1,200 @@
+# Copyright (c) 2015, Frappe Technologies Pvt. Ltd. and Contributors
+# MIT License. See license.txt
+"""
+Per-request query profiler.
+
+Enable it by setting `query_profiler` in `site_config.json` (it is always on in developer
+mode). For each request it collects the number of queries, the total query time, the
+slowest queries with their Python call site and queries that ran more than once.
+
+In developer mode a summary is sent in the `X-Frappe-Query-Stats` response header. The
+profile of every request is also added to an hourly report in redis, kept for
+`REPORT_HOURS` hours, see `bench query-report`.
+"""
+
+from __future__ import unicode_literals
+import hashlib
+import json
+import os
+import re
+import sys
+
+import frappe
+from frappe.utils import cint, cstr, now_datetime, add_to_date
+
+SLOWEST_QUERIES = 5
+REPORT_HOURS = 24
+
+# frames of these files are skipped when looking for the call site of a query
+IGNORED_FILES = (os.path.join("frappe", "database.py"), os.path.join("frappe", "__init__.py"),
+	os.path.join("frappe", "model", "db_query.py"), os.path.join("frappe", "utils", "query_profiler.py"))
+
+normalize_patterns = (
+	(re.compile(r"'(?:[^'\\]|\\.)*'"), "?"),
+	(re.compile(r'"(?:[^"\\]|\\.)*"'), "?"),
+	(re.compile(r"\b\d+(?:\.\d+)?\b"), "?"),
+	(re.compile(r"\(\s*\?(?:\s*,\s*\?)*\s*\)"), "(?)"),
+	(re.compile(r"\s+"), " ")
+)
+
+class QueryProfiler(object):
+	def __init__(self):
+		self.count = 0
+		self.time = 0.0
+
+		# normalized query -> stats
+		self.queries = {}
+
+		# executed query (with values) -> number of times
+		self.executed = {}
+
+	def record(self, query, elapsed):
+		"""Add a query (as sent to the database) that took `elapsed` seconds."""
+		self.count += 1
+		self.time += elapsed
+		self.executed[query] = self.executed.get(query, 0) + 1
+
+		normalized = normalize_query(query)
+		stats = self.queries.get(normalized)
+		if not stats:
+			stats = self.queries[normalized] = frappe._dict(query=normalized, count=0, time=0.0,
+				max_time=0.0, duplicates=0, call_site=get_call_site())
+
+		stats.count += 1
+		stats.time += elapsed
+		stats.max_time = max(stats.max_time, elapsed)
+		if self.executed[query] > 1:
+			stats.duplicates += 1
+
+	def get_slowest(self, limit=SLOWEST_QUERIES):
+		return sorted(self.queries.values(), key=lambda d: d.max_time, reverse=True)[:limit]
+
+	def get_duplicates(self):
+		"""Returns list of `(query, times)` for queries executed more than once with the same values."""
+		return sorted([(query, count) for query, count in self.executed.items() if count > 1],
+			key=lambda d: d[1], reverse=True)
+
+	def get_summary(self):
+		return {
+			"count": self.count,
+			"time": round(self.time * 1000, 2),
+			"duplicates": sum(count - 1 for count in self.executed.values()),
+			"slowest": [{
+				"query": d.query[:200],
+				"time": round(d.max_time * 1000, 2),
+				"call_site": d.call_site
+			} for d in self.get_slowest()]
+		}
+
+def normalize_query(query):
+	"""Returns query with values replaced by `?` and whitespace collapsed."""
+	query = cstr(query)
+	for pattern, replacement in normalize_patterns:
+		query = pattern.sub(replacement, query)
+
+	return query.strip()
+
+def get_call_site():
+	"""Returns `path:line function` of the first caller outside the database layer."""
+	frame = sys._getframe(1)
+	while frame:
+		filename = frame.f_code.co_filename
+		if not filename.endswith(IGNORED_FILES):
+			if "apps" + os.sep in filename:
+				filename = filename.rsplit("apps" + os.sep, 1)[1]
+			return "{0}:{1} {2}".format(filename, frame.f_lineno, frame.f_code.co_name)
+
+		frame = frame.f_back
+
+def is_enabled():
+	conf = frappe.local.conf
+	return bool(conf.query_profiler or conf.developer_mode)
+
+def start():
+	"""Start profiling queries of this request, if enabled."""
+	if is_enabled():
+		frappe.local.query_profiler = QueryProfiler()
+
+def stop(response=None):
+	"""Add the request's profile to the report and, in developer mode, to the response headers."""
+	profiler = getattr(frappe.local, "query_profiler", None)
+	if not profiler:
+		return
+
+	frappe.local.query_profiler = None
+	if not profiler.count:
+		return
+
+	if response is not None and frappe.local.conf.developer_mode:
+		response.headers[str("X-Frappe-Query-Stats")] = str(json.dumps(profiler.get_summary()))
+
+	try:
+		add_to_report(profiler)
+	except Exception:
+		# profiling must not fail the request
+		frappe.log_error(title="Query Profiler")
+
+def get_report_key(hour=None):
+	return "query_profile:" + (hour or now_datetime()).strftime("%Y%m%d%H")
+
+def get_queries_key(hour=None):
+	"""Key of the hash of query texts seen in the hour, expires with the report of the hour."""
+	return "query_profile_queries:" + (hour or now_datetime()).strftime("%Y%m%d%H")
+
+def get_query_hash(query):
+	return hashlib.md5(query.encode("utf-8")).hexdigest()[:12]
+
+def add_to_report(profiler):
+	"""Add counters of the request to the current hour's report in redis."""
+	counters = {"requests": 1, "queries": profiler.count, "time": profiler.time}
+	for stats in profiler.queries.values():
+		stats.hash = get_query_hash(stats.query)
+		counters[stats.hash + "|count"] = stats.count
+		counters[stats.hash + "|time"] = stats.time
+		if stats.duplicates:
+			counters[stats.hash + "|duplicates"] = stats.duplicates
+
+	hour = now_datetime()
+	cache = frappe.cache()
+	values = cache.hincrby_many(get_report_key(hour), counters,
+		expires_in_sec=REPORT_HOURS * 3600)
+
+	# store text of queries seen for the first time in this hour
+	new_queries = [stats for stats in profiler.queries.values()
+		if values.get(stats.hash + "|count") == stats.count]
+	if new_queries:
+		queries_key = get_queries_key(hour)
+		with cache.pipeline() as pipe:
+			for stats in new_queries:
+				pipe.hset(queries_key, stats.hash, {"query": stats.query, "call_site": stats.call_site})
+			pipe.execute()
+
+		cache.expire(cache.make_key(queries_key), REPORT_HOURS * 3600)
+
+def get_report(hours=1, sort_by="time", limit=20):
+	"""Returns totals and the top queries (by `time`, `count` or `duplicates`) of the last `hours`."""
+	cache = frappe.cache()
+	totals = frappe._dict(requests=0, queries=0, time=0.0)
+	queries = {}
+
+	report_hours = [add_to_date(now_datetime(), hours=-i) for i in range(min(cint(hours), REPORT_HOURS))]
+	for hour in report_hours:
+		for key, value in cache.get_counters(get_report_key(hour)).items():
+			if "|" not in key:
+				totals[key] = totals.get(key, 0) + value
+				continue
+
+			query_hash, counter = key.split("|", 1)
+			stats = queries.setdefault(query_hash, frappe._dict(count=0, time=0.0, duplicates=0))
+			stats[counter] += value
+
+	top = sorted(queries.items(), key=lambda d: d[1].get(sort_by, 0), reverse=True)[:limit]
+	for query_hash, stats in top:
+		for hour in report_hours:
+			query = cache.hget(get_queries_key(hour), query_hash)
+			if query:
+				stats.update(query)
+				break
+
+	totals.top = [stats for query_hash, stats in top]
+	return totals
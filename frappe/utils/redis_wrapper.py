@@ -5,6 +5,7 @@ from __future__ import unicode_literals
 import redis, frappe, re
 from six.moves import cPickle as pickle
 from frappe.utils import cstr
+from frappe.utils.process_cache import get_process_cache, publish_invalidation
 from six import iteritems
 
 
@@ -34,11 +35,13 @@ class RedisWrapper(redis.Redis):
 		if not expires_in_sec:
 			frappe.local.cache[key] = val
 
+		self.invalidate_process_cache(key)
+
 		try:
 			if expires_in_sec:
-				self.setex(key, pickle.dumps(val), expires_in_sec)
+				self.setex(key, pickle.dumps(val, pickle.HIGHEST_PROTOCOL), expires_in_sec)
 			else:
-				self.set(key, pickle.dumps(val))
+				self.set(key, pickle.dumps(val, pickle.HIGHEST_PROTOCOL))
 
 		except redis.exceptions.ConnectionError:
 			return None
@@ -58,14 +61,26 @@ class RedisWrapper(redis.Redis):
 			val = frappe.local.cache[key]
 
 		else:
-			val = None
-			try:
-				val = self.get(key)
-			except redis.exceptions.ConnectionError:
-				pass
+			process_cache = get_process_cache()
+			use_process_cache = not expires and process_cache.is_cached(key)
 
-			if val is not None:
-				val = pickle.loads(val)
+			val = None
+			if use_process_cache:
+				process_cache.ensure_listener(self)
+				val = process_cache.get(key)
+
+			if val is None:
+				generation = process_cache.generation
+				try:
+					val = self.get(key)
+				except redis.exceptions.ConnectionError:
+					pass
+
+				if val is not None:
+					size = len(val)
+					val = pickle.loads(val)
+					if use_process_cache:
+						process_cache.set(key, val, size, generation)
 
 			if not expires:
 				if val is None and generator:
@@ -77,27 +92,107 @@ class RedisWrapper(redis.Redis):
 
 		return val
 
+	def invalidate_process_cache(self, name, key=None):
+		"""Drop value from the process cache of this and all other processes."""
+		process_cache = get_process_cache()
+		if process_cache.is_cached(name):
+			process_cache.invalidate(name, key)
+			publish_invalidation(self, "key", name, key)
+
+	def clear_process_cache(self):
+		"""Drop all values of this site from the process cache of all processes."""
+		process_cache = get_process_cache()
+		if process_cache.max_items:
+			prefix = self.make_key("")
+			process_cache.invalidate_prefix(prefix)
+			publish_invalidation(self, "prefix", prefix)
+
+	def get_process_cache_stats(self):
+		"""Returns hit / miss counters of the process cache."""
+		return get_process_cache().get_stats()
+
+	def get_values(self, keys, user=None):
+		"""Returns cache values of multiple keys as a dict, using one `MGET` for keys
+		that are not in `frappe.local.cache`.
+
+		:param keys: List of cache keys.
+		:param user: Prepends keys with User."""
+		out = {}
+		to_fetch = []
+		for key in keys:
+			_key = self.make_key(key, user)
+			if _key in frappe.local.cache:
+				out[key] = frappe.local.cache[_key]
+			else:
+				to_fetch.append((key, _key))
+
+		if to_fetch:
+			try:
+				values = self.mget([k for _, k in to_fetch])
+			except redis.exceptions.ConnectionError:
+				values = [None] * len(to_fetch)
+
+			for (key, _key), val in zip(to_fetch, values):
+				if val is not None:
+					val = pickle.loads(val)
+				frappe.local.cache[_key] = out[key] = val
+
+		return out
+
+	def set_values(self, mapping, user=None, expires_in_sec=None):
+		"""Sets multiple cache values in one round trip.
+
+		:param mapping: Dict of cache key and value.
+		:param user: Prepends keys with User.
+		:param expires_in_sec: Expire values in X seconds."""
+		with self.pipeline(transaction=False) as pipe:
+			for key, val in iteritems(mapping):
+				pipe.set_value(key, val, user=user, expires_in_sec=expires_in_sec)
+			pipe.execute()
+
 	def get_all(self, key):
-		ret = {}
-		for k in self.get_keys(key):
-			ret[key] = self.get_value(k)
+		"""Returns all values of keys starting with `key` as a dict."""
+		keys = self.get_keys(key)
+		if not keys:
+			return {}
+
+		try:
+			values = self.mget(keys)
+		except redis.exceptions.ConnectionError:
+			return {}
 
-		return ret
+		return {cstr(k).split("|", 1)[1]: (pickle.loads(v) if v is not None else None)
+			for k, v in zip(keys, values)}
 
 	def get_keys(self, key):
 		"""Return keys starting with `key`."""
+		return list(self.scan_keys(key))
+
+	def scan_keys(self, key, count=1000):
+		"""Iterate over keys starting with `key` using `SCAN`, without blocking the server like `KEYS`."""
 		try:
 			key = self.make_key(key + "*")
-			return self.keys(key)
+			for k in self.scan_iter(match=key, count=count):
+				yield k
 
 		except redis.exceptions.ConnectionError:
 			regex = re.compile(cstr(key).replace("|", "\|").replace("*", "[\w]*"))
-			return [k for k in frappe.local.cache.keys() if regex.match(k.decode())]
+			for k in list(frappe.local.cache.keys()):
+				if regex.match(k.decode()):
+					yield k
 
 	def delete_keys(self, key):
 		"""Delete keys with wildcard `*`."""
+		batch = []
 		try:
-			self.delete_value(self.get_keys(key), make_keys=False)
+			for k in self.scan_keys(key):
+				batch.append(k)
+				if len(batch) >= 1000:
+					self.delete_value(batch, make_keys=False)
+					batch = []
+
+			if batch:
+				self.delete_value(batch, make_keys=False)
 		except redis.exceptions.ConnectionError:
 			pass
 
@@ -109,18 +204,34 @@ class RedisWrapper(redis.Redis):
 		if not isinstance(keys, (list, tuple)):
 			keys = (keys, )
 
-		for key in keys:
-			if make_keys:
-				key = self.make_key(key, shared=shared)
+		if make_keys:
+			keys = [self.make_key(key, shared=shared) for key in keys]
 
+		for key in keys:
 			if key in frappe.local.cache:
 				del frappe.local.cache[key]
 
+			self.invalidate_process_cache(key)
+
+		if keys:
 			try:
-				self.delete(key)
+				self.delete(*keys)
 			except redis.exceptions.ConnectionError:
 				pass
 
+	def pipeline(self, transaction=True, shard_hint=None):
+		"""Returns a `RedisPipeline` to send multiple cache commands in one round trip.
+
+		Example:
+
+			with frappe.cache().pipeline() as pipe:
+				pipe.hget("notification_count:ToDo", frappe.session.user)
+				pipe.hget("notification_count:Event", frappe.session.user)
+				todo_count, event_count = pipe.execute()
+		"""
+		return RedisPipeline(self,
+			super(RedisWrapper, self).pipeline(transaction=transaction, shard_hint=shard_hint))
+
 	def lpush(self, key, value):
 		super(redis.Redis, self).lpush(self.make_key(key), value)
 
@@ -133,6 +244,54 @@ class RedisWrapper(redis.Redis):
 	def llen(self, key):
 		return super(redis.Redis, self).llen(self.make_key(key))
 
+	def sadd(self, name, *values):
+		super(redis.Redis, self).sadd(self.make_key(name), *values)
+
+	def sadd_if_member(self, name, member, *values):
+		"""Add `values` to set `name` only if `member` is in the set (i.e. the set is loaded),
+		atomically. Returns number of values added."""
+		return super(redis.Redis, self).eval("""if redis.call('sismember', KEYS[1], ARGV[1]) == 1 then
+			return redis.call('sadd', KEYS[1], unpack(ARGV, 2)) end return 0""",
+			1, self.make_key(name), member, *values)
+
+	def srem(self, name, *values):
+		super(redis.Redis, self).srem(self.make_key(name), *values)
+
+	def set_members(self, name, values, expires_in_sec=None):
+		"""Replace members of set `name` with `values`."""
+		_name = self.make_key(name)
+		pipe = super(RedisWrapper, self).pipeline()
+		pipe.delete(_name)
+		if values:
+			pipe.sadd(_name, *values)
+			if expires_in_sec:
+				pipe.expire(_name, expires_in_sec)
+		pipe.execute()
+
+	def get_sets(self, names):
+		"""Returns members of sets `names` in one round trip. Missing sets are empty."""
+		pipe = super(RedisWrapper, self).pipeline(transaction=False)
+		for name in names:
+			pipe.smembers(self.make_key(name))
+
+		return [set(cstr(v) for v in members) for members in pipe.execute()]
+
+	def get_set_sizes(self, names):
+		"""Returns number of members of sets `names` in one round trip."""
+		pipe = super(RedisWrapper, self).pipeline(transaction=False)
+		for name in names:
+			pipe.scard(self.make_key(name))
+
+		return pipe.execute()
+
+	def sismember_many(self, members):
+		"""Returns list of booleans for list of `(set name, value)` in one round trip."""
+		pipe = super(RedisWrapper, self).pipeline(transaction=False)
+		for name, value in members:
+			pipe.sismember(self.make_key(name), value)
+
+		return [bool(d) for d in pipe.execute()]
+
 	def hset(self, name, key, value, shared=False):
 		_name = self.make_key(name, shared=shared)
 
@@ -141,13 +300,84 @@ class RedisWrapper(redis.Redis):
 			frappe.local.cache[_name] = {}
 		frappe.local.cache[_name][key] = value
 
+		self.invalidate_process_cache(_name, key)
+
 		# set in redis
 		try:
 			super(redis.Redis, self).hset(_name,
-				key, pickle.dumps(value))
+				key, pickle.dumps(value, pickle.HIGHEST_PROTOCOL))
 		except redis.exceptions.ConnectionError:
 			pass
 
+	def hmget(self, name, keys, shared=False):
+		"""Returns values of multiple keys of hash `name` as a dict, using one `HMGET`
+		for keys that are not in `frappe.local.cache`."""
+		_name = self.make_key(name, shared=shared)
+		if not _name in frappe.local.cache:
+			frappe.local.cache[_name] = {}
+
+		local_cache = frappe.local.cache[_name]
+		out = {}
+		to_fetch = []
+		for key in keys:
+			if key in local_cache:
+				out[key] = local_cache[key]
+			else:
+				to_fetch.append(key)
+
+		if to_fetch:
+			try:
+				values = super(redis.Redis, self).hmget(_name, to_fetch)
+			except redis.exceptions.ConnectionError:
+				values = [None] * len(to_fetch)
+
+			for key, value in zip(to_fetch, values):
+				if value:
+					value = pickle.loads(value)
+					local_cache[key] = value
+				out[key] = value
+
+		return out
+
+	def hincrby(self, name, key, amount=1, shared=False):
+		"""Increment counter `key` of hash `name`. Counters are stored as plain numbers,
+		read them with `get_counters`."""
+		return super(redis.Redis, self).hincrby(self.make_key(name, shared=shared), key, amount)
+
+	def hincrbyfloat(self, name, key, amount=1.0, shared=False):
+		return super(redis.Redis, self).hincrbyfloat(self.make_key(name, shared=shared), key, amount)
+
+	def hincrby_many(self, name, counters, expires_in_sec=None, shared=False):
+		"""Increment counters of hash `name` (dict of key: amount) in one round trip.
+		Returns the new values as a dict."""
+		_name = self.make_key(name, shared=shared)
+		keys = list(counters)
+
+		pipe = super(RedisWrapper, self).pipeline(transaction=False)
+		for key in keys:
+			if isinstance(counters[key], float):
+				pipe.hincrbyfloat(_name, key, counters[key])
+			else:
+				pipe.hincrby(_name, key, counters[key])
+
+		if expires_in_sec:
+			pipe.expire(_name, expires_in_sec)
+
+		try:
+			return dict(zip(keys, pipe.execute()))
+		except redis.exceptions.ConnectionError:
+			return {}
+
+	def get_counters(self, name, shared=False):
+		"""Returns counters of hash `name` set via `hincrby` / `hincrbyfloat`"""
+		try:
+			values = super(redis.Redis, self).hgetall(self.make_key(name, shared=shared))
+		except redis.exceptions.ConnectionError:
+			values = {}
+
+		return {(key.decode('utf-8') if isinstance(key, bytes) else key): float(value)
+			for key, value in iteritems(values)}
+
 	def hgetall(self, name):
 		return {key: pickle.loads(value) for key, value in
 			iteritems(super(redis.Redis, self).hgetall(self.make_key(name)))}
@@ -160,15 +390,28 @@ class RedisWrapper(redis.Redis):
 		if key in frappe.local.cache[_name]:
 			return frappe.local.cache[_name][key]
 
+		process_cache = get_process_cache()
+		use_process_cache = process_cache.is_cached(_name)
+		if use_process_cache:
+			process_cache.ensure_listener(self)
+			value = process_cache.get((_name, key))
+			if value is not None:
+				frappe.local.cache[_name][key] = value
+				return value
+
 		value = None
+		generation = process_cache.generation
 		try:
 			value = super(redis.Redis, self).hget(_name, key)
 		except redis.exceptions.ConnectionError:
 			pass
 
 		if value:
+			size = len(value)
 			value = pickle.loads(value)
 			frappe.local.cache[_name][key] = value
+			if use_process_cache:
+				process_cache.set((_name, key), value, size, generation)
 		elif generator:
 			value = generator()
 			try:
@@ -183,6 +426,9 @@ class RedisWrapper(redis.Redis):
 		if _name in frappe.local.cache:
 			if key in frappe.local.cache[_name]:
 				del frappe.local.cache[_name][key]
+
+		self.invalidate_process_cache(_name, key)
+
 		try:
 			super(redis.Redis, self).hdel(_name, key)
 		except redis.exceptions.ConnectionError:
@@ -194,10 +440,137 @@ class RedisWrapper(redis.Redis):
 			name = name.split("|", 1)[1]
 			self.hdel(name, key)
 
+	def hlen(self, name):
+		try:
+			return super(redis.Redis, self).hlen(self.make_key(name))
+		except redis.exceptions.ConnectionError:
+			return 0
+
+	def hexists(self, name, key):
+		try:
+			return super(redis.Redis, self).hexists(self.make_key(name), key)
+		except redis.exceptions.ConnectionError:
+			return False
+
 	def hkeys(self, name):
 		try:
 			return super(redis.Redis, self).hkeys(self.make_key(name))
 		except redis.exceptions.ConnectionError:
 			return []
 
+class RedisPipeline(object):
+	"""Buffers cache commands and sends them to redis in one round trip on `execute`.
+
+	Keys are prefixed like in `RedisWrapper`, values are pickled and values read from
+	or written to redis are kept in `frappe.local.cache`. Reads of values already in
+	`frappe.local.cache` do not go to redis."""
+	def __init__(self, redis_server, pipe):
+		self.redis_server = redis_server
+		self.pipe = pipe
+		self.reset()
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, type, value, traceback):
+		self.pipe.reset()
+
+	def reset(self):
+		# one (is_local, value or callback) per queued command
+		self.results = []
+
+	def get_value(self, key, user=None):
+		_key = self.redis_server.make_key(key, user)
+		if _key in frappe.local.cache:
+			self.results.append((True, frappe.local.cache[_key]))
+			return
+
+		def callback(val):
+			if val is not None:
+				val = pickle.loads(val)
+			frappe.local.cache[_key] = val
+			return val
+
+		self.pipe.get(_key)
+		self.results.append((False, callback))
+
+	def set_value(self, key, val, user=None, expires_in_sec=None):
+		_key = self.redis_server.make_key(key, user)
+		if not expires_in_sec:
+			frappe.local.cache[_key] = val
+
+		self.redis_server.invalidate_process_cache(_key)
+
+		if expires_in_sec:
+			self.pipe.setex(_key, pickle.dumps(val, pickle.HIGHEST_PROTOCOL), expires_in_sec)
+		else:
+			self.pipe.set(_key, pickle.dumps(val, pickle.HIGHEST_PROTOCOL))
+		self.results.append((False, None))
+
+	def hget(self, name, key, shared=False):
+		_name = self.redis_server.make_key(name, shared=shared)
+		local_cache = frappe.local.cache.setdefault(_name, {})
+		if key in local_cache:
+			self.results.append((True, local_cache[key]))
+			return
+
+		def callback(value):
+			if value:
+				value = pickle.loads(value)
+				local_cache[key] = value
+			return value
+
+		self.pipe.hget(_name, key)
+		self.results.append((False, callback))
+
+	def hset(self, name, key, value, shared=False):
+		_name = self.redis_server.make_key(name, shared=shared)
+		frappe.local.cache.setdefault(_name, {})[key] = value
+
+		self.redis_server.invalidate_process_cache(_name, key)
+
+		self.pipe.hset(_name, key, pickle.dumps(value, pickle.HIGHEST_PROTOCOL))
+		self.results.append((False, None))
+
+	def hdel(self, name, key, shared=False):
+		_name = self.redis_server.make_key(name, shared=shared)
+		frappe.local.cache.get(_name, {}).pop(key, None)
+
+		self.redis_server.invalidate_process_cache(_name, key)
+
+		self.pipe.hdel(_name, key)
+		self.results.append((False, None))
+
+	def delete_value(self, keys, user=None, shared=False):
+		if not isinstance(keys, (list, tuple)):
+			keys = (keys, )
+
+		keys = [self.redis_server.make_key(key, user, shared=shared) for key in keys]
+		for key in keys:
+			frappe.local.cache.pop(key, None)
+			self.redis_server.invalidate_process_cache(key)
+
+		self.pipe.delete(*keys)
+		self.results.append((False, None))
+
+	def execute(self):
+		"""Send queued commands and return their results in order."""
+		raw_results = []
+		if self.pipe.command_stack:
+			try:
+				raw_results = self.pipe.execute()
+			except redis.exceptions.ConnectionError:
+				self.pipe.reset()
+
+		raw_results = iter(raw_results)
+
+		out = []
+		for is_local, value in self.results:
+			if is_local:
+				out.append(value)
+			else:
+				raw = next(raw_results, None)
+				out.append(value(raw) if value else raw)
 
+		self.reset()
+		return out
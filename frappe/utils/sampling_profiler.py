@@ -0,0 +1,187 @@
+# Copyright (c) 2015, Frappe Technologies Pvt. Ltd. and Contributors
+# MIT License. See license.txt
+"""
+Sampling profiler for production traffic.
+
+Enable it in `site_config.json`:
+
+	"sampling_profiler": {
+		"sample_rate": 0.01,	# fraction of requests to profile
+		"interval": 0.005,		# seconds between stack samples
+		"users": ["test@example.com"],	# optional, only these users
+		"paths": ["^/api/method/frappe.desk"]	# optional, only paths matching these patterns
+	}
+
+The stack of a profiled request is sampled from a separate thread. Samples are counted
+per route (`cmd`, api method or website page, see `get_route`) in redis as collapsed
+stacks, the format read by flame graph tools, see `bench sampling-profile`.
+"""
+
+from __future__ import unicode_literals
+import os
+import random
+import re
+import sys
+import threading
+
+import frappe
+from frappe.utils import flt
+
+SAMPLE_RATE = 0.01
+INTERVAL = 0.005
+
+# samples are kept for 7 days after the last profiled request of the route
+EXPIRES_IN_SEC = 7 * 24 * 3600
+
+# samples of further routes are counted under `OTHER_ROUTE`
+MAX_ROUTES = 500
+OTHER_ROUTE = "other"
+
+# first part of paths that are aggregated as one route
+PATH_PREFIXES = ("files", "private", "assets", "desk", "backups")
+
+APP_FILE = os.path.join("frappe", "app.py")
+
+class Sampler(object):
+	def __init__(self, thread_id, interval=INTERVAL):
+		self.thread_id = thread_id
+		self.interval = interval
+
+		# collapsed stack -> number of samples
+		self.stacks = {}
+
+		self.stopped = threading.Event()
+		self.thread = threading.Thread(target=self.run)
+		self.thread.daemon = True
+
+	def start(self):
+		self.thread.start()
+
+	def run(self):
+		while not self.stopped.wait(self.interval):
+			frame = sys._current_frames().get(self.thread_id)
+			if frame is None:
+				break
+
+			stack = collapse_stack(frame)
+			self.stacks[stack] = self.stacks.get(stack, 0) + 1
+
+	def stop(self):
+		"""Stop sampling and return the counts of collapsed stacks."""
+		self.stopped.set()
+		self.thread.join()
+		return self.stacks
+
+def collapse_stack(frame):
+	"""Returns the stack of `frame` as `outermost;...;innermost`, starting at `frappe.app`."""
+	frames = []
+	while frame:
+		frames.append(frame)
+		frame = frame.f_back
+
+	frames.reverse()
+	for i, f in enumerate(frames):
+		if f.f_code.co_filename.endswith(APP_FILE):
+			frames = frames[i:]
+			break
+
+	return ";".join(get_frame_name(f) for f in frames)
+
+def get_frame_name(frame):
+	filename = frame.f_code.co_filename
+	if "apps" + os.sep in filename:
+		filename = filename.rsplit("apps" + os.sep, 1)[1]
+
+	return "{0}:{1}".format(filename, frame.f_code.co_name)
+
+def get_config():
+	config = frappe.local.conf.sampling_profiler
+	if not config:
+		return None
+
+	return frappe._dict(config if isinstance(config, dict) else {})
+
+def should_sample(config):
+	if random.random() >= flt(config.get("sample_rate", SAMPLE_RATE)):
+		return False
+
+	if config.users and frappe.session.user not in config.users:
+		return False
+
+	if config.paths and not any(re.search(p, frappe.request.path) for p in config.paths):
+		return False
+
+	return True
+
+def get_route():
+	"""Returns the key to aggregate samples of this request: `cmd`, the api method or resource
+	DocType, or the website page (the DocType for pages of website generators)."""
+	if frappe.local.form_dict.cmd:
+		return frappe.local.form_dict.cmd
+
+	parts = frappe.request.path.strip("/").split("/")
+	if parts[0]=="api":
+		# /api/method/<method>, /api/resource/<doctype>/<name>
+		return "/" + "/".join(parts[:3])
+
+	if parts[0] in PATH_PREFIXES:
+		return "/" + parts[0]
+
+	response = getattr(frappe.local, "response", None) or {}
+	return response.get("page_name") or "/" + "/".join(parts)
+
+def get_capped_route(route):
+	"""Returns `route`, or `OTHER_ROUTE` if `MAX_ROUTES` other routes are already sampled."""
+	cache = frappe.cache()
+	if (cache.hlen("sampling_profile_routes") >= MAX_ROUTES
+		and not cache.hexists("sampling_profile_routes", route)):
+		return OTHER_ROUTE
+
+	return route
+
+def start():
+	"""Start sampling this request, if the profiler is enabled and the request is picked."""
+	config = get_config()
+	if config and should_sample(config):
+		frappe.local.sampler = Sampler(threading.current_thread().ident,
+			flt(config.get("interval")) or INTERVAL)
+		frappe.local.sampler.start()
+
+def stop():
+	"""Stop sampling and add the samples of this request to the route's counters in redis."""
+	sampler = getattr(frappe.local, "sampler", None)
+	if not sampler:
+		return
+
+	frappe.local.sampler = None
+	stacks = sampler.stop()
+	if not stacks:
+		return
+
+	try:
+		route = get_capped_route(get_route())
+		frappe.cache().hincrby_many("sampling_profile:" + route, stacks,
+			expires_in_sec=EXPIRES_IN_SEC)
+		frappe.cache().hincrby_many("sampling_profile_routes", {route: sum(stacks.values())},
+			expires_in_sec=EXPIRES_IN_SEC)
+	except Exception:
+		# profiling must not fail the request
+		frappe.log_error(title="Sampling Profiler")
+
+def get_routes():
+	"""Returns dict of route: number of samples."""
+	return frappe.cache().get_counters("sampling_profile_routes")
+
+def get_collapsed_stacks(route=None):
+	"""Returns lines of `stack count` for the route (all routes if not set)."""
+	stacks = {}
+	for r in ([route] if route else get_routes()):
+		for stack, count in frappe.cache().get_counters("sampling_profile:" + r).items():
+			stacks[stack] = stacks.get(stack, 0) + int(count)
+
+	return ["{0} {1}".format(stack, count) for stack, count in sorted(stacks.items())]
+
+def clear():
+	for route in get_routes():
+		frappe.cache().delete_value("sampling_profile:" + route)
+	frappe.cache().delete_value("sampling_profile_routes")
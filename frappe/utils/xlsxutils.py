@@ -12,7 +12,9 @@ from six import StringIO, string_types
 
 
 # return xlsx file object
-def make_xlsx(data, sheet_name, wb=None):
+def make_xlsx(data, sheet_name, wb=None, output=None):
+	"""Write rows to a write-only workbook. `data` can be any iterable, rows are not kept
+	in memory. Saved to `output` (path or file object) if given."""
 
 	if wb is None:
 		wb = openpyxl.Workbook(write_only=True)
@@ -33,7 +35,7 @@ def make_xlsx(data, sheet_name, wb=None):
 
 		ws.append(clean_row)
 
-	xlsx_file = StringIO()
+	xlsx_file = output or StringIO()
 	wb.save(xlsx_file)
 	return xlsx_file
 
@@ -1,7 +1,8 @@
 from __future__ import unicode_literals
 import unittest
 import frappe
-from frappe.website.router import resolve_route
+from frappe.website.router import (resolve_route, get_route_from_index, is_not_found,
+	set_not_found, clear_not_found)
 
 test_records = frappe.get_test_records('Web Page')
 
@@ -14,4 +15,45 @@ class TestWebPage(unittest.TestCase):
 	def test_check_sitemap(self):
 		resolve_route("test-web-page-1")
 		resolve_route("test-web-page-1/test-web-page-2")
-		resolve_route("test-web-page-1/test-web-page-3")
\ No newline at end of file
+		resolve_route("test-web-page-1/test-web-page-3")
+
+	def test_route_index(self):
+		page = frappe.get_doc("Web Page", {"route": "test-web-page-1"})
+		self.assertEquals(get_route_from_index("test-web-page-1"),
+			{"doctype": "Web Page", "name": page.name})
+
+		page.published = 0
+		page.save()
+		self.assertFalse(get_route_from_index("test-web-page-1"))
+		self.assertFalse(resolve_route("test-web-page-1"))
+
+		page.published = 1
+		page.route = "test-web-page-renamed"
+		page.save()
+		self.assertTrue(resolve_route("test-web-page-renamed"))
+
+		# re-routed without hooks, found in the database and added to the index
+		frappe.db.set_value("Web Page", page.name, "route", "test-web-page-db-set")
+		self.assertEquals(get_route_from_index("test-web-page-db-set"),
+			{"doctype": "Web Page", "name": page.name})
+		self.assertEquals(frappe.cache().hget("website_route_index", "test-web-page-db-set"),
+			{"doctype": "Web Page", "name": page.name})
+
+		# db_set updates the index
+		page.reload()
+		page.db_set("route", "test-web-page-db-set-2")
+		self.assertEquals(frappe.cache().hget("website_route_index", "test-web-page-db-set-2"),
+			{"doctype": "Web Page", "name": page.name})
+
+		# stale entry, deleted without updating the index
+		frappe.db.sql("delete from `tabWeb Page` where name=%s", page.name)
+		self.assertFalse(resolve_route("test-web-page-db-set-2"))
+		self.assertFalse(get_route_from_index("test-web-page-db-set-2"))
+
+	def test_not_found_cache(self):
+		clear_not_found()
+		self.assertFalse(is_not_found("test-missing-page"))
+		set_not_found("test-missing-page")
+		self.assertTrue(is_not_found("test-missing-page"))
+		clear_not_found()
+		self.assertFalse(is_not_found("test-missing-page"))
@@ -5,18 +5,18 @@ from __future__ import unicode_literals
 import frappe
 from frappe import _
 import frappe.sessions
-from frappe.utils import cstr
-import os, mimetypes, json
+from frappe.utils import cstr, cint
+import mimetypes, json, hashlib
 
 from six import iteritems
 from werkzeug.wrappers import Response
 from werkzeug.routing import Map, Rule, NotFound
-from werkzeug.wsgi import wrap_file
 
 from frappe.website.context import get_context
 from frappe.website.utils import (get_home_page, can_cache, delete_page_cache,
-	get_toc, get_next_link)
-from frappe.website.router import clear_sitemap
+	get_page_cache_key, get_toc, get_next_link)
+from frappe.website.router import clear_sitemap, is_not_found, set_not_found, clear_not_found
+from frappe.website.static_files import get_static_file, get_response as get_static_file_response
 from frappe.translate import guess_language
 
 class PageNotFoundError(Exception): pass
@@ -29,7 +29,7 @@ def render(path=None, http_status_code=None):
 	data = None
 
 	# if in list of already known 404s, send it
-	if can_cache() and frappe.cache().hget('website_404', frappe.request.url):
+	if can_cache() and is_not_found(path):
 		data = render_page('404')
 		http_status_code = 404
 	elif is_static_file(path):
@@ -48,7 +48,7 @@ def render(path=None, http_status_code=None):
 				frappe.local.form_dict.doctype = doctype
 			else:
 				# 404s are expensive, cache them!
-				frappe.cache().hset('website_404', frappe.request.url, True)
+				set_not_found(path)
 				data = render_page('404')
 				http_status_code = 404
 
@@ -77,29 +77,16 @@ def render(path=None, http_status_code=None):
 	return build_response(path, data, http_status_code or 200)
 
 def is_static_file(path):
-	if ('.' not in path):
-		return False
-	extn = path.rsplit('.', 1)[-1]
-	if extn in ('html', 'md', 'js', 'xml', 'css'):
-		return False
-
-	for app in frappe.get_installed_apps():
-		file_path = frappe.get_app_path(app, 'www') + '/' + path
-		if os.path.exists(file_path):
-			frappe.flags.file_path = file_path
-			return True
+	info = get_static_file(path)
+	if info:
+		frappe.flags.file_path = info.file_path
+		frappe.flags.static_file = info
+		return True
 
 	return False
 
 def get_static_file_reponse():
-	try:
-		f = open(frappe.flags.file_path, 'rb')
-	except IOError:
-		raise NotFound
-
-	response = Response(wrap_file(frappe.local.request.environ, f), direct_passthrough=True)
-	response.mimetype = mimetypes.guess_type(frappe.flags.file_path)[0] or b'application/octet-stream'
-	return response
+	return get_static_file_response(frappe.flags.static_file)
 
 
 def build_response(path, data, http_status_code, headers=None):
@@ -114,8 +101,27 @@ def build_response(path, data, http_status_code, headers=None):
 		for key, val in iteritems(headers):
 			response.headers[bytes(key)] = val.encode("utf-8")
 
+	if http_status_code==200 and frappe.local.response.page_hash:
+		set_cache_headers(response)
+
 	return response
 
+def set_cache_headers(response):
+	"""Set `ETag` and `Cache-Control` for a cacheable page and answer `If-None-Match`
+	with `304 Not Modified`.
+
+	The ETag is made from the hash of the cached page and the CSRF token added to it."""
+	csrf_token = frappe.local.session.data.csrf_token if frappe.local.session else None
+	etag = hashlib.md5("{0}:{1}".format(frappe.local.response.page_hash,
+		csrf_token or "").encode("utf-8")).hexdigest()
+
+	response.set_etag(etag)
+	response.headers[b"Cache-Control"] = "{0}, max-age={1}, must-revalidate".format(
+		"public" if frappe.session.user=="Guest" else "private",
+		cint(frappe.conf.website_cache_max_age))
+
+	response.make_conditional(frappe.local.request)
+
 def render_page_by_language(path):
 	translated_languages = frappe.get_hooks("translated_languages_for_website")
 	user_lang = guess_language(translated_languages)
@@ -135,17 +141,14 @@ def render_page_by_language(path):
 
 def render_page(path):
 	"""get page html"""
-	out = None
-
 	if can_cache():
 		# return rendered page
-		page_cache = frappe.cache().hget("website_page", path)
-		if page_cache and frappe.local.lang in page_cache:
-			out = page_cache[frappe.local.lang]
-
-	if out:
-		frappe.local.response.from_cache = True
-		return out
+		page_cache = frappe.cache().hget(get_page_cache_key(path), frappe.local.lang)
+		if page_cache:
+			frappe.local.response.from_cache = True
+			frappe.local.response.page_hash = page_cache["hash"]
+			frappe.local.response.page_name = page_cache.get("page_name")
+			return page_cache["html"]
 
 	return build(path)
 
@@ -168,6 +171,10 @@ def build_page(path):
 		frappe.local.path = path
 
 	context = get_context(path)
+
+	# pages of website generators are named by their DocType
+	frappe.local.response.page_name = context.ref_doctype or path
+
 	if context.title and "{{" in context.title:
 		title_template = context.pop('title')
 		context.title = frappe.render_template(title_template, context)
@@ -186,9 +193,11 @@ def build_page(path):
 	# html = frappe.get_template(context.base_template_path).render(context)
 
 	if can_cache(context.no_cache):
-		page_cache = frappe.cache().hget("website_page", path) or {}
-		page_cache[frappe.local.lang] = html
-		frappe.cache().hset("website_page", path, page_cache)
+		# one entry per language, with the hash of the html for the ETag
+		page_hash = hashlib.md5(cstr(html).encode("utf-8")).hexdigest()
+		frappe.cache().hset(get_page_cache_key(path), frappe.local.lang,
+			{"html": html, "hash": page_hash, "page_name": frappe.local.response.page_name})
+		frappe.local.response.page_hash = page_hash
 
 	return html
 
@@ -265,12 +274,12 @@ def clear_cache(path=None):
 		'website_full_index'):
 		frappe.cache().delete_value(key)
 	delete_page_cache(path)
-	frappe.cache().delete_value("website_404")
+	clear_not_found()
 	if not path:
 		clear_sitemap()
 		frappe.clear_cache("Guest")
 		for key in ('portal_menu_items', 'home_page', 'website_route_rules',
-			'doctypes_with_web_view'):
+			'doctypes_with_web_view', 'website_route_index', 'website_404'):
 			frappe.cache().delete_value(key)
 
 	for method in frappe.get_hooks("website_clear_cache"):
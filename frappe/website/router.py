@@ -2,12 +2,22 @@
 # MIT License. See license.txt
 
 from __future__ import unicode_literals
-import frappe, os
+import frappe, os, time
 
 from frappe.website.utils import can_cache, delete_page_cache, extract_title
+from frappe.utils import cint
 from frappe.model.document import get_controller
 from six import text_type
 
+# marker field of the route index, set once all routes are loaded
+ROUTE_INDEX_BUILT = "__built__"
+
+# paths not found are remembered for 1 to 2 times this many seconds
+NOT_FOUND_TTL = 600
+
+# max paths not found remembered per period
+NOT_FOUND_MAX_ENTRIES = 10000
+
 def resolve_route(path):
 	"""Returns the page route object based on searching in pages and generators.
 	The `www` folder is also a part of generator **Web Page**.
@@ -72,10 +82,81 @@ def get_page_info_from_template(path):
 	return None
 
 def get_page_context_from_doctype(path):
-	page_info = get_page_info_from_doctypes(path)
+	page_info = get_route_from_index(path)
 	if page_info:
-		return frappe.get_doc(page_info.get("doctype"),
-			page_info.get("name")).get_page_info()
+		try:
+			doc = frappe.get_doc(page_info.get("doctype"), page_info.get("name"))
+		except frappe.DoesNotExistError:
+			doc = None
+
+		if not (doc and doc.route==path and doc.is_website_published()):
+			# stale entry (renamed, changed or deleted without updating the index)
+			frappe.cache().hdel("website_route_index", path)
+			page_info = get_page_info_from_route(path)
+			if not page_info:
+				return None
+
+			set_route_in_index(path, page_info.get("doctype"), page_info.get("name"))
+			doc = frappe.get_doc(page_info.get("doctype"), page_info.get("name"))
+
+		return doc.get_page_info()
+
+def get_route_from_index(path):
+	"""Returns `{"doctype": doctype, "name": name}` of the published document at route `path`,
+	from the route index of website generators."""
+	with frappe.cache().pipeline() as pipe:
+		pipe.hget("website_route_index", ROUTE_INDEX_BUILT)
+		pipe.hget("website_route_index", path)
+		built, page_info = pipe.execute()
+
+	if not built:
+		page_info = build_route_index().get(path)
+
+	elif not page_info:
+		# published or re-routed with `db.set_value`, without updating the index (the index
+		# is rebuilt on migrate), repeated misses are absorbed by the not found cache
+		page_info = get_page_info_from_route(path)
+		if page_info:
+			set_route_in_index(path, page_info.get("doctype"), page_info.get("name"))
+
+	return page_info
+
+def build_route_index():
+	"""Build the route index with one query per website generator DocType."""
+	routes = {}
+	for route, page_info in get_page_info_from_doctypes().items():
+		if route:
+			routes[route] = {"doctype": page_info["doctype"], "name": page_info["name"]}
+
+	with frappe.cache().pipeline() as pipe:
+		for route, page_info in routes.items():
+			pipe.hset("website_route_index", route, page_info)
+		pipe.hset("website_route_index", ROUTE_INDEX_BUILT, 1)
+		pipe.execute()
+
+	return routes
+
+def set_route_in_index(route, doctype, name):
+	frappe.cache().hset("website_route_index", route, {"doctype": doctype, "name": name})
+
+def update_route_index(doc, previous_route=None):
+	"""Update the route index on change of a website generator document."""
+	if previous_route and previous_route != doc.route:
+		remove_route_from_index(previous_route, doc)
+
+	if not doc.route:
+		return
+
+	if doc.is_website_published():
+		set_route_in_index(doc.route, doc.doctype, doc.name)
+	else:
+		remove_route_from_index(doc.route, doc)
+
+def remove_route_from_index(route, doc):
+	"""Remove `route` from the index, if it points to `doc`."""
+	page_info = frappe.cache().hget("website_route_index", route)
+	if page_info and page_info.get("doctype")==doc.doctype and page_info.get("name")==doc.name:
+		frappe.cache().hdel("website_route_index", route)
 
 def clear_sitemap():
 	delete_page_cache("*")
@@ -89,14 +170,62 @@ def get_all_page_context_from_doctypes():
 
 	return routes
 
+def is_not_found(path):
+	"""Returns True if `path` was not found recently."""
+	with frappe.cache().pipeline() as pipe:
+		for key in get_not_found_keys():
+			pipe.hget(key, path)
+		return any(pipe.execute())
+
+def set_not_found(path):
+	"""Remember that `path` was not found. Paths are kept in one hash per period that
+	expires, with a limit on the number of paths so that crawlers cannot fill the cache."""
+	cache = frappe.cache()
+	key = get_not_found_keys()[0]
+	if cache.hlen(key) < NOT_FOUND_MAX_ENTRIES:
+		cache.hset(key, path, True)
+		cache.expire(cache.make_key(key), 2 * get_not_found_ttl())
+
+def clear_not_found():
+	frappe.cache().delete_keys("website_404:")
+
+def get_not_found_keys():
+	"""Returns keys of the current and the previous period."""
+	period = int(time.time() // get_not_found_ttl())
+	return ["website_404:{0}".format(p) for p in (period, period - 1)]
+
+def get_not_found_ttl():
+	return cint(frappe.conf.get("website_404_cache_ttl")) or NOT_FOUND_TTL
+
+def get_page_info_from_route(path):
+	"""Returns `{"doctype": doctype, "name": name}` of the published document at route `path`,
+	with one query over the tables of all website generators."""
+	queries, values = [], []
+	for doctype in get_doctypes_with_web_view():
+		if not frappe.db.has_column(doctype, "route"):
+			continue
+
+		condition_field = get_condition_field(doctype)
+		queries.append("""(select %s as doctype, name from `tab{0}`
+			where route=%s{1} limit 1)""".format(doctype,
+				" and `{0}`=1".format(condition_field) if condition_field else ""))
+		values.extend([doctype, path])
+
+	if not queries:
+		return None
+
+	result = frappe.db.sql(" union all ".join(queries) + " limit 1", values, as_dict=True)
+	return {"doctype": result[0].doctype, "name": result[0].name} if result else None
+
+def get_condition_field(doctype):
+	return frappe.get_meta(doctype).is_published_field or get_controller(doctype).website.condition_field
+
 def get_page_info_from_doctypes(path=None):
 	routes = {}
 	for doctype in get_doctypes_with_web_view():
 		condition = ""
 		values = []
-		controller = get_controller(doctype)
-		meta = frappe.get_meta(doctype)
-		condition_field = meta.is_published_field or controller.website.condition_field
+		condition_field = get_condition_field(doctype)
 
 		if condition_field:
 			condition ="where {0}=1".format(condition_field)
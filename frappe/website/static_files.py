@@ -0,0 +1,162 @@
+# Copyright (c) 2015, Frappe Technologies Pvt. Ltd. and Contributors
+# MIT License. See license.txt
+"""
+Index of static files in the `www` folder of apps, held in process memory so that
+website requests do not probe the file system of every installed app.
+
+The index of an app is built on first use and rebuilt after `static_file_index_interval`
+seconds (site config, default 300, 2 in developer mode). Files found in the index are
+checked with one `stat` call, so changed files are served with a new ETag.
+
+Set `static_file_accel_redirect` in site config to the nginx internal location mapped to
+the `apps` folder (e.g. `/protected-apps/`) to let nginx send the files.
+"""
+
+from __future__ import unicode_literals
+import hashlib
+import mimetypes
+import os
+import threading
+import time
+
+from werkzeug.exceptions import NotFound
+from werkzeug.wrappers import Response
+from werkzeug.wsgi import wrap_file
+
+import frappe
+from frappe.utils import cint, encode
+
+# rendered as pages, not served as files
+PAGE_EXTENSIONS = ('html', 'md', 'js', 'xml', 'css')
+
+# never served
+IGNORED_EXTENSIONS = ('py', 'pyc')
+
+INDEX_INTERVAL = 300
+
+# app -> (built_at, {path: file info})
+_indexes = {}
+_lock = threading.Lock()
+
+def get_static_file(path):
+	"""Returns info (`file_path`, `size`, `mtime`, `mimetype`) of the static file in the
+	`www` folder of an installed app for `path`, or None."""
+	if '.' not in path:
+		return None
+
+	extn = path.rsplit('.', 1)[-1]
+	if extn in PAGE_EXTENSIONS or extn in IGNORED_EXTENSIONS:
+		return None
+
+	for app in frappe.get_installed_apps():
+		info = get_app_index(app).get(path)
+		if info and validate(app, path, info):
+			return info
+
+	return None
+
+def get_app_index(app):
+	interval = 2 if frappe.conf.developer_mode else \
+		cint(frappe.conf.get("static_file_index_interval") or INDEX_INTERVAL)
+
+	built_at, index = _indexes.get(app, (0, None))
+	if index is None or time.time() - built_at > interval:
+		with _lock:
+			index = build_app_index(app)
+			_indexes[app] = (time.time(), index)
+
+	return index
+
+def build_app_index(app):
+	"""Returns dict of path (relative to `www`): file info, for files in the app's `www` folder."""
+	index = {}
+	www = frappe.get_app_path(app, 'www')
+	# folder -> real paths of the folder and its parents, to follow symlinked
+	# folders like the file system lookups did, but not in circles
+	parents = {www: frozenset()}
+
+	for root, dirs, files in os.walk(www, followlinks=True):
+		real_path = os.path.realpath(root)
+		if real_path in parents[root]:
+			dirs[:] = []
+			continue
+
+		dirs[:] = [d for d in dirs if not d.startswith('.') and d != '__pycache__']
+		for d in dirs:
+			parents[os.path.join(root, d)] = parents[root] | {real_path}
+
+		for filename in files:
+			extn = filename.rsplit('.', 1)[-1] if '.' in filename else None
+			if not extn or extn in PAGE_EXTENSIONS or extn in IGNORED_EXTENSIONS:
+				continue
+
+			file_path = os.path.join(root, filename)
+			path = os.path.relpath(file_path, www).replace(os.sep, '/')
+			index[path] = get_file_info(app, file_path)
+
+	return index
+
+def get_file_info(app, file_path):
+	stat = os.stat(file_path)
+	return frappe._dict({
+		"app": app,
+		"file_path": file_path,
+		"size": stat.st_size,
+		"mtime": stat.st_mtime,
+		"mimetype": mimetypes.guess_type(file_path)[0] or 'application/octet-stream',
+		"etag": None
+	})
+
+def validate(app, path, info):
+	"""Update the file info if the file was changed, drop it if deleted."""
+	try:
+		stat = os.stat(info.file_path)
+	except OSError:
+		_indexes.get(app, (0, {}))[1].pop(path, None)
+		return False
+
+	if stat.st_mtime != info.mtime or stat.st_size != info.size:
+		info.update(get_file_info(app, info.file_path))
+
+	return True
+
+def get_etag(info):
+	"""Returns md5 of the file content, computed once per version of the file."""
+	if not info.etag:
+		md5 = hashlib.md5()
+		with open(info.file_path, 'rb') as f:
+			for chunk in iter(lambda: f.read(65536), b''):
+				md5.update(chunk)
+		info.etag = md5.hexdigest()
+
+	return info.etag
+
+def get_response(info):
+	"""Returns response for the static file, with ETag and Range support."""
+	accel_redirect = frappe.conf.get("static_file_accel_redirect")
+	if accel_redirect:
+		apps_path = os.path.dirname(os.path.dirname(frappe.get_app_path(info.app)))
+		response = Response()
+		response.headers[b'X-Accel-Redirect'] = encode(accel_redirect.rstrip('/') + '/'
+			+ os.path.relpath(info.file_path, apps_path).replace(os.sep, '/'))
+		response.mimetype = info.mimetype
+		return response
+
+	try:
+		f = open(info.file_path, 'rb')
+	except IOError:
+		raise NotFound
+
+	# `wrap_file` uses the server's `wsgi.file_wrapper` (sendfile) when available
+	response = Response(wrap_file(frappe.local.request.environ, f), direct_passthrough=True)
+	response.mimetype = info.mimetype
+	response.set_etag(get_etag(info))
+	response.last_modified = info.mtime
+	response.make_conditional(frappe.local.request, accept_ranges=True, complete_length=info.size)
+	if response.status_code==304:
+		f.close()
+
+	return response
+
+def clear_index():
+	_indexes.clear()
@@ -8,13 +8,19 @@ from six import iteritems
 def delete_page_cache(path):
 	cache = frappe.cache()
 	cache.delete_value('full_index')
-	groups = ("website_page", "page_context")
 	if path:
-		for name in groups:
-			cache.hdel(name, path)
+		# the page in all languages, including translated paths like `fr/about`
+		paths = [path] + ["{0}/{1}".format(lang, path)
+			for lang in frappe.get_hooks("translated_languages_for_website")]
+		cache.delete_value([get_page_cache_key(p) for p in paths])
+		cache.hdel("page_context", path)
 	else:
-		for name in groups:
-			cache.delete_key(name)
+		cache.delete_keys(get_page_cache_key(""))
+		cache.delete_key("page_context")
+
+def get_page_cache_key(path):
+	"""Returns name of the cache hash of the rendered page, with one entry per language."""
+	return "website_page:" + path
 
 def find_first_image(html):
 	m = re.finditer("""<img[^>]*src\s?=\s?['"]([^'"]*)['"]""", html)
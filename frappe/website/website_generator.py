@@ -6,6 +6,7 @@ import frappe
 from frappe.model.document import Document
 from frappe.website.utils import cleanup_page_name
 from frappe.website.render import clear_cache
+from frappe.website.router import update_route_index, remove_route_from_index
 from frappe.modules import get_module_name
 
 class WebsiteGenerator(Document):
@@ -67,6 +68,15 @@ class WebsiteGenerator(Document):
 	def clear_cache(self):
 		clear_cache(self.route)
 
+		# page at the previous route, if it was changed
+		previous = getattr(self, "_doc_before_save", None)
+		previous_route = previous.route if previous else None
+		if previous_route and previous_route != self.route:
+			clear_cache(previous_route)
+
+		if not self.flags.in_delete:
+			update_route_index(self, previous_route)
+
 	def scrub(self, text):
 		return cleanup_page_name(text).replace('_', '-')
 
@@ -75,7 +85,17 @@ class WebsiteGenerator(Document):
 		pass
 
 	def on_trash(self):
+		self.flags.in_delete = True
 		self.clear_cache()
+		if self.route:
+			remove_route_from_index(self.route, self)
+
+	def after_rename(self, old, new, merge=False):
+		update_route_index(self)
+
+	def on_change(self):
+		# also run by `db_set`, which does not run `on_update`
+		update_route_index(self)
 
 	def is_website_published(self):
 		"""Return true if published in website"""
@@ -101,7 +101,7 @@ def get_html(doc, name=None, print_format=None, meta=None,
 		doc._align_labels_right = print_format.align_labels_right
 
 		def get_template_from_string():
-			return jenv.from_string(get_print_format(doc.doctype,
+			return frappe.utils.jinja.get_template_from_string(get_print_format(doc.doctype,
 				print_format))
 
 		if print_format.custom_format: